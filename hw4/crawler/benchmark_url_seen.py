@@ -0,0 +1,80 @@
+import random
+import argparse
+import tracemalloc
+from url_seen import UrlSeenSet, canonicalize_url
+
+# 已见 URL 集合的内存对比
+#
+# 生成与南开网站相似的 URL（若干子域名、栏目、年份、文章号），其中一部分带锚点、跟踪参数、
+# 末尾的 / 或大写的主机名，分别记录：
+#   规范化    原始 URL 与规范化后不同 URL 的个数
+#   原实现    Python 集合保存 URL 字符串（含字符串本身）占用的内存
+#   现实现    UrlSeenSet 只保存 64 位指纹占用的内存
+# 内存用 tracemalloc 统计构建完成后仍存活的分配。
+
+HOSTS = ["www", "news", "jwc", "lib", "cc", "math", "chem", "ai", "law", "history"]
+SECTIONS = ["info", "article", "tzgg", "xwdt", "xshd", "kyjz", "2024", "static"]
+
+
+def make_urls(num_urls, variant_ratio, seed=0):
+    rng = random.Random(seed)
+    for i in range(num_urls):
+        host = f"{rng.choice(HOSTS)}.nankai.edu.cn"
+        url = f"https://{host}/{rng.choice(SECTIONS)}/{i // 1000}/{i}.htm"
+        yield url
+        if rng.random() < variant_ratio:
+            # 同一网页的另一种写法
+            yield rng.choice(
+                [
+                    url + "#content",
+                    url + "?utm_source=wechat",
+                    url.replace(host, host.upper()),
+                    url.replace(host, f"{host}:443"),
+                ]
+            )
+
+
+def measure(build):
+    tracemalloc.start()
+    result = build()
+    memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, memory
+
+
+def build_string_set(num_urls, variant_ratio):
+    return set(map(canonicalize_url, make_urls(num_urls, variant_ratio)))
+
+
+def build_seen_set(num_urls, variant_ratio):
+    seen = UrlSeenSet()
+    seen.update(map(canonicalize_url, make_urls(num_urls, variant_ratio)))
+    return seen
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="已见 URL 集合的内存对比")
+    parser.add_argument("--urls", type=int, default=1_000_000, help="生成的网页数")
+    parser.add_argument(
+        "--variants", type=float, default=0.2, help="带其他写法的网页比例"
+    )
+    args = parser.parse_args()
+
+    raw = sum(1 for _ in make_urls(args.urls, args.variants))
+    distinct_raw = len(set(make_urls(args.urls, args.variants)))
+    strings, string_memory = measure(lambda: build_string_set(args.urls, args.variants))
+    seen, seen_memory = measure(lambda: build_seen_set(args.urls, args.variants))
+    assert len(seen) == len(strings)
+    print(
+        f"生成 {raw} 个 URL，不同的原始 URL {distinct_raw} 个，"
+        f"规范化后 {len(strings)} 个"
+    )
+    print(
+        f"原实现（字符串集合）：{string_memory / 2**20:8.1f} MB，"
+        f"每个 URL {string_memory / len(strings):6.1f} 字节"
+    )
+    print(
+        f"现实现（指纹数组）：  {seen_memory / 2**20:8.1f} MB，"
+        f"每个 URL {seen_memory / len(seen):6.1f} 字节，"
+        f"memory_bytes() = {seen.memory_bytes() / 2**20:.1f} MB"
+    )
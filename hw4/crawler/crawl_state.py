@@ -0,0 +1,87 @@
+import os
+import sqlite3
+
+# 爬取进度的检查点
+#
+# 爬取状态保存在一个 SQLite 文件中（默认 crawl_state.sqlite）：
+#   meta      输出 CSV 的字节数（csv_offset）和已写出的记录数
+#   visited   已处理完的 URL：结果已写入 CSV，或请求失败、不需要保存
+#   frontier  待爬取的 (URL, 深度)，每个检查点整体替换
+# 检查点总在 CSV 追加写出之后提交，各表在同一个事务中更新。正在请求或已解析但还没写入 CSV 的 URL
+# 不算已访问，作为待爬取的 URL 保存。--resume 时先把 CSV 截断到检查点记录的字节数再继续，
+# 检查点之后写出的行被丢弃并重新爬取，CSV 中不会出现重复的行。
+
+SQLITE_BATCH = 10000  # 每次 executemany 的行数
+
+
+def batched(items, size=SQLITE_BATCH):
+    items = list(items)
+    for i in range(0, len(items), size):
+        yield items[i : i + size]
+
+
+class CrawlState:
+    def __init__(self, path):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        with self.conn:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER)"
+            )
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS visited (url TEXT PRIMARY KEY) WITHOUT ROWID"
+            )
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS frontier "
+                "(seq INTEGER PRIMARY KEY, url TEXT, depth INTEGER)"
+            )
+
+    def close(self):
+        self.conn.close()
+
+    def reset(self):
+        """重新开始爬取时清空旧的状态"""
+        with self.conn:
+            for table in ("meta", "visited", "frontier"):
+                self.conn.execute(f"DELETE FROM {table}")
+
+    def has_checkpoint(self):
+        row = self.conn.execute(
+            "SELECT value FROM meta WHERE key = 'csv_offset'"
+        ).fetchone()
+        return row is not None
+
+    def load(self):
+        """返回 (CSV 字节数, 已写出的记录数, 已访问 URL 的迭代器, [(URL, 深度), ...])"""
+        meta = dict(self.conn.execute("SELECT key, value FROM meta"))
+        visited = (url for (url,) in self.conn.execute("SELECT url FROM visited"))
+        frontier = list(
+            self.conn.execute("SELECT url, depth FROM frontier ORDER BY seq")
+        )
+        return meta["csv_offset"], meta["written_records"], visited, frontier
+
+    def save(self, csv_offset, written_records, new_visited, frontier):
+        """new_visited 为上一个检查点之后处理完的 URL，frontier 为此刻全部待爬取的 URL"""
+        with self.conn:
+            for batch in batched(new_visited):
+                self.conn.executemany(
+                    "INSERT OR IGNORE INTO visited VALUES (?)",
+                    ((url,) for url in batch),
+                )
+            self.conn.execute("DELETE FROM frontier")
+            for batch in batched(frontier):
+                self.conn.executemany(
+                    "INSERT INTO frontier (url, depth) VALUES (?, ?)", batch
+                )
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO meta VALUES (?, ?)",
+                [("csv_offset", csv_offset), ("written_records", written_records)],
+            )
+
+
+def truncate_output(output_file, csv_offset):
+    """丢弃检查点之后写出的行"""
+    if os.path.getsize(output_file) > csv_offset:
+        with open(output_file, "r+b") as f:
+            f.truncate(csv_offset)
@@ -1,15 +1,45 @@
 import aiohttp
 import asyncio
+import argparse
 from bs4 import BeautifulSoup
 from urllib.parse import urljoin, urlparse
 import csv
 import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+from frontier import Frontier
+from crawl_state import CrawlState, truncate_output
+from url_seen import UrlSeenSet, canonicalize_url
+from downloads import (
+    MANIFEST_FILE,
+    DownloadManifest,
+    remove_partial_downloads,
+    stream_to_store,
+)
+
+try:
+    import lxml.html  # 可选：直接用 lxml 解析 HTML，不经过 BeautifulSoup 建树
+except ImportError:
+    lxml = None
 
 USER_AGENT = "NKU Crawler"
 BASE_URL = "https://www.nankai.edu.cn"
+OUTPUT_FILE = "title_url_anchor_body.csv"
+CRAWL_STATE_FILE = "crawl_state.sqlite"
 FILE_DOWNLOAD_DIR = "downloads"
 TIMEOUT = aiohttp.ClientTimeout(total=60, connect=60, sock_connect=60, sock_read=60)
-BATCH_SIZE = 2000  # 每批并发的请求数
+MAX_CONCURRENT_REQUESTS = 128  # 同时进行的请求数
+LIMIT_PER_HOST = 16  # 每个主机的最大连接数
+POLITENESS_DELAY = 0.05  # 同一主机相邻两个请求开始时间的最小间隔（秒）
+NUM_WORKERS = 192  # 常驻 worker 数，多于并发请求数，一个请求结束时已有取好 URL 的 worker 接上
+CSV_FLUSH_SIZE = 6000  # 累计多少条记录追加写入一次 CSV
+CHECKPOINT_INTERVAL = 60  # 距上一个检查点超过多少秒时提前写出 CSV 并保存检查点
+PARSE_WORKERS = os.cpu_count() or 1  # 解析 HTML 的进程数
+HTML_PARSER = "lxml" if lxml is not None else "html.parser"  # 解析 HTML 的方式
+# 正文不包含这些标签中的文字，与 get_text 一致
+NON_TEXT_TAGS = {"script", "style", "template"}
+BODY_TAG = re.compile(r"<body[\s/>]", re.IGNORECASE)
 SUPPORTED_FILE_TYPES = [
     "application/pdf",
     "application/msword",
@@ -17,6 +47,13 @@ SUPPORTED_FILE_TYPES = [
     "application/vnd.ms-excel",
     "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
 ]
+FILE_EXTENSIONS = {
+    "application/pdf": ".pdf",
+    "application/msword": ".doc",
+    "application/vnd.openxmlformats-officedocument.wordprocessingml.document": ".docx",
+    "application/vnd.ms-excel": ".xls",
+    "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet": ".xlsx",
+}
 
 
 def ensure_download_dir():
@@ -25,35 +62,30 @@ def ensure_download_dir():
     """
     if not os.path.exists(FILE_DOWNLOAD_DIR):
         os.makedirs(FILE_DOWNLOAD_DIR)
+    remove_partial_downloads(FILE_DOWNLOAD_DIR)
 
 
-async def fetch_and_save_file(session, url, content_type):
+async def fetch_and_save_file(response, url, content_type, manifest=None):
     """
-    下载文件并保存到本地，返回相对路径
+    从已打开的响应流式下载文件（见 downloads.py），返回相对路径，超过大小上限或下载失败时返回 None
     """
     try:
-        file_extension = {
-            "application/pdf": ".pdf",
-            "application/msword": ".doc",
-            "application/vnd.openxmlformats-officedocument.wordprocessingml.document": ".docx",
-            "application/vnd.ms-excel": ".xls",
-            "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet": ".xlsx",
-        }.get(content_type, ".bin")
-        filename = os.path.join(
-            FILE_DOWNLOAD_DIR,
-            os.path.basename(urlparse(url).path) or f"file{file_extension}",
+        file_extension = next(
+            (ext for ft, ext in FILE_EXTENSIONS.items() if ft in content_type), ".bin"
         )
-        async with session.get(url, timeout=TIMEOUT) as response:
-            response.raise_for_status()
-            with open(filename, "wb") as f:
-                f.write(await response.read())
+        stored = await stream_to_store(response, FILE_DOWNLOAD_DIR, file_extension)
+        if stored is None:
+            return None
+        sha1, filename, size = stored
+        if manifest is not None:
+            manifest.record(url, sha1, filename, size, content_type)
         return filename
     except Exception as e:
         # print(f"文件下载失败: {e}")
         return None
 
 
-async def fetch_page(session, url):
+async def fetch_page(session, url, manifest=None):
     """
     异步获取网页内容，同时处理编码问题和非 HTML 内容
     """
@@ -70,7 +102,11 @@ async def fetch_page(session, url):
                     "content": html.decode(encoding, errors="ignore"),
                 }
             elif any(ft in content_type for ft in SUPPORTED_FILE_TYPES):
-                file_path = await fetch_and_save_file(session, url, content_type)
+                file_path = await fetch_and_save_file(
+                    response, url, content_type, manifest
+                )
+                if file_path is None:
+                    return None
                 return {"type": "file", "content": file_path}
             else:
                 return None
@@ -80,12 +116,16 @@ async def fetch_page(session, url):
         return None
 
 
-def parse_page(html_or_file, base_url):
+def parse_page(html_or_file, base_url, parser=HTML_PARSER):
     """
     根据内容类型解析 HTML 或记录文件路径
     """
     if html_or_file["type"] == "html":
         html = html_or_file["content"]
+        if parser == "lxml":
+            data = parse_html_lxml(html, base_url)
+            if data is not None:
+                return data
         soup = BeautifulSoup(html, "html.parser")
         title = (
             soup.title.string.strip() if soup.title and soup.title.string else "无标题"
@@ -97,7 +137,7 @@ def parse_page(html_or_file, base_url):
         for a in soup.find_all("a", href=True):
             href = a["href"].strip()
             if href and is_valid_url(href):
-                full_url = urljoin(base_url, href)
+                full_url = canonicalize_url(urljoin(base_url, href))
                 links.append(full_url)
                 anchor_text = a.get_text(strip=True)
                 anchor_texts.append(" ".join(anchor_text.split()))
@@ -119,6 +159,71 @@ def parse_page(html_or_file, base_url):
     return None
 
 
+def text_fragments(element):
+    """按文档顺序返回 element 内的各段文字（不含 element 自身的 tail）
+
+    与 get_text 一致：注释、处理指令以及 NON_TEXT_TAGS 中标签的文字不计入，其后的文字照常保留，
+    各段分别返回，不会与前后的文字连在一起。
+    """
+    if element.text:
+        yield element.text
+    stack = [(iter(element), None)]  # (子节点迭代器, 子节点都处理完后的 tail)
+    while stack:
+        children, tail = stack[-1]
+        node = next(children, None)
+        if node is None:
+            stack.pop()
+            if tail:
+                yield tail
+        elif isinstance(node.tag, str) and node.tag not in NON_TEXT_TAGS:
+            if node.text:
+                yield node.text
+            stack.append((iter(node), node.tail))
+        elif node.tail:  # 注释、处理指令和不计入正文的标签
+            yield node.tail
+
+
+def parse_html_lxml(html, base_url):
+    """与 parse_page 中 BeautifulSoup 的结果相同，lxml 无法解析或结果可能不同时返回 None"""
+    try:
+        doc = lxml.html.document_fromstring(html)
+    except (ValueError, lxml.etree.ParserError):  # 带编码声明的文档、空文档
+        return None
+    title_element = doc.find(".//title")
+    title = "无标题"
+    if title_element is not None:
+        title_text = title_element.text_content()
+        # html.parser 会解析标题中的标签，lxml 把标题当作纯文本，这类文档交给 html.parser
+        if len(title_element) or "<" in title_text:
+            return None
+        title = title_text.strip() if title_text else "无标题"
+    # lxml 会为没有 body 标签的文档补上 body，html.parser 不会，这里以原文为准
+    has_body = BODY_TAG.search(html) is not None
+    body = " ".join(" ".join(text_fragments(doc)).split()) if has_body else ""
+    links = []
+    anchor_texts = []
+    for a in doc.iter("a"):
+        href = (a.get("href") or "").strip()
+        if href and is_valid_url(href):
+            links.append(canonicalize_url(urljoin(base_url, href)))
+            anchor_text = "".join(s.strip() for s in text_fragments(a))
+            anchor_texts.append(" ".join(anchor_text.split()))
+    return {
+        "type": "html",
+        "title": title,
+        "body": body or "无正文",
+        "links": links,
+        "anchor_texts": anchor_texts,
+    }
+
+
+def parse_page_timed(html_or_file, base_url, parser):
+    """在解析进程中执行，返回 (解析结果, 解析用时)"""
+    start = time.perf_counter()
+    data = parse_page(html_or_file, base_url, parser)
+    return data, time.perf_counter() - start
+
+
 def is_valid_url(url):
     try:
         parsed = urlparse(url)
@@ -144,79 +249,306 @@ def save_to_csv_with_links(data, filename, write_header=False):
         print(f"保存到 CSV 文件失败: {e}")
 
 
-async def crawl(start_url, max_depth=50, max_records=150000, report_interval=1000):
-    visited = set()
-    to_visit = [(start_url, 0)]
-    crawled_data = []
-    output_file = "title_url_anchor_body.csv"
-    written_records = 0
-
-    async with aiohttp.ClientSession(headers={"User-Agent": USER_AGENT}) as session:
-        ensure_download_dir()
-        save_to_csv_with_links([], output_file, write_header=True)
-
-        while to_visit:
-            if written_records >= max_records:
-                print(f"已达到最大记录数限制：{max_records}条，停止爬取")
-                break
-
-            batch = []
-            while to_visit and len(batch) < BATCH_SIZE:
-                url, depth = to_visit.pop(0)
-                if url not in visited and depth <= max_depth:
-                    visited.add(url)
-                    batch.append((url, depth))
-
-            tasks = [fetch_page(session, url) for url, _ in batch]
-            results = await asyncio.gather(*tasks)
-
-            for i, html_or_file in enumerate(results):
-                if html_or_file:
-                    url, depth = batch[i]
-                    data = parse_page(html_or_file, BASE_URL)
-                    title = data["title"]
-                    body = (
-                        data["body"]
-                        if data["type"] == "html"
-                        else f"文件路径: {data['body']}"
-                    )
-                    anchor_texts = "; ".join(data["anchor_texts"])
-                    links = "; ".join(data["links"])
-
-                    crawled_data.append(
-                        {
-                            "title": title,
-                            "url": url,
-                            "anchor_texts": anchor_texts,
-                            "body": body,
-                            "links": links,
-                        }
-                    )
+class Crawler:
+    """一次爬取的状态，由 NUM_WORKERS 个常驻的 worker 协程共同推进
 
-                    if len(crawled_data) % report_interval == 0:
-                        print(f"已爬取记录数：{written_records + len(crawled_data)}")
+    每个 worker 不断从边界取出 URL、请求、解析并把新链接放回边界，请求数由信号量和
+    TCPConnector 的连接数上限控制。慢请求只占用一个 worker，其余 worker 照常工作，
+    不会像按批 gather 那样整批等待最慢的请求。
+    HTML 的解析、链接提取和正文整理在 PARSE_WORKERS 个进程中进行（run_in_executor），
+    事件循环只负责请求和调度，请求与解析同时进行，解析能用上多个 CPU 核。
+    每次追加写出 CSV 后保存检查点（见 crawl_state.py），中断后可以从检查点继续。
+    """
 
-                    if len(crawled_data) >= 6000:
-                        save_to_csv_with_links(crawled_data, output_file)
-                        written_records += len(crawled_data)
-                        crawled_data.clear()
+    def __init__(
+        self,
+        start_url,
+        max_depth,
+        max_records,
+        report_interval,
+        output_file,
+        state,
+        parser=HTML_PARSER,
+    ):
+        if parser == "lxml" and lxml is None:
+            raise ValueError("未安装 lxml，不能使用 lxml 解析 HTML")
+        self.start_url = start_url
+        self.parser = parser
+        self.max_depth = max_depth
+        self.max_records = max_records
+        self.report_interval = report_interval
+        self.output_file = output_file
+        self.state = state
+        self.frontier = Frontier(POLITENESS_DELAY)
+        self.seen = UrlSeenSet()  # 已入队过的规范化 URL，边界中同一 URL 只出现一次
+        self.pending = {}  # 已出队、结果尚未写入 CSV 的 URL -> 深度，检查点中仍算待爬取
+        self.unsaved_visited = []  # 上一个检查点之后处理完的 URL
+        self.crawled_data = []
+        self.written_records = 0
+        self.start_records = 0  # 本次运行开始时已写出的记录数
+        self.last_checkpoint = time.monotonic()
+        self.active = 0  # 已出队但尚未处理完的 URL 数
+        self.stopped = False
+        self.wakeup = asyncio.Event()  # 边界中有新的 URL 或有 URL 处理完成
+        self.semaphore = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+        self.start_time = time.perf_counter()
+        self.executor = None
+        self.manifest = None  # 下载文件的清单，在 run 中打开
+        # 各 worker 累计的次数和用时（秒），worker 并发执行，用时之和可以超过实际经过的时间
+        self.fetch_count = 0
+        self.network_time = 0.0  # 等待请求完成
+        self.parse_count = 0
+        self.parse_time = 0.0  # 解析进程中实际解析
+        self.parse_wait_time = 0.0  # 从提交解析到取回结果，含排队和进程间传输
 
-                    if written_records >= max_records:
-                        print(f"已达到最大记录数限制：{max_records}条，停止爬取")
-                        break
+    def record_count(self):
+        return self.written_records + len(self.crawled_data)
 
-                    for link in data["links"]:
-                        if link not in visited:
-                            to_visit.append((link, depth + 1))
+    async def next_url(self):
+        """等待下一个可以请求的 URL，边界为空且没有正在处理的 URL 时返回 None"""
+        while not self.stopped:
+            item = self.frontier.pop()
+            if item is not None:
+                return item
+            if len(self.frontier) == 0 and self.active == 0:
+                return None
+            # 所有主机都在冷却时等到最早结束冷却的时刻，否则等其他 worker 放回新的 URL
+            self.wakeup.clear()
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), self.frontier.wait_time())
+            except asyncio.TimeoutError:
+                pass
+        return None
 
-        if crawled_data and written_records < max_records:
-            remaining_to_write = max_records - written_records
-            save_to_csv_with_links(crawled_data[:remaining_to_write], output_file)
-            written_records += len(crawled_data[:remaining_to_write])
-            crawled_data.clear()
+    async def worker(self, session):
+        while True:
+            item = await self.next_url()
+            if item is None:
+                return
+            url, depth = item
+            self.pending[url] = depth
+            self.active += 1
+            try:
+                async with self.semaphore:
+                    start = time.perf_counter()
+                    html_or_file = await fetch_page(session, url, self.manifest)
+                    self.network_time += time.perf_counter() - start
+                    self.fetch_count += 1
+                data = await self.parse(html_or_file) if html_or_file else None
+                if self.stopped:
+                    continue
+                if data:
+                    self.handle_result(url, depth, data)
+                else:
+                    del self.pending[url]
+                    self.unsaved_visited.append(url)
+            finally:
+                self.active -= 1
+                self.wakeup.set()
 
-    print(f"爬取完成，总记录数：{written_records}")
+    async def parse(self, html_or_file):
+        """HTML 交给解析进程，文件只需记录路径，直接在事件循环中处理"""
+        if html_or_file["type"] != "html":
+            return parse_page(html_or_file, BASE_URL)
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        try:
+            data, parse_time = await loop.run_in_executor(
+                self.executor, parse_page_timed, html_or_file, BASE_URL, self.parser
+            )
+        except Exception as e:
+            print(f"解析网页失败: {e}")
+            return None
+        self.parse_count += 1
+        self.parse_time += parse_time
+        self.parse_wait_time += time.perf_counter() - start
+        return data
+
+    def handle_result(self, url, depth, data):
+        title = data["title"]
+        body = data["body"] if data["type"] == "html" else f"文件路径: {data['body']}"
+        self.crawled_data.append(
+            {
+                "title": title,
+                "url": url,
+                "anchor_texts": "; ".join(data["anchor_texts"]),
+                "body": body,
+                "links": "; ".join(data["links"]),
+            }
+        )
+        if self.record_count() % self.report_interval == 0:
+            self.report()
+        if (
+            len(self.crawled_data) >= CSV_FLUSH_SIZE
+            or time.monotonic() - self.last_checkpoint >= CHECKPOINT_INTERVAL
+        ):
+            self.flush()
+        if self.record_count() >= self.max_records:
+            print(f"已达到最大记录数限制：{self.max_records}条，停止爬取")
+            self.stopped = True
+            return
+
+        if depth + 1 <= self.max_depth:
+            for link in self.seen.filter_new(data["links"]):
+                self.frontier.push(link, depth + 1)
+
+    def flush(self):
+        """追加写出缓存的记录（总数不超过 max_records），然后保存检查点"""
+        remaining = self.max_records - self.written_records
+        if self.crawled_data and remaining > 0:
+            save_to_csv_with_links(self.crawled_data[:remaining], self.output_file)
+            self.written_records += len(self.crawled_data[:remaining])
+        for record in self.crawled_data:
+            del self.pending[record["url"]]
+            self.unsaved_visited.append(record["url"])
+        self.crawled_data.clear()
+        self.checkpoint()
+
+    def checkpoint(self):
+        # 未写入 CSV 的 URL 与边界一起保存，恢复后重新爬取
+        frontier = list(self.frontier.items()) + list(self.pending.items())
+        frontier.sort(key=lambda item: item[1])
+        self.state.save(
+            os.path.getsize(self.output_file),
+            self.written_records,
+            self.unsaved_visited,
+            frontier,
+        )
+        self.unsaved_visited.clear()
+        self.last_checkpoint = time.monotonic()
+
+    def start(self, resume):
+        """从检查点恢复，或清空旧的状态并写入 CSV 表头"""
+        if resume and not self.state.has_checkpoint():
+            print(f"{self.state.path} 中没有检查点，重新开始爬取")
+            resume = False
+        elif resume and not os.path.exists(self.output_file):
+            print(f"找不到 {self.output_file}，重新开始爬取")
+            resume = False
+        if not resume:
+            self.state.reset()
+            save_to_csv_with_links([], self.output_file, write_header=True)
+            start_url = canonicalize_url(self.start_url)
+            self.seen.add(start_url)
+            self.frontier.push(start_url, 0)
+            self.checkpoint()
+            return
+        csv_offset, self.written_records, visited, frontier = self.state.load()
+        truncate_output(self.output_file, csv_offset)
+        self.seen.update(visited)
+        for url, depth in frontier:
+            if self.seen.add(url):
+                self.frontier.push(url, depth)
+        self.start_records = self.written_records
+        print(
+            f"从检查点继续：已写出 {self.written_records} 条记录，"
+            f"已见 {len(self.seen)} 个 URL，待爬取 {len(self.frontier)} 个 URL"
+        )
+
+    def report(self):
+        elapsed = time.perf_counter() - self.start_time
+        print(
+            f"已爬取记录数：{self.record_count()}，"
+            f"待爬取 {len(self.frontier)} 个 URL（{self.frontier.host_count()} 个主机），"
+            f"进行中 {self.active}，已见 {len(self.seen)} 个 URL"
+            f"（{self.seen.memory_bytes() / 2**20:.1f} MB），"
+            f"{(self.record_count() - self.start_records) / elapsed:.1f} 页/秒"
+        )
+        fetches, parses = max(self.fetch_count, 1), max(self.parse_count, 1)
+        print(
+            f"    网络：{self.fetch_count} 个请求，累计等待 {self.network_time:.1f}s，"
+            f"平均 {self.network_time / fetches * 1000:.1f}ms；"
+            f"解析：{self.parse_count} 个网页，累计 {self.parse_time:.1f}s，"
+            f"平均 {self.parse_time / parses * 1000:.1f}ms"
+            f"（{PARSE_WORKERS} 个进程，{self.parser}），"
+            f"提交到取回平均 {self.parse_wait_time / parses * 1000:.1f}ms"
+        )
+
+    async def run(self, resume=False):
+        connector = aiohttp.TCPConnector(
+            limit=MAX_CONCURRENT_REQUESTS, limit_per_host=LIMIT_PER_HOST
+        )
+        async with aiohttp.ClientSession(
+            headers={"User-Agent": USER_AGENT}, connector=connector
+        ) as session:
+            with ProcessPoolExecutor(max_workers=PARSE_WORKERS) as self.executor:
+                ensure_download_dir()
+                self.manifest = DownloadManifest(
+                    os.path.join(FILE_DOWNLOAD_DIR, MANIFEST_FILE)
+                )
+                try:
+                    self.start(resume)
+                    await asyncio.gather(
+                        *(self.worker(session) for _ in range(NUM_WORKERS))
+                    )
+                    self.flush()
+                    urls, files, stored_bytes = self.manifest.stats()
+                finally:
+                    self.manifest.close()
+        print(f"爬取完成，总记录数：{self.written_records}")
+        print(
+            f"已下载文件：{urls} 个 URL，{files} 个不同的文件，"
+            f"共 {stored_bytes / 2**20:.1f} MB"
+        )
+        self.report()
+
+
+async def crawl(
+    start_url,
+    max_depth=50,
+    max_records=150000,
+    report_interval=1000,
+    resume=False,
+    output_file=OUTPUT_FILE,
+    state_file=CRAWL_STATE_FILE,
+    parser=HTML_PARSER,
+):
+    state = CrawlState(state_file)
+    try:
+        crawler = Crawler(
+            start_url,
+            max_depth,
+            max_records,
+            report_interval,
+            output_file,
+            state,
+            parser,
+        )
+        await crawler.run(resume)
+    finally:
+        state.close()
 
 
 if __name__ == "__main__":
-    asyncio.run(crawl(BASE_URL))
+    parser = argparse.ArgumentParser(description="南开网站爬虫")
+    parser.add_argument(
+        "--resume", action="store_true", help="从上次保存的检查点继续爬取"
+    )
+    parser.add_argument("--state", default=CRAWL_STATE_FILE, help="检查点文件")
+    parser.add_argument("--output", default=OUTPUT_FILE, help="输出的 CSV 文件")
+    parser.add_argument(
+        "--max-records", type=int, default=150000, help="最多爬取的记录数"
+    )
+    parser.add_argument(
+        "--parser",
+        default=HTML_PARSER,
+        choices=["lxml", "html.parser"],
+        help=(
+            "解析 HTML 的方式，安装了 lxml 时默认为 lxml，否则为 html.parser；"
+            "lxml 直接用 lxml 建树，无法解析或结果可能与 html.parser 不同的网页"
+            "改用 BeautifulSoup 的 html.parser"
+        ),
+    )
+    args = parser.parse_args()
+    if args.parser == "lxml" and lxml is None:
+        parser.error("--parser lxml 需要安装 lxml")
+    asyncio.run(
+        crawl(
+            BASE_URL,
+            max_records=args.max_records,
+            resume=args.resume,
+            output_file=args.output,
+            state_file=args.state,
+            parser=args.parser,
+        )
+    )
@@ -0,0 +1,96 @@
+import os
+import glob
+import hashlib
+import sqlite3
+import tempfile
+
+# 下载文件的内容寻址存储
+#
+# 文件边下载边写入下载目录中的临时文件（.part），同时计算 sha1，不在内存中缓存整个文件：
+#   大小上限  响应头中的 Content-Length 或已下载的字节数超过 MAX_FILE_SIZE 时放弃并删除临时文件
+#   内容寻址  下载完成后改名为 <sha1 前两位>/<sha1><扩展名>，内容相同的文件只保存一份，
+#             不同 URL 的同名文件（如 .../download.pdf）也不会互相覆盖
+#   清单      manifest.sqlite 记录 URL -> (sha1, 路径, 大小, 类型)
+# sha1 与 indexer/file_text.py 中正文存储的键相同，由文件名即可得到，同一内容的文件只提取一次正文。
+
+DOWNLOAD_CHUNK_SIZE = 1 << 16  # 每次读取并写入的字节数
+MAX_FILE_SIZE = 50 << 20  # 单个文件的大小上限（字节）
+MANIFEST_FILE = "manifest.sqlite"
+PARTIAL_SUFFIX = ".part"
+
+
+def content_path(download_dir, sha1, extension):
+    return os.path.join(download_dir, sha1[:2], sha1 + extension)
+
+
+def remove_partial_downloads(download_dir):
+    """删除上次中断时留下的临时文件"""
+    for path in glob.glob(os.path.join(download_dir, "*" + PARTIAL_SUFFIX)):
+        os.remove(path)
+
+
+async def stream_to_store(response, download_dir, extension, max_size=MAX_FILE_SIZE):
+    """把响应内容流式保存到内容寻址的路径，返回 (sha1, 路径, 大小)，超过大小上限时返回 None"""
+    if (response.content_length or 0) > max_size:
+        return None
+    sha1 = hashlib.sha1()
+    size = 0
+    fd, temp_path = tempfile.mkstemp(suffix=PARTIAL_SUFFIX, dir=download_dir)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            async for chunk in response.content.iter_chunked(DOWNLOAD_CHUNK_SIZE):
+                size += len(chunk)
+                if size > max_size:
+                    return None
+                sha1.update(chunk)
+                f.write(chunk)
+        digest = sha1.hexdigest()
+        path = content_path(download_dir, digest, extension)
+        if not os.path.exists(path):  # 已有相同内容的文件时直接丢弃临时文件
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(temp_path, path)
+        return digest, path, size
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+class DownloadManifest:
+    """URL -> 下载文件的清单"""
+
+    def __init__(self, path):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        with self.conn:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS files (url TEXT PRIMARY KEY, sha1 TEXT, "
+                "path TEXT, size INTEGER, content_type TEXT)"
+            )
+
+    def close(self):
+        self.conn.close()
+
+    def record(self, url, sha1, path, size, content_type):
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?)",
+                (url, sha1, path, size, content_type),
+            )
+
+    def lookup(self, url):
+        """返回 (sha1, 路径, 大小, 类型)，没有下载过时返回 None"""
+        return self.conn.execute(
+            "SELECT sha1, path, size, content_type FROM files WHERE url = ?", (url,)
+        ).fetchone()
+
+    def stats(self):
+        """返回 (URL 数, 不同内容的文件数, 实际保存的字节数)"""
+        urls, files = self.conn.execute(
+            "SELECT COUNT(*), COUNT(DISTINCT sha1) FROM files"
+        ).fetchone()
+        (stored_bytes,) = self.conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM "
+            "(SELECT size FROM files GROUP BY sha1)"
+        ).fetchone()
+        return urls, files, stored_bytes
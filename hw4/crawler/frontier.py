@@ -0,0 +1,91 @@
+import time
+import heapq
+import itertools
+from collections import deque
+from urllib.parse import urlparse
+
+# 爬取边界（待爬取的 URL）
+#
+# 每个主机一个双端队列，主机之间由优先级调度器决定下一个请求：
+#   优先级    主机队首 URL 的深度，越浅越先爬，深度相同时先入队的主机先爬，整体接近按层的广度优先
+#   礼貌延迟  同一主机相邻两个请求的开始时间至少相隔 politeness_delay 秒，
+#             冷却中的主机暂不参与调度，其他主机的 URL 照常出队
+# 入队、出队都只涉及一个主机的队列和两个以主机为元素的堆，与待爬取的 URL 总数无关。
+
+
+def url_host(url):
+    return urlparse(url).netloc.lower()
+
+
+class Frontier:
+    def __init__(self, politeness_delay=0.0):
+        self.politeness_delay = politeness_delay
+        self.queues = {}  # 主机 -> deque[(URL, 深度)]
+        self.ready = []  # 可以立即请求的主机：(队首深度, 序号, 主机)
+        self.cooling = []  # 冷却中的主机：(可再次请求的时间, 序号, 主机)
+        self.scheduled = set()  # 已在 ready 或 cooling 中的主机
+        self.next_allowed = {}  # 主机 -> 可再次请求的时间（队列已空的主机也要遵守延迟）
+        self.counter = itertools.count()
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def push(self, url, depth):
+        host = url_host(url)
+        queue = self.queues.get(host)
+        if queue is None:
+            queue = self.queues[host] = deque()
+        queue.append((url, depth))
+        self.size += 1
+        if host not in self.scheduled:
+            self.scheduled.add(host)
+            allowed = self.next_allowed.pop(host, 0.0)
+            if allowed > time.monotonic():
+                heapq.heappush(self.cooling, (allowed, next(self.counter), host))
+            else:
+                heapq.heappush(self.ready, (depth, next(self.counter), host))
+
+    def release_cooled(self, now):
+        """冷却结束的主机回到 ready 堆"""
+        while self.cooling and self.cooling[0][0] <= now:
+            _, _, host = heapq.heappop(self.cooling)
+            depth = self.queues[host][0][1]
+            heapq.heappush(self.ready, (depth, next(self.counter), host))
+
+    def pop(self):
+        """返回下一个 (URL, 深度)，所有主机都在冷却或边界为空时返回 None"""
+        now = time.monotonic()
+        self.release_cooled(now)
+        if not self.ready:
+            return None
+        _, _, host = heapq.heappop(self.ready)
+        queue = self.queues[host]
+        url, depth = queue.popleft()
+        self.size -= 1
+        if not queue:
+            del self.queues[host]
+            self.scheduled.discard(host)
+            if self.politeness_delay > 0:
+                self.next_allowed[host] = now + self.politeness_delay
+        elif self.politeness_delay > 0:
+            heapq.heappush(
+                self.cooling, (now + self.politeness_delay, next(self.counter), host)
+            )
+        else:
+            heapq.heappush(self.ready, (queue[0][1], next(self.counter), host))
+        return url, depth
+
+    def wait_time(self):
+        """距离下一个主机结束冷却的秒数，没有冷却中的主机时返回 None"""
+        if not self.cooling:
+            return None
+        return max(0.0, self.cooling[0][0] - time.monotonic())
+
+    def host_count(self):
+        return len(self.queues)
+
+    def items(self):
+        """全部待爬取的 (URL, 深度)，用于保存检查点"""
+        for queue in self.queues.values():
+            yield from queue
@@ -0,0 +1,128 @@
+import sys
+import hashlib
+import numpy as np
+from urllib.parse import urlsplit, urlunsplit
+
+# URL 规范化与已见 URL 集合
+#
+# 规范化：协议和主机名转小写，去掉默认端口（http 80、https 443）、锚点和跟踪参数（utm_* 等），
+# 空路径补为 /，其余路径去掉末尾的 /。同一网页的不同写法规范化后相同，只爬取一次，
+# 写入 CSV 的 url 和 links 也都是规范化后的形式，构建链接图时可以直接对应。
+#
+# 已见 URL 集合只保存规范化 URL 的 64 位指纹（blake2b），不保存字符串本身：
+#   fingerprints  升序的 uint64 数组，每个 URL 8 字节，按二分查找
+#   recent        最近加入的指纹（Python 集合），达到 MERGE_THRESHOLD 个时归并进数组
+# 归并只需一次线性的有序插入，100 万个 URL 约占 8 MB，而 Python 集合保存 URL 字符串
+# 每个 URL 需要一百多字节。10^7 个 URL 时两个不同 URL 指纹相同的概率约为 3e-6，
+# 相同时后出现的 URL 被当作已见而跳过，对爬取的影响可以忽略。
+
+MERGE_THRESHOLD = 1 << 16  # recent 中的指纹数达到多少时归并进有序数组
+DEFAULT_PORTS = {"http": 80, "https": 443}
+TRACKING_PARAMS = {"gclid", "fbclid", "msclkid", "spm", "isappinstalled"}
+TRACKING_PREFIXES = ("utm_",)
+
+
+def is_tracking_param(param):
+    key = param.split("=", 1)[0].lower()
+    return key in TRACKING_PARAMS or key.startswith(TRACKING_PREFIXES)
+
+
+def canonicalize_url(url):
+    """返回规范化的 URL，无法解析的 URL 原样返回"""
+    try:
+        parts = urlsplit(url.strip())
+        port = parts.port
+    except ValueError:
+        return url
+    scheme = parts.scheme.lower()
+    host = parts.hostname or ""
+    if ":" in host:  # IPv6 地址
+        host = f"[{host}]"
+    if port is not None and port != DEFAULT_PORTS.get(scheme):
+        host = f"{host}:{port}"
+    path = parts.path or "/"
+    if len(path) > 1 and path.endswith("/"):
+        path = path.rstrip("/") or "/"
+    query = "&".join(
+        p for p in parts.query.split("&") if p and not is_tracking_param(p)
+    )
+    return urlunsplit((scheme, host, path, query, ""))
+
+
+def url_fingerprint(url):
+    digest = hashlib.blake2b(url.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "little")
+
+
+class UrlSeenSet:
+    """已见 URL 的指纹集合，调用方负责先规范化 URL"""
+
+    def __init__(self, merge_threshold=MERGE_THRESHOLD):
+        self.merge_threshold = merge_threshold
+        self.fingerprints = np.zeros(0, dtype=np.uint64)
+        self.recent = set()
+
+    def __len__(self):
+        return len(self.fingerprints) + len(self.recent)
+
+    def __contains__(self, url):
+        fingerprint = url_fingerprint(url)
+        return fingerprint in self.recent or bool(
+            self.in_fingerprints([fingerprint])[0]
+        )
+
+    def in_fingerprints(self, fingerprints):
+        """fingerprints 中每个指纹是否在有序数组中"""
+        fingerprints = np.asarray(fingerprints, dtype=np.uint64)
+        if len(self.fingerprints) == 0:
+            return np.zeros(len(fingerprints), dtype=bool)
+        pos = np.searchsorted(self.fingerprints, fingerprints)
+        pos = np.minimum(pos, len(self.fingerprints) - 1)
+        return self.fingerprints[pos] == fingerprints
+
+    def filter_new(self, urls):
+        """返回 urls 中未见过的 URL（同一批中重复的只保留第一个），并把它们记为已见"""
+        fingerprints = [url_fingerprint(url) for url in urls]
+        in_array = self.in_fingerprints(fingerprints)
+        new_urls = []
+        for url, fingerprint, seen in zip(urls, fingerprints, in_array.tolist()):
+            if not seen and fingerprint not in self.recent:
+                self.recent.add(fingerprint)
+                new_urls.append(url)
+        if len(self.recent) >= self.merge_threshold:
+            self.merge()
+        return new_urls
+
+    def add(self, url):
+        """记为已见，之前未见过时返回 True"""
+        return bool(self.filter_new([url]))
+
+    def update(self, urls, batch_size=MERGE_THRESHOLD):
+        """逐批加入大量 URL（如从检查点恢复时），urls 可以是迭代器"""
+        batch = []
+        for url in urls:
+            batch.append(url)
+            if len(batch) >= batch_size:
+                self.filter_new(batch)
+                batch.clear()
+        self.filter_new(batch)
+
+    def merge(self):
+        """把 recent 中的指纹有序插入数组"""
+        if not self.recent:
+            return
+        recent = np.sort(
+            np.fromiter(self.recent, dtype=np.uint64, count=len(self.recent))
+        )
+        self.fingerprints = np.insert(
+            self.fingerprints, np.searchsorted(self.fingerprints, recent), recent
+        )
+        self.recent.clear()
+
+    def memory_bytes(self):
+        """有序数组与 recent 集合（含其中的整数对象）占用的字节数"""
+        return (
+            self.fingerprints.nbytes
+            + sys.getsizeof(self.recent)
+            + sum(map(sys.getsizeof, self.recent))
+        )
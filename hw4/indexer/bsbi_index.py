@@ -0,0 +1,145 @@
+import os
+import heapq
+import shutil
+import contextlib
+import numpy as np
+from array import array
+from collections import defaultdict
+from functools import partial
+from postings import (
+    PositionalPostingsWriter,
+    PositionalPostingsReader,
+    write_index_meta,
+)
+from term_dictionary import TermDictionaryWriter
+
+# 有内存上限的分块索引构建（BSBI）
+#
+# 与 hw1 的 BSBIIndex 一样分两个阶段：
+# 1. 每个进程逐文档累积 (词项, 文档号, 位置)，估计占用超过内存上限时，把当前块按词项排序、
+#    压缩后写成一个中间索引（run），清空后继续；
+# 2. 全部文档处理完后，用 heapq.merge 对所有 run 做 k 路归并，内存中只保留当前词项的
+#    倒排记录，边归并边写出最终的位置倒排索引。
+
+POSTINGS_FILE = "postings"  # 中间索引和最终索引的倒排记录文件名
+POSTING_BYTES = 16  # 每条 (文档号, 位置) 在 array("q") 中占用的字节数
+TERM_OVERHEAD_BYTES = 200  # 每个词项的 dict 表项、字符串和 array 对象的估计开销
+
+
+# 将一个块写成中间索引
+def write_run(block_postings, run_dir):
+    """block_postings 为 {词项: array([文档号, 位置, 文档号, 位置, ...])}，按文档顺序追加"""
+    os.makedirs(run_dir, exist_ok=True)
+    dictionary = TermDictionaryWriter(run_dir)
+    with PositionalPostingsWriter(run_dir, POSTINGS_FILE, dictionary) as writer:
+        for term in sorted(block_postings):
+            pairs = np.frombuffer(block_postings[term], dtype=np.int64).reshape(-1, 2)
+            doc_ids, tfs = np.unique(pairs[:, 0], return_counts=True)
+            writer.append(term, doc_ids, tfs, pairs[:, 1])
+    dictionary.close()
+
+
+class BlockBuilder:
+    """在内存上限内累积一个块的位置倒排记录，超过上限时写出一个 run"""
+
+    def __init__(self, run_dir, run_prefix, memory_budget):
+        self.run_dir = run_dir
+        self.run_prefix = run_prefix
+        self.memory_budget = memory_budget
+        self.runs = []
+        self._reset()
+
+    def _reset(self):
+        self.block_postings = defaultdict(partial(array, "q"))
+        self.num_postings = 0
+
+    def estimated_bytes(self):
+        return (
+            self.num_postings * POSTING_BYTES
+            + len(self.block_postings) * TERM_OVERHEAD_BYTES
+        )
+
+    def add(self, term, doc_number, position):
+        postings = self.block_postings[term]
+        postings.append(doc_number)
+        postings.append(position)
+        self.num_postings += 1
+
+    def end_document(self):
+        """只在文档之间写出 run，保证一个文档的倒排记录不会跨 run"""
+        if self.estimated_bytes() >= self.memory_budget:
+            self.flush()
+
+    def flush(self):
+        if not self.block_postings:
+            return
+        run_dir = os.path.join(self.run_dir, f"{self.run_prefix}_{len(self.runs):04d}")
+        write_run(self.block_postings, run_dir)
+        self.runs.append(run_dir)
+        self._reset()
+
+
+# 对多个 run 做 k 路归并
+def merge_runs(run_dirs, output_dir, deleted=None):
+    """各 run 内词项有序、run 之间文档号不重叠，归并后写成一个位置倒排索引
+
+    合并分段索引的段时（见 update_index.py）传入以文档号为下标的删除位图 deleted，
+    已删除文档的倒排记录不再写出。
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    dictionary = TermDictionaryWriter(output_dir)
+    with contextlib.ExitStack() as stack:
+        runs = [
+            stack.enter_context(PositionalPostingsReader(run_dir))
+            for run_dir in run_dirs
+        ]
+        writer = stack.enter_context(
+            PositionalPostingsWriter(output_dir, POSTINGS_FILE, dictionary)
+        )
+
+        def write_term(term, parts):
+            doc_ids, tfs, positions = concat_postings(parts)
+            if deleted is not None:
+                doc_ids, tfs, positions = drop_deleted(deleted, doc_ids, tfs, positions)
+            if len(doc_ids):
+                writer.append(term, doc_ids, tfs, positions)
+
+        last_term = None
+        parts = []
+        for term, *postings in heapq.merge(*runs, key=lambda item: item[0]):
+            if term != last_term and parts:
+                write_term(last_term, parts)
+                parts = []
+            last_term = term
+            parts.append(postings)
+        if parts:
+            write_term(last_term, parts)
+
+    dictionary.close()
+    write_index_meta(output_dir, positional=True)
+
+
+def concat_postings(parts):
+    """拼接同一词项在多个 run 中的倒排记录
+
+    每个 run 覆盖一段连续的行号且互不重叠，按各段的首个文档号排序后直接拼接即可。
+    """
+    if len(parts) == 1:
+        return parts[0]
+    parts = sorted(parts, key=lambda p: p[0][0])
+    return tuple(np.concatenate([p[k] for p in parts]) for k in range(3))
+
+
+def drop_deleted(deleted, doc_ids, tfs, positions):
+    """去掉删除位图中标记的文档，位置随文档一起去掉"""
+    live = np.ones(len(doc_ids), dtype=bool)
+    in_range = doc_ids < len(deleted)
+    live[in_range] = ~deleted[doc_ids[in_range]]
+    if live.all():
+        return doc_ids, tfs, positions
+    return doc_ids[live], tfs[live], positions[np.repeat(live, tfs)]
+
+
+def remove_runs(run_dirs):
+    for run_dir in run_dirs:
+        shutil.rmtree(run_dir, ignore_errors=True)
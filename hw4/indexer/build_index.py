@@ -0,0 +1,219 @@
+import os
+import shutil
+import pandas as pd
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain
+from index import (
+    STOPWORDS,
+    is_file_link,
+    extract_file_content,
+    extract_files,
+)
+from bsbi_index import BlockBuilder, merge_runs, remove_runs
+from token_cache import lcut_many, format_stats
+from chunk_pipeline import (
+    IN_FLIGHT_PER_WORKER,
+    Throughput,
+    init_worker,
+    read_chunks,
+    stream_chunks,
+)
+from index_config import (
+    DATA_FILE,
+    MAX_WORKERS,
+    CHUNK_SIZE,
+    MEMORY_BUDGET_MB,
+    RUN_DIR,
+    TOKEN_CACHE_FILE,
+    INDEX_FIELDS,
+    ENABLED_FIELDS,
+)
+
+# 每种索引由哪些文本段拼接而成（分别对应文件链接和普通网页），None 表示不索引
+# 每个文本段只分词一次，各索引复用分词结果；分词结果还会写入分词缓存（见 token_cache.py），
+# 之后的构建中内容未变的文本段不再重新分词
+TOKENIZE_BATCH = 256  # 每次查询分词缓存的文档数
+FIELD_SEGMENTS = {
+    "full": {"file": ["url", "file_content"], "html": ["title", "url", "anchor_body"]},
+    "title": {"file": ["title", "url", "file_content"], "html": ["title", "url"]},
+    "file": {"file": ["url", "file_content"], "html": None},
+}
+
+
+# 将一个文档的词序列加入索引块
+def index_tokens(block, doc_number, words):
+    """返回实际写入索引的词数，作为该文档在此索引中的长度"""
+    count = 0
+    for position, word in enumerate(words):
+        word = word.lower().strip(",.!?;:\"'()[]{}")  # 标准化词
+        if word and word not in STOPWORDS:  # 过滤停用词
+            block.add(word, doc_number, position)
+            count += 1
+    block.end_document()
+    return count
+
+
+# 取出一个文档中需要分词的文本段
+def document_segments(row, fields):
+    """返回 (类型, {文本段名: 文本})，只包含 fields 中的索引用到的文本段"""
+    url = row["url"]
+    kind = "file" if is_file_link(url) else "html"
+
+    segments = {"title": f"{row['title']}", "url": f"{url}"}
+    if kind == "file":
+        # 如果是文件链接，只提取一次文件内容
+        segments["file_content"] = extract_file_content(row["body"])
+    else:
+        segments["anchor_body"] = f"{row['anchor_texts']} {row['body']}"
+
+    needed = set()
+    for field in fields:
+        needed.update(FIELD_SEGMENTS[field][kind] or [])
+    return kind, {name: segments[name] for name in needed}
+
+
+# 对一批文档的文本段分词，命中缓存的不再调用 jieba
+def tokenize_documents(rows, fields, cache_path, stats):
+    """依次返回 (文档, 类型, {文本段名: 词序列})"""
+    for start in range(0, len(rows), TOKENIZE_BATCH):
+        batch = rows[start : start + TOKENIZE_BATCH]
+        documents = [document_segments(row, fields) for row in batch]
+        texts = [text for _, segments in documents for text in segments.values()]
+        tokens = iter(lcut_many(texts, cache_path, stats))
+        for row, (kind, segments) in zip(batch, documents):
+            yield row, kind, {name: next(tokens) for name in segments}
+
+
+# 一次分词同时构建多种索引，超过内存上限时写出中间索引
+def build_field_runs(
+    rows, fields, run_dir, chunk_id, memory_budget, cache_path=TOKEN_CACHE_FILE
+):
+    """返回 ({索引名: (中间索引目录列表, 单词数统计文件)}, 分词缓存命中统计)"""
+    field_budget = memory_budget // len(fields)  # 各索引平分本进程的内存上限
+    blocks = {
+        field: BlockBuilder(run_dir, f"{field}_{chunk_id:05d}", field_budget)
+        for field in fields
+    }
+    word_counts = {field: [] for field in fields}
+    cache_stats = Counter(hits=0, misses=0)
+
+    for row, kind, tokens in tokenize_documents(rows, fields, cache_path, cache_stats):
+        url = row["url"]
+        doc_number = row["line_number"]
+        for field in fields:
+            segment_names = FIELD_SEGMENTS[field][kind]
+            if segment_names is None:
+                continue
+            words = chain.from_iterable(tokens[name] for name in segment_names)
+            count = index_tokens(blocks[field], doc_number, words)
+            word_counts[field].append(
+                {"linenumber": doc_number, "url": url, "word_count": count}
+            )
+
+    results = {}
+    for field in fields:
+        blocks[field].flush()
+        # 单词数统计也先写到磁盘，父进程只收集文件名
+        word_count_file = os.path.join(
+            run_dir, f"{field}_{chunk_id:05d}_word_count.csv"
+        )
+        # 指定列名：块中没有该索引的文档（如没有文件）时也写出只有表头的文件
+        pd.DataFrame(
+            word_counts[field], columns=["linenumber", "url", "word_count"]
+        ).to_csv(word_count_file, index=False)
+        results[field] = (blocks[field].runs, word_count_file)
+    print(f"块 {chunk_id}: {format_stats(cache_stats)}")
+    return results, cache_stats
+
+
+# 按块顺序拼接各块的单词数统计
+def concat_word_counts(word_count_files, output_file):
+    with open(output_file, "w", encoding="utf-8", newline="") as out:
+        for i, file_name in enumerate(word_count_files):
+            with open(file_name, "r", encoding="utf-8", newline="") as f:
+                header = f.readline()
+                if i == 0:
+                    out.write(header)
+                shutil.copyfileobj(f, out)
+            os.remove(file_name)
+    print(f"单词数统计结果已保存到 {output_file}")
+
+
+# 并行构建所有启用的索引
+def parallel_build_field_indexes(
+    file_path,
+    fields,
+    max_workers=4,
+    chunk_size=10000,
+    memory_budget=MEMORY_BUDGET_MB << 20,
+    run_dir=RUN_DIR,
+):
+    """返回 ({索引名: (中间索引目录列表, 单词数统计文件列表)}, 分词缓存命中统计)
+
+    中间索引目录和单词数统计文件均按文档顺序排列。
+    """
+    shutil.rmtree(run_dir, ignore_errors=True)  # 清理上次中断时留下的中间索引
+    os.makedirs(run_dir)
+    chunk_results = {}
+    cache_stats = Counter(hits=0, misses=0)
+    throughput = Throughput()
+
+    with ProcessPoolExecutor(
+        max_workers=max_workers, initializer=init_worker
+    ) as executor:
+
+        def submit(chunk_id, rows):
+            return executor.submit(
+                build_field_runs, rows, fields, run_dir, chunk_id, memory_budget
+            )
+
+        # 块按完成顺序取回，最后按块号排列
+        for chunk_id, (results, chunk_stats) in stream_chunks(
+            submit,
+            read_chunks(file_path, chunk_size),
+            max_workers * IN_FLIGHT_PER_WORKER,
+            throughput,
+        ):
+            chunk_results[chunk_id] = results
+            cache_stats.update(chunk_stats)
+
+    print(f"分词与索引完成：{throughput}")
+    run_dirs = {field: [] for field in fields}
+    word_count_files = {field: [] for field in fields}
+    for chunk_id in sorted(chunk_results):
+        for field, (runs, word_count_file) in chunk_results[chunk_id].items():
+            run_dirs[field].extend(runs)
+            word_count_files[field].append(word_count_file)
+    results = {field: (run_dirs[field], word_count_files[field]) for field in fields}
+    return results, cache_stats
+
+
+# 主函数
+def main():
+    # 先并行提取所有文件的正文，构建时各进程直接读取，不再重复解析
+    for chunk in pd.read_csv(DATA_FILE, usecols=["url", "body"], chunksize=CHUNK_SIZE):
+        extract_files(chunk.to_dict("records"))
+
+    print(f"开始构建索引: {', '.join(ENABLED_FIELDS)}")
+    results, cache_stats = parallel_build_field_indexes(
+        DATA_FILE, ENABLED_FIELDS, max_workers=MAX_WORKERS, chunk_size=CHUNK_SIZE
+    )
+    print(f"分词完成，{format_stats(cache_stats)}")
+
+    for field, (run_dirs, word_count_files) in results.items():
+        config = INDEX_FIELDS[field]
+        # 已发布的版本以硬链接引用旧的位置倒排索引，先删除再写出新文件，不在原文件上覆盖
+        shutil.rmtree(config["index_dir"], ignore_errors=True)
+        merge_runs(run_dirs, config["index_dir"])
+        remove_runs(run_dirs)
+        concat_word_counts(word_count_files, config["word_count_file"])
+        print(
+            f"{field} 索引已保存到 '{config['index_dir']}' 目录"
+            f"（由 {len(run_dirs)} 个中间索引归并）！"
+        )
+    shutil.rmtree(RUN_DIR, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
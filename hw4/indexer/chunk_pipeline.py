@@ -0,0 +1,83 @@
+import time
+import jieba
+import pandas as pd
+from concurrent.futures import as_completed
+
+# 流式分块处理
+#
+# 读取方按块读入数据文件，提交给进程池的块最多同时有 max_in_flight 个，
+# 先完成的块先取回结果（as_completed），数据文件不会被整个读入内存或一次性序列化。
+# 调用方按块号重新排列结果，输出与按顺序处理时一致。
+
+IN_FLIGHT_PER_WORKER = 2  # 每个进程最多排队的块数，保证进程在取回结果时不会空闲
+
+
+def init_worker():
+    """进程池的初始化函数：每个进程启动时加载一次 jieba 词典
+
+    停用词表在导入 index.py 时加载，每个进程同样只加载一次。
+    """
+    jieba.initialize()
+
+
+def read_chunks(file_path, chunk_size=10000, usecols=None):
+    """依次返回 (块号, 记录列表, 数据量字节数)"""
+    for chunk_id, chunk in enumerate(
+        pd.read_csv(file_path, chunksize=chunk_size, usecols=usecols)
+    ):
+        nbytes = int(chunk.memory_usage(index=False, deep=True).sum())
+        yield chunk_id, chunk.to_dict("records"), nbytes
+
+
+class Throughput:
+    """已处理的文档数和数据量，按开始以来的时间计算吞吐量"""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.docs = 0
+        self.bytes = 0
+
+    def add(self, docs, nbytes):
+        self.docs += docs
+        self.bytes += nbytes
+
+    def elapsed(self):
+        return max(time.perf_counter() - self.start, 1e-9)
+
+    def docs_per_sec(self):
+        return self.docs / self.elapsed()
+
+    def mb_per_sec(self):
+        return self.bytes / (1 << 20) / self.elapsed()
+
+    def __str__(self):
+        return (
+            f"{self.docs} 个文档，{self.bytes / (1 << 20):.1f} MB，"
+            f"{self.docs_per_sec():.1f} 文档/秒，{self.mb_per_sec():.2f} MB/秒"
+        )
+
+
+def stream_chunks(submit, chunks, max_in_flight, throughput=None):
+    """submit(块号, 记录列表) 提交一个块并返回 future，chunks 为 read_chunks 的输出
+
+    按完成顺序依次返回 (块号, 结果)；throughput 为 Throughput 时累加已完成的文档数和数据量。
+    """
+    in_flight = {}
+
+    def drain(limit):
+        """取回已完成的块，直到在途的块不超过 limit 个"""
+        for future in as_completed(list(in_flight)):
+            chunk_id, docs, nbytes = in_flight.pop(future)
+            result = future.result()
+            if throughput is not None:
+                throughput.add(docs, nbytes)
+                print(f"块 {chunk_id} 完成：{throughput}")
+            yield chunk_id, result
+            if len(in_flight) <= limit:
+                break
+
+    for chunk_id, records, nbytes in chunks:
+        in_flight[submit(chunk_id, records)] = (chunk_id, len(records), nbytes)
+        if len(in_flight) >= max_in_flight:
+            yield from drain(max_in_flight - 1)
+    yield from drain(0)
@@ -0,0 +1,289 @@
+import os
+import re
+import time
+import hashlib
+import sqlite3
+import threading
+import multiprocessing
+from multiprocessing.connection import wait
+import PyPDF2
+import docx
+from openpyxl import load_workbook
+
+try:
+    import resource
+except ImportError:  # Windows 上没有 resource 模块，只限制时间不限制内存
+    resource = None
+
+# 文件正文提取
+#
+# 爬虫下载的 PDF/Word/Excel 文件只解析一次，提取出的文字保存在一个 SQLite 文件中：
+#   texts  sha1(文件内容) -> 文字，内容相同的文件（如重新下载的同一文件）共用一条记录
+#   files  文件路径 -> (大小, 修改时间, sha1)，文件未变化时不必重新计算哈希
+# 爬虫按内容寻址保存的文件（<sha1><扩展名>，见 crawler/downloads.py）直接由文件名得到哈希，
+# 不必读取文件，多个 URL 指向同一文件时也只解析一次。
+# 每个文件在独立的子进程中解析，超过 timeout 秒或超出内存上限的子进程直接终止，
+# 个别异常的文件不会卡住整个构建。索引构建和查询端的预览都从这里读取文字。
+
+FILE_PATH_PREFIX = "文件路径:"  # 爬虫在 body 中记录文件路径时使用的前缀
+HASH_BLOCK_SIZE = 1 << 20
+CONTENT_ADDRESSED_NAME = re.compile(r"[0-9a-f]{40}")  # 以 sha1 命名的文件
+STORE_BATCH = 100  # 每解析这么多个文件提交一次
+
+FILE_NOT_FOUND = "[FILE NOT FOUND]"
+EXTRACTION_TIMEOUT = "[EXTRACTION TIMEOUT]"
+EXTRACTION_FAILED = "[EXTRACTION FAILED]"
+
+
+def body_file_path(body, base_dir):
+    """从数据文件的 body 列得到文件的绝对路径，相对路径相对于 base_dir（爬虫目录）"""
+    path = f"{body}".strip()
+    if path.startswith(FILE_PATH_PREFIX):
+        path = path[len(FILE_PATH_PREFIX) :].strip()
+    return os.path.abspath(os.path.join(base_dir, path))
+
+
+def stored_file_hash(file_path):
+    """内容寻址保存的文件返回文件名中的 sha1，其他文件返回 None"""
+    name = os.path.splitext(os.path.basename(file_path))[0]
+    return name if CONTENT_ADDRESSED_NAME.fullmatch(name) else None
+
+
+def file_hash(file_path):
+    sha1 = hashlib.sha1()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b""):
+            sha1.update(block)
+    return sha1.hexdigest()
+
+
+# 按文件类型解析
+def parse_file_content(file_path):
+    """根据文件类型提取文字内容"""
+    if not os.path.exists(file_path):
+        return FILE_NOT_FOUND
+
+    _, ext = os.path.splitext(file_path)
+    ext = ext.lower()
+
+    try:
+        if ext == ".pdf":
+            return extract_pdf_content(file_path)
+        elif ext in [".doc", ".docx"]:
+            return extract_doc_content(file_path)
+        elif ext in [".xls", ".xlsx"]:
+            return extract_xls_content(file_path)
+        else:
+            return "[UNSUPPORTED FILE FORMAT]"
+    except Exception as e:
+        return f"[ERROR READING FILE: {e}]"
+
+
+def extract_pdf_content(file_path):
+    """提取 PDF 文件内容"""
+    try:
+        with open(file_path, "rb") as f:
+            reader = PyPDF2.PdfReader(f)
+            content = []
+            for page in reader.pages:
+                content.append(page.extract_text())
+            return " ".join(content)
+    except Exception:
+        return "[UNREADABLE PDF]"
+
+
+def extract_doc_content(file_path):
+    """提取 Word 文件内容"""
+    try:
+        doc = docx.Document(file_path)
+        content = [p.text for p in doc.paragraphs]
+        return " ".join(content)
+    except Exception:
+        return "[UNREADABLE WORD FILE]"
+
+
+def extract_xls_content(file_path):
+    """提取 Excel 文件内容"""
+    try:
+        wb = load_workbook(file_path, data_only=True)
+        content = []
+        for sheet in wb.sheetnames:
+            ws = wb[sheet]
+            for row in ws.iter_rows(values_only=True):
+                content.extend(str(cell) for cell in row if cell is not None)
+        return " ".join(content)
+    except Exception:
+        return "[UNREADABLE EXCEL FILE]"
+
+
+# 在子进程中限时、限内存解析
+def limit_memory(memory_limit):
+    """子进程在 fork 时已有的地址空间之外，最多再占用 memory_limit 字节"""
+    if resource is None or not memory_limit:
+        return
+    try:
+        with open("/proc/self/statm", "r") as f:
+            base = int(f.read().split()[0]) * resource.getpagesize()
+    except OSError:
+        base = 0
+    resource.setrlimit(resource.RLIMIT_AS, (base + memory_limit, base + memory_limit))
+
+
+def extract_worker(file_path, conn, memory_limit):
+    limit_memory(memory_limit)
+    try:
+        text = parse_file_content(file_path)
+    except MemoryError:
+        text = "[ERROR READING FILE: 超出内存上限]"
+    conn.send(text)
+    conn.close()
+
+
+def extract_with_limits(file_paths, max_workers, timeout, memory_limit):
+    """依次返回 (文件路径, 文字)，顺序与完成顺序一致
+
+    最多同时运行 max_workers 个子进程，每个子进程只解析一个文件，
+    超时的子进程被终止，异常退出（如超出内存上限）的记为解析失败。
+    """
+    pending = list(file_paths)[::-1]
+    running = {}  # 管道 -> (文件路径, 子进程, 截止时间)
+    while pending or running:
+        while pending and len(running) < max_workers:
+            file_path = pending.pop()
+            recv_conn, send_conn = multiprocessing.Pipe(duplex=False)
+            process = multiprocessing.Process(
+                target=extract_worker,
+                args=(file_path, send_conn, memory_limit),
+                daemon=True,
+            )
+            process.start()
+            send_conn.close()
+            running[recv_conn] = (file_path, process, time.monotonic() + timeout)
+
+        next_deadline = min(deadline for _, _, deadline in running.values())
+        for conn in wait(list(running), max(0, next_deadline - time.monotonic())):
+            file_path, process, _ = running.pop(conn)
+            try:
+                text = conn.recv()
+            except EOFError:
+                text = EXTRACTION_FAILED
+            conn.close()
+            process.join()
+            yield file_path, text
+
+        now = time.monotonic()
+        for conn, (file_path, process, deadline) in list(running.items()):
+            if deadline <= now:
+                process.kill()
+                process.join()
+                conn.close()
+                del running[conn]
+                print(f"[EXTRACTION TIMEOUT] {file_path}")
+                yield file_path, EXTRACTION_TIMEOUT
+
+
+class FileTextStore:
+    """以文件内容哈希为键的正文存储，查询服务的多个线程共用一个连接"""
+
+    def __init__(self, path):
+        self.path = path
+        self.conn = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        self.lock = threading.RLock()
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        with self.conn:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS texts (sha1 TEXT PRIMARY KEY, text TEXT)"
+            )
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, "
+                "size INTEGER, mtime_ns INTEGER, sha1 TEXT)"
+            )
+
+    def close(self):
+        self.conn.close()
+
+    def content_hash(self, file_path):
+        """文件大小和修改时间未变时直接使用记录的哈希，文件不存在时返回 None"""
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            return None
+        sha1 = stored_file_hash(file_path)
+        if sha1 is not None:
+            return sha1
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT size, mtime_ns, sha1 FROM files WHERE path = ?", (file_path,)
+            ).fetchone()
+        if row is not None and row[:2] == (stat.st_size, stat.st_mtime_ns):
+            return row[2]
+        sha1 = file_hash(file_path)
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)",
+                (file_path, stat.st_size, stat.st_mtime_ns, sha1),
+            )
+        return sha1
+
+    def lookup(self, file_path):
+        """返回已提取的文字，尚未提取时返回 None，文件不存在时返回 FILE_NOT_FOUND"""
+        sha1 = self.content_hash(file_path)
+        if sha1 is None:
+            return FILE_NOT_FOUND
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT text FROM texts WHERE sha1 = ?", (sha1,)
+            ).fetchone()
+        return row[0] if row is not None else None
+
+    def store(self, items):
+        """items 为 [(sha1, 文字), ...]"""
+        with self.lock, self.conn:
+            self.conn.executemany("INSERT OR REPLACE INTO texts VALUES (?, ?)", items)
+
+    def extract_all(self, file_paths, max_workers, timeout, memory_limit):
+        """解析所有尚未提取的文件，返回新解析的文件数"""
+        missing = {}  # sha1 -> 文件路径，内容相同的文件只解析一次
+        for file_path in dict.fromkeys(file_paths):
+            if self.lookup(file_path) is None:
+                missing.setdefault(self.content_hash(file_path), file_path)
+        if not missing:
+            return 0
+
+        path_hashes = {file_path: sha1 for sha1, file_path in missing.items()}
+        start = time.perf_counter()
+        batch = []
+        for i, (file_path, text) in enumerate(
+            extract_with_limits(path_hashes, max_workers, timeout, memory_limit), 1
+        ):
+            batch.append((path_hashes[file_path], text))
+            if len(batch) >= STORE_BATCH:
+                self.store(batch)
+                batch = []
+            if i % 100 == 0:
+                print(f"已提取 {i}/{len(path_hashes)} 个文件")
+        self.store(batch)
+        print(
+            f"文件正文提取完成：{len(path_hashes)} 个文件，"
+            f"用时 {time.perf_counter() - start:.2f}s"
+        )
+        return len(path_hashes)
+
+    def get(self, file_path, timeout, memory_limit):
+        """返回文件的文字，尚未提取时先在子进程中提取并保存"""
+        text = self.lookup(file_path)
+        if text is None:
+            self.extract_all([file_path], 1, timeout, memory_limit)
+            text = self.lookup(file_path)
+        return text
+
+
+# 每个进程只打开一次，进程池中的子进程各自建立 SQLite 连接
+opened_stores = {}
+
+
+def get_file_text_store(path):
+    key = (os.getpid(), os.path.abspath(path))
+    if key not in opened_stores:
+        opened_stores[key] = FileTextStore(path)
+    return opened_stores[key]
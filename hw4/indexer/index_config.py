@@ -0,0 +1,46 @@
+# 索引构建配置
+#
+# 三种索引（全文、标题、文件）共用一次分词，build_index.py 按 ENABLED_FIELDS 生成对应的索引，
+# tf_idf_cal.py 也按同一份配置为每种索引计算 TF-IDF 或 BM25 权重，不再需要修改代码中的路径。
+# 构建时每个进程最多占用约 MEMORY_BUDGET_MB 的倒排记录，超出部分先写成有序的中间索引，
+# 最后归并为每种索引一个位置倒排索引（见 bsbi_index.py）。
+
+DATA_FILE = "../crawler/linenumber_title_url_anchor_body.csv"  # 数据文件路径
+MAX_WORKERS = 4  # 并行进程数
+CHUNK_SIZE = 10000  # 每块大小
+MEMORY_BUDGET_MB = 256  # 每个进程累积倒排记录的内存上限，超过后写出中间索引
+RUN_DIR = "index_runs"  # 中间索引的临时目录，归并完成后删除
+TOKEN_CACHE_FILE = "token_cache.sqlite"  # 分词缓存（见 token_cache.py），设为 None 则不使用
+FILE_TEXT_STORE = "file_text.sqlite"  # 文件正文存储（见 file_text.py），查询端也从这里读取预览
+FILE_BASE_DIR = "../crawler"  # 数据文件 body 列中文件路径的起始目录（爬虫目录）
+EXTRACT_WORKERS = 4  # 同时解析文件的子进程数
+EXTRACT_TIMEOUT = 60  # 单个文件的解析时间上限（秒）
+EXTRACT_MEMORY_MB = 1024  # 单个文件解析时额外占用的内存上限
+SEGMENT_MERGE_FACTOR = 10  # 同一数量级的相邻段达到该个数时合并为一个段
+MAX_DELETED_RATIO = 0.3  # 段内已删除文档超过该比例时单独重写
+WEIGHTING = "tf_idf"  # 权重计算方式：tf_idf（词频/文档长度 * IDF）或 bm25
+BM25_K1 = 1.2  # BM25 词频饱和参数
+BM25_B = 0.75  # BM25 文档长度归一化参数
+
+INDEX_FIELDS = {
+    # 全文索引：网页为 标题 + url + 锚文本 + 正文，文件为 url + 文件内容
+    "full": {
+        "index_dir": "inverted_index_chunks",
+        "word_count_file": "word_count.csv",
+        "tf_idf_dir": "tf_idf_chunks",
+    },
+    # 标题索引：网页为 标题 + url，文件为 标题 + url + 文件内容
+    "title": {
+        "index_dir": "title_inverted_index_chunks",
+        "word_count_file": "title_word_count.csv",
+        "tf_idf_dir": "title_tf_idf_chunks",
+    },
+    # 文件索引：只索引文件，内容为 url + 文件内容
+    "file": {
+        "index_dir": "file_inverted_index_chunks",
+        "word_count_file": "file_word_count.csv",
+        "tf_idf_dir": "file_tf_idf_chunks",
+    },
+}
+
+ENABLED_FIELDS = ["full", "title", "file"]  # 需要构建的索引
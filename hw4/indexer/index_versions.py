@@ -0,0 +1,239 @@
+import os
+import time
+import shutil
+import itertools
+import threading
+import contextlib
+
+# 带版本的索引目录和结果文件
+#
+# 逻辑路径 <path>（如 tf_idf_chunks、../pagerank/pagerank_results.csv）每次全量构建写入一个新版本：
+#   <path>.versions/<版本号>/<名字>   该版本的目录或文件
+#   <path>.current                  当前版本号，先写临时文件再 os.replace，切换是原子的
+#   <path>.lock                     切换版本的锁，增量更新在锁内基于当前版本生成新版本再切换
+# 读取方用 resolve_version 得到当前版本的实际路径；没有 .current 时退回 <path> 本身，
+# 兼容未使用版本的旧数据。常驻的搜索引擎发现版本号变化后在后台打开新版本再切换。
+#
+# 已发布的版本不再修改。正在使用某个版本的进程（搜索引擎的快照、构建新段的增量更新）
+# 在版本目录中写入租约文件 .lease-<pid>-<序号>，后台线程定期更新其修改时间；
+# 清理旧版本时跳过有未过期租约的版本，进程异常退出留下的租约过期后不再生效。
+# 正在构建的版本同样持有租约，从 new_version_path 创建目录起直到切换为当前版本或被删除；
+# 此外清理只考虑比当前版本早的版本，比当前版本新的版本可能仍在构建或等待切换。
+
+VERSIONS_SUFFIX = ".versions"
+CURRENT_SUFFIX = ".current"
+LOCK_SUFFIX = ".lock"
+REMOVING_SUFFIX = ".removing"  # 正在删除的版本目录
+LEASE_PREFIX = ".lease-"
+KEEP_VERSIONS = 2  # 保留当前版本和上一个版本，更早的版本在没有租约时删除
+LOCK_TIMEOUT = 60  # 等待切换锁的最长秒数
+LEASE_REFRESH_INTERVAL = 30  # 更新租约修改时间的间隔（秒）
+LEASE_TIMEOUT = 300  # 租约超过多少秒未更新视为持有者已退出
+
+held_leases = set()  # 本进程持有的租约文件
+building_leases = {}  # 本进程正在构建的版本目录 -> 租约文件
+leases_lock = threading.Lock()
+lease_numbers = itertools.count()
+lease_refresher = None
+
+
+def current_version(path):
+    """返回当前版本号，未使用版本时返回 None"""
+    try:
+        with open(path + CURRENT_SUFFIX, "r", encoding="utf-8") as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def version_path(path, version):
+    """版本号 -> 该版本的实际路径，version 为 None 时为 <path> 本身"""
+    if version is None:
+        return path
+    return os.path.join(path + VERSIONS_SUFFIX, version, os.path.basename(path))
+
+
+def resolve_version(path):
+    """逻辑路径 -> 当前版本的实际路径"""
+    return version_path(path, current_version(path))
+
+
+def new_version_path(path):
+    """为一次新的构建分配版本目录，返回该版本中 <名字> 的路径（尚未创建）"""
+    # 同一秒内可能生成多个版本（如连续的段合并），版本号精确到纳秒，按名字排序仍是时间顺序
+    now = time.time_ns()
+    timestamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(now // 10**9))
+    version = f"{timestamp}.{now % 10**9:09d}-{os.getpid()}"
+    version_dir = os.path.join(path + VERSIONS_SUFFIX, version)
+    os.makedirs(version_dir)
+    # 构建可能持续很久，期间其他进程的清理不能删除该版本
+    lease = new_lease_file(version_dir)
+    open(lease, "x").close()
+    hold_lease(lease)
+    with leases_lock:
+        building_leases[version_dir] = lease
+    return os.path.join(version_dir, os.path.basename(path))
+
+
+@contextlib.contextmanager
+def version_lock(path):
+    """切换版本与增量更新生成新版本互斥，用独占创建的锁文件实现"""
+    lock_path = path + LOCK_SUFFIX
+    deadline = time.time() + LOCK_TIMEOUT
+    while True:
+        try:
+            fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            break
+        except FileExistsError:
+            if time.time() > deadline:
+                raise TimeoutError(f"等待版本锁超时: {lock_path}")
+            time.sleep(0.05)
+    try:
+        yield
+    finally:
+        os.close(fd)
+        os.remove(lock_path)
+
+
+def switch_version(path, version_path):
+    """将 new_version_path 返回的版本设为当前版本，调用方持有 version_lock"""
+    version = os.path.basename(os.path.dirname(version_path))
+    tmp_path = path + CURRENT_SUFFIX + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(version)
+    os.replace(tmp_path, path + CURRENT_SUFFIX)
+    release_building_lease(version_path)
+    print(f"已切换到新版本: {path} -> {version}")
+
+
+def publish_version(path, version_path):
+    """将 new_version_path 返回的版本设为当前版本，并清理较早的版本"""
+    with version_lock(path):
+        switch_version(path, version_path)
+    prune_versions(path)
+
+
+def remove_version(version_path):
+    """删除未发布的版本（如生成新版本失败时）"""
+    release_building_lease(version_path)
+    shutil.rmtree(os.path.dirname(version_path), ignore_errors=True)
+
+
+# 租约
+def refresh_leases():
+    with leases_lock:
+        leases = list(held_leases)
+    for lease in leases:
+        with contextlib.suppress(OSError):
+            os.utime(lease)
+
+
+def refresh_leases_forever():
+    while True:
+        time.sleep(LEASE_REFRESH_INTERVAL)
+        refresh_leases()
+
+
+def new_lease_file(version_dir):
+    return os.path.join(
+        version_dir, f"{LEASE_PREFIX}{os.getpid()}-{next(lease_numbers)}"
+    )
+
+
+def hold_lease(lease):
+    """登记本进程持有的租约，由后台线程定期更新"""
+    global lease_refresher
+    with leases_lock:
+        held_leases.add(lease)
+        if lease_refresher is None:
+            lease_refresher = threading.Thread(
+                target=refresh_leases_forever, daemon=True
+            )
+            lease_refresher.start()
+
+
+def release_building_lease(version_path):
+    """释放 new_version_path 为正在构建的版本写入的租约"""
+    with leases_lock:
+        lease = building_leases.pop(os.path.dirname(version_path), None)
+    release_lease(lease)
+
+
+def acquire_lease(path):
+    """为逻辑路径的当前版本写入租约，返回 (版本号, 实际路径, 租约文件)
+
+    未使用版本时版本号和租约文件为 None。
+    """
+    while True:
+        version = current_version(path)
+        if version is None:
+            return None, path, None
+        lease = new_lease_file(os.path.join(path + VERSIONS_SUFFIX, version))
+        try:
+            # 版本目录已被改名准备删除时创建失败，重新读取当前版本
+            open(lease, "x").close()
+            break
+        except FileNotFoundError:
+            if current_version(path) == version:
+                raise
+    hold_lease(lease)
+    return version, version_path(path, version), lease
+
+
+def release_lease(lease):
+    if lease is None:
+        return
+    with leases_lock:
+        held_leases.discard(lease)
+    with contextlib.suppress(FileNotFoundError):
+        os.remove(lease)
+
+
+@contextlib.contextmanager
+def leased_version(path):
+    """在 with 块内使用当前版本，返回 (版本号, 实际路径)"""
+    version, path_in_version, lease = acquire_lease(path)
+    try:
+        yield version, path_in_version
+    finally:
+        release_lease(lease)
+
+
+def has_live_lease(version_dir, timeout=LEASE_TIMEOUT):
+    deadline = time.time() - timeout
+    for entry in os.scandir(version_dir):
+        if entry.name.startswith(LEASE_PREFIX):
+            with contextlib.suppress(FileNotFoundError):
+                if entry.stat().st_mtime > deadline:
+                    return True
+    return False
+
+
+def prune_versions(path, keep=KEEP_VERSIONS):
+    versions_dir = path + VERSIONS_SUFFIX
+    current = current_version(path)
+    # 版本号以时间开头，按名字排序即按构建时间排序
+    entries = sorted(os.listdir(versions_dir))
+    versions = [entry for entry in entries if not entry.endswith(REMOVING_SUFFIX)]
+    # 上次清理中断时留下的目录也在这里处理
+    removing = [entry for entry in entries if entry.endswith(REMOVING_SUFFIX)]
+    # 只清理比当前版本早的版本，保留其中最新的 keep - 1 个
+    older = [version for version in versions if current and version < current]
+    for version in older[: max(len(older) - (keep - 1), 0)]:
+        if has_live_lease(os.path.join(versions_dir, version)):
+            continue
+        # 改名后再检查一次租约：改名之后其他进程无法再在该版本中写入租约
+        try:
+            os.rename(
+                os.path.join(versions_dir, version),
+                os.path.join(versions_dir, version + REMOVING_SUFFIX),
+            )
+        except OSError:  # Windows 上有文件正在使用时无法改名，留到下次清理
+            continue
+        removing.append(version + REMOVING_SUFFIX)
+    for entry in removing:
+        removing_dir = os.path.join(versions_dir, entry)
+        if has_live_lease(removing_dir):
+            os.rename(removing_dir, removing_dir[: -len(REMOVING_SUFFIX)])
+        else:
+            shutil.rmtree(removing_dir, ignore_errors=True)
@@ -0,0 +1,689 @@
+import os
+import re
+import json
+import array
+import numpy as np
+from term_dictionary import (
+    BITMAP_POSTINGS,
+    LIST_POSTINGS,
+    SKIP_DTYPE,
+    TermDictionary,
+    TermDictionaryWriter,
+)
+from roaring import ARRAY_MAX, Bitmap, decode_bitmap, lookup_bitmap
+from wildcard_index import (
+    WildcardIndex,
+    build_wildcard_index,
+    has_wildcard_index,
+    is_wildcard,
+    wildcard_to_regex,
+)
+from shards import shard_files
+
+# 二进制倒排记录表格式
+#
+# 每个分块 <chunk_key> 对应一个 <chunk_key>.postings 文件，所有词项的倒排记录依次拼接；
+# 词项到 (文件, 偏移, 长度, df, 最大权重) 的映射保存在全局词典中（见 term_dictionary.py）。
+# 每个词项的记录 = 文档号间距（VB 或 gamma 编码） + 权重（float32 或 uint8 量化）
+# index_meta.json 记录编码方式，读取时据此选择解码器。
+# df 超过 SKIP_INTERVAL 的 VB 记录每 SKIP_INTERVAL 个文档记一个跳表项（块内最大文档号、起始字节），
+# 在长列表中查找少量文档时只解码可能包含它们的块（见 PostingsReader.lookup_docs）。
+# df 超过 ARRAY_MAX 且压缩位图（见 roaring.py）比间距编码更小的词项，文档号部分改为保存位图，
+# 词典中的 format 字段记录每个词项的格式，权重部分不变。
+#
+# 位置倒排索引（build_index.py 的输出）使用同一套词典，每个词项的记录为一段 VB 编码：
+#   文档号间距 * df + 词频 * df + 位置间距 * Σ词频（位置间距在每个文档内重新从 0 开始）
+
+POSTINGS_SUFFIX = ".postings"
+META_FILE = "index_meta.json"
+SKIP_INTERVAL = 128  # 每个跳表项覆盖的文档数
+
+
+class CompressedPostings:
+    """间距 + 可变字节（VB）编码，思路与 hw1 中的 CompressedPostings 相同，用 numpy 批量编解码"""
+
+    name = "vb"
+
+    @staticmethod
+    def vb_encode(numbers):
+        """对非负整数数组做 VB 编码，每个数的最后一个字节最高位为 1"""
+        numbers = np.asarray(numbers, dtype=np.uint64)
+        if len(numbers) == 0:
+            return b""
+        # 每个数需要的字节数（7 位一组）
+        n_bytes = np.ones(len(numbers), dtype=np.int64)
+        rest = numbers >> np.uint64(7)
+        while rest.any():
+            n_bytes += rest > 0
+            rest >>= np.uint64(7)
+        ends = np.cumsum(n_bytes) - 1
+        out = np.zeros(int(ends[-1]) + 1, dtype=np.uint8)
+        values = numbers.copy()
+        for k in range(int(n_bytes.max())):
+            mask = n_bytes > k
+            out[ends[mask] - k] = (values[mask] & np.uint64(0x7F)).astype(np.uint8)
+            values[mask] >>= np.uint64(7)
+        out[ends] |= 0x80
+        return out.tobytes()
+
+    @staticmethod
+    def vb_decode(byte_list):
+        """VB 解码，返回 int64 数组"""
+        data = np.frombuffer(byte_list, dtype=np.uint8)
+        ends = np.flatnonzero(data & 0x80)
+        return CompressedPostings.vb_decode_at(data, ends, np.arange(len(ends)))
+
+    @staticmethod
+    def vb_decode_at(data, ends, indices):
+        """只解码第 indices 个数，ends 为每个数最后一个字节的下标，其余的数直接跳过"""
+        indices = np.asarray(indices, dtype=np.int64)
+        if len(indices) == 0:
+            return np.zeros(0, dtype=np.int64)
+        starts = np.zeros(len(indices), dtype=np.int64)
+        has_previous = indices > 0
+        starts[has_previous] = ends[indices[has_previous] - 1] + 1
+        lengths = ends[indices] - starts + 1
+        # 大部分数只有一个字节，之后每轮只处理还没有读完的数
+        values = (data[starts] & 0x7F).astype(np.int64)
+        longer = np.flatnonzero(lengths > 1)
+        k = 1
+        while len(longer):
+            values[longer] = (values[longer] << 7) | (data[starts[longer] + k] & 0x7F)
+            k += 1
+            longer = longer[lengths[longer] > k]
+        return values
+
+    @staticmethod
+    def encode(postings_list):
+        """对升序的文档号列表做间距编码后再做 VB 编码"""
+        postings = np.asarray(postings_list, dtype=np.int64)
+        gaps = np.diff(postings, prepend=0)
+        return CompressedPostings.vb_encode(gaps)
+
+    @staticmethod
+    def decode(encoded_postings_list):
+        """解码为升序的文档号数组"""
+        return np.cumsum(CompressedPostings.vb_decode(encoded_postings_list))
+
+
+class ECCompressedPostings:
+    """间距 + gamma 编码，与 hw1 中的 ECCompressedPostings 相同（gap 先加 1 以排除 0）"""
+
+    name = "gamma"
+
+    @staticmethod
+    def gamma_encode(number):
+        """使用Gamma编码对单个数字进行编码。"""
+        binary = bin(int(number) + 1)[2:]
+        return "0" * (len(binary) - 1) + "1" + binary[1:]
+
+    @staticmethod
+    def gamma_decode(encoded_str, count):
+        gap_list = []
+        i = 0
+        while len(gap_list) < count:
+            zeros = 0
+            while encoded_str[i] == "0":
+                zeros += 1
+                i += 1
+            i += 1  # 跳过 '1'
+            gap_list.append(int("1" + encoded_str[i : i + zeros], 2) - 1)
+            i += zeros
+        return gap_list
+
+    @staticmethod
+    def encode(postings_list):
+        postings = np.asarray(postings_list, dtype=np.int64)
+        gaps = np.diff(postings, prepend=0)
+        bits = "".join(ECCompressedPostings.gamma_encode(gap) for gap in gaps)
+        bits = bits.ljust((len(bits) + 7) // 8 * 8, "0")  # 后面补0
+        return array.array(
+            "B", (int(bits[i : i + 8], 2) for i in range(0, len(bits), 8))
+        ).tobytes()
+
+    @staticmethod
+    def decode(encoded_postings_list, count):
+        bits = "".join(f"{byte:08b}" for byte in encoded_postings_list)
+        return np.cumsum(
+            np.array(ECCompressedPostings.gamma_decode(bits, count), dtype=np.int64)
+        )
+
+
+POSTINGS_ENCODINGS = {
+    CompressedPostings.name: CompressedPostings,
+    ECCompressedPostings.name: ECCompressedPostings,
+}
+
+
+# 权重量化
+def encode_weights(weights, weight_dtype):
+    """float32 直接保存；uint8 按词项内最大权重线性量化到 0~255"""
+    weights = np.asarray(weights, dtype=np.float32)
+    max_weight = float(weights.max()) if len(weights) else 0.0
+    if weight_dtype == "float32":
+        return weights.tobytes(), max_weight
+    if weight_dtype == "uint8":
+        scale = max_weight if max_weight > 0 else 1.0
+        quantized = np.rint(weights / scale * 255).astype(np.uint8)
+        return quantized.tobytes(), max_weight
+    raise ValueError(f"不支持的权重类型: {weight_dtype}")
+
+
+def decode_weights(data, weight_dtype, max_weight):
+    if weight_dtype == "float32":
+        return np.frombuffer(data, dtype=np.float32)
+    if weight_dtype == "uint8":
+        return np.frombuffer(data, dtype=np.uint8).astype(np.float32) * (
+            max_weight / 255
+        )
+    raise ValueError(f"不支持的权重类型: {weight_dtype}")
+
+
+def skip_table(doc_ids, doc_bytes, interval=SKIP_INTERVAL):
+    """VB 编码的文档号的跳表，不超过一块时返回 None"""
+    if len(doc_ids) <= interval:
+        return None
+    doc_ids = np.asarray(doc_ids, dtype=np.int64)
+    ends = np.flatnonzero(np.frombuffer(doc_bytes, dtype=np.uint8) & 0x80)
+    rows = np.arange(0, len(doc_ids), interval)
+    skips = np.zeros(len(rows), dtype=SKIP_DTYPE)
+    skips["doc_max"] = doc_ids[np.minimum(rows + interval, len(doc_ids)) - 1]
+    skips["base"][1:] = doc_ids[rows[1:] - 1]
+    skips["byte_offset"][1:] = ends[rows[1:] - 1] + 1
+    skips["row"] = rows
+    return skips
+
+
+def lookup_sorted(sorted_doc_ids, weights, doc_ids):
+    """在升序的 sorted_doc_ids 中查找 doc_ids，返回 (掩码, 找到的文档的权重)"""
+    if len(sorted_doc_ids) == 0:
+        return np.zeros(len(doc_ids), dtype=bool), np.zeros(0, dtype=np.float32)
+    rows = np.minimum(np.searchsorted(sorted_doc_ids, doc_ids), len(sorted_doc_ids) - 1)
+    found = sorted_doc_ids[rows] == doc_ids
+    return found, weights[rows[found]]
+
+
+def write_index_meta(output_dir, encoding="vb", weight_dtype="float32", **flags):
+    """flags 记录索引种类，如 positional=True（位置倒排索引）、segmented=True（分段索引）"""
+    meta = {"encoding": encoding, "weight_dtype": weight_dtype, **flags}
+    with open(os.path.join(output_dir, META_FILE), "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+
+
+def read_index_meta(index_dir):
+    with open(os.path.join(index_dir, META_FILE), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def is_binary_index(index_dir):
+    """目录中存在 index_meta.json 即视为二进制格式的索引"""
+    return os.path.exists(os.path.join(index_dir, META_FILE))
+
+
+def is_positional_index(index_dir):
+    if not is_binary_index(index_dir):
+        return False
+    return read_index_meta(index_dir).get("positional", False)
+
+
+# 位置倒排记录的编解码
+def encode_positional(doc_ids, tfs, positions):
+    """doc_ids 升序，tfs 为每个文档的词频，positions 为按文档依次拼接的升序位置"""
+    doc_ids = np.asarray(doc_ids, dtype=np.int64)
+    tfs = np.asarray(tfs, dtype=np.int64)
+    positions = np.asarray(positions, dtype=np.int64)
+    position_gaps = np.diff(positions, prepend=0)
+    doc_starts = np.cumsum(tfs) - tfs
+    position_gaps[doc_starts] = positions[doc_starts]
+    return CompressedPostings.vb_encode(
+        np.concatenate([np.diff(doc_ids, prepend=0), tfs, position_gaps])
+    )
+
+
+def decode_positional(data, df):
+    """返回 (文档号数组, 词频数组, 位置数组)"""
+    values = CompressedPostings.vb_decode(data)
+    doc_ids = np.cumsum(values[:df])
+    tfs = values[df : 2 * df]
+    position_gaps = values[2 * df :]
+    cumulative = np.cumsum(position_gaps)
+    doc_starts = np.cumsum(tfs) - tfs
+    # 每个文档的位置减去该文档之前的累计值
+    positions = cumulative - np.repeat(
+        cumulative[doc_starts] - position_gaps[doc_starts], tfs
+    )
+    return doc_ids, tfs, positions
+
+
+class PostingsWriter:
+    """写入一个分块的二进制倒排记录表，用法与 hw1 的 InvertedIndexWriter 类似
+
+    每个词项的位置信息登记到全局词典 dictionary（TermDictionaryWriter）中。
+    """
+
+    def __init__(
+        self, output_dir, chunk_key, dictionary, encoding="vb", weight_dtype="float32"
+    ):
+        self.postings_path = os.path.join(output_dir, chunk_key + POSTINGS_SUFFIX)
+        self.dictionary = dictionary
+        self.file_id = dictionary.add_file(chunk_key + POSTINGS_SUFFIX)
+        self.postings_encoding = POSTINGS_ENCODINGS[encoding]
+        self.weight_dtype = weight_dtype
+
+    def __enter__(self):
+        # 以 "wb" 打开，重复运行会覆盖而不是追加
+        self.postings_file = open(self.postings_path, "wb")
+        return self
+
+    def append(self, term, doc_ids, weights):
+        """写入一个词项，doc_ids 为升序且不重复的整数文档号"""
+        doc_bytes = self.postings_encoding.encode(doc_ids)
+        postings_format = LIST_POSTINGS
+        if len(doc_ids) > ARRAY_MAX:  # 覆盖大部分文档的词项用位图更小
+            bitmap_bytes = Bitmap.from_doc_ids(doc_ids).encode()
+            if len(bitmap_bytes) < len(doc_bytes):
+                doc_bytes, postings_format = bitmap_bytes, BITMAP_POSTINGS
+        weight_bytes, max_weight = encode_weights(weights, self.weight_dtype)
+        offset = self.postings_file.tell()
+        self.postings_file.write(doc_bytes)
+        self.postings_file.write(weight_bytes)
+        self.dictionary.add(
+            term,
+            self.file_id,
+            offset,
+            len(doc_ids),
+            len(doc_bytes),
+            len(doc_bytes) + len(weight_bytes),
+            max_weight,
+            (
+                skip_table(doc_ids, doc_bytes)
+                if self.postings_encoding.name == "vb"
+                and postings_format == LIST_POSTINGS
+                else None
+            ),
+            postings_format,
+        )
+
+    def __exit__(self, exception_type, exception_value, traceback):
+        self.postings_file.close()
+
+
+class PositionalPostingsWriter:
+    """写入一个位置倒排记录文件，词项登记到 dictionary 中，max_weight 字段保存最大词频"""
+
+    def __init__(self, output_dir, file_name, dictionary):
+        self.postings_path = os.path.join(output_dir, file_name + POSTINGS_SUFFIX)
+        self.dictionary = dictionary
+        self.file_id = dictionary.add_file(file_name + POSTINGS_SUFFIX)
+
+    def __enter__(self):
+        self.postings_file = open(self.postings_path, "wb")
+        return self
+
+    def append(self, term, doc_ids, tfs, positions):
+        data = encode_positional(doc_ids, tfs, positions)
+        offset = self.postings_file.tell()
+        self.postings_file.write(data)
+        self.dictionary.add(
+            term,
+            self.file_id,
+            offset,
+            len(doc_ids),
+            len(data),
+            len(data),
+            float(np.max(tfs)) if len(tfs) else 0.0,
+        )
+
+    def __exit__(self, exception_type, exception_value, traceback):
+        self.postings_file.close()
+
+
+class PositionalPostings:
+    """一个词项的位置倒排记录，先只解码文档号和词频，位置只对需要的文档解码
+
+    短语查询先用文档号求交集，高频词项的大部分位置不会被解码。
+    """
+
+    def __init__(self, data, df):
+        self.data = np.frombuffer(data, dtype=np.uint8)
+        self.ends = np.flatnonzero(self.data & 0x80)
+        head = CompressedPostings.vb_decode_at(self.data, self.ends, np.arange(2 * df))
+        self.doc_ids = np.cumsum(head[:df])
+        self.tfs = head[df:]
+        # 每个文档第一个位置在全部数值中的下标
+        self.position_starts = 2 * df + np.cumsum(self.tfs) - self.tfs
+
+    def __len__(self):
+        return len(self.doc_ids)
+
+    def positions(self, rows):
+        """rows 为文档在本记录中的下标，返回 (每个位置所属的 rows 下标, 位置)"""
+        rows = np.asarray(rows, dtype=np.int64)
+        tfs = self.tfs[rows]
+        total = int(tfs.sum())
+        if total == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        owners = np.repeat(np.arange(len(rows)), tfs)
+        doc_starts = np.cumsum(tfs) - tfs
+        offsets = np.repeat(self.position_starts[rows] - doc_starts, tfs)
+        gaps = CompressedPostings.vb_decode_at(
+            self.data, self.ends, offsets + np.arange(total)
+        )
+        # 位置间距在每个文档内重新从 0 开始
+        cumulative = np.cumsum(gaps)
+        positions = cumulative - np.repeat(
+            cumulative[doc_starts] - gaps[doc_starts], tfs
+        )
+        return owners, positions
+
+
+class PositionalPostingsReader:
+    """按词典读取位置倒排记录，迭代时按词项字典序依次返回，用于归并"""
+
+    def __init__(self, index_dir):
+        self.dictionary = TermDictionary(index_dir)
+        self.fds = [
+            os.open(os.path.join(index_dir, file_name), os.O_RDONLY)
+            for file_name in self.dictionary.files
+        ]
+
+    def close(self):
+        for fd in self.fds:
+            os.close(fd)
+        self.fds = []
+
+    def __del__(self):
+        self.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exception_type, exception_value, traceback):
+        self.close()
+
+    def __len__(self):
+        return len(self.dictionary)
+
+    def read(self, i):
+        """按词典下标读取，返回 (文档号数组, 词频数组, 位置数组)"""
+        entry = self.dictionary.entry(i)
+        data = os.pread(
+            self.fds[int(entry["file_id"])], int(entry["length"]), int(entry["offset"])
+        )
+        return decode_positional(data, int(entry["df"]))
+
+    def lazy(self, term):
+        """返回词项的 PositionalPostings，词项不存在时返回 None"""
+        i = self.dictionary.lookup(term)
+        if i < 0:
+            return None
+        entry = self.dictionary.entry(i)
+        data = os.pread(
+            self.fds[int(entry["file_id"])], int(entry["length"]), int(entry["offset"])
+        )
+        return PositionalPostings(data, int(entry["df"]))
+
+    def __getitem__(self, term):
+        i = self.dictionary.lookup(term)
+        if i < 0:
+            raise KeyError(term)
+        return self.read(i)
+
+    def __iter__(self):
+        """依次返回 (词项, 文档号数组, 词频数组, 位置数组)"""
+        for i in range(len(self.dictionary)):
+            yield (self.dictionary.term(i), *self.read(i))
+
+
+class PostingsReader:
+    """通过全局词典读取倒排记录，每个词项只做一次二分查找和一次 pread"""
+
+    def __init__(self, index_dir):
+        meta = read_index_meta(index_dir)
+        self.postings_encoding = POSTINGS_ENCODINGS[meta["encoding"]]
+        self.weight_dtype = meta["weight_dtype"]
+        self.dictionary = TermDictionary(index_dir)
+        self.wildcard_index = (
+            WildcardIndex(index_dir, self.dictionary)
+            if has_wildcard_index(index_dir)
+            else None
+        )
+        self.fds = [
+            os.open(os.path.join(index_dir, file_name), os.O_RDONLY)
+            for file_name in self.dictionary.files
+        ]
+        self.maps = {}  # file_id -> 内存映射，只在按跳表查找时打开
+
+    def close(self):
+        for fd in self.fds:
+            os.close(fd)
+        self.fds = []
+        self.maps = {}
+
+    def __del__(self):
+        self.close()
+
+    def __contains__(self, term):
+        return self.dictionary.lookup(term) >= 0
+
+    def is_stale(self):
+        """单个目录的索引重新构建时整体替换，读取器本身不会过期"""
+        return False
+
+    def positional_postings(self, term):
+        """单目录索引不记录位置倒排索引，不支持短语和 NEAR 查询"""
+        raise ValueError("该索引没有位置信息，不支持短语和 NEAR 查询")
+
+    def keys(self, prefix=""):
+        """返回以 prefix 开头的全部词项（默认返回全部词项）"""
+        return self.dictionary.terms_with_prefix(prefix)
+
+    def df(self, term):
+        i = self.dictionary.lookup(term)
+        return int(self.dictionary.entry(i)["df"]) if i >= 0 else 0
+
+    def read(self, i):
+        """按词典下标读取，返回 (文档号数组, 权重数组)"""
+        entry = self.dictionary.entry(i)
+        doc_length = int(entry["doc_length"])
+        data = os.pread(
+            self.fds[int(entry["file_id"])], int(entry["length"]), int(entry["offset"])
+        )
+        if self.dictionary.postings_format(i) == BITMAP_POSTINGS:
+            doc_ids = decode_bitmap(data[:doc_length]).to_array()
+        elif self.postings_encoding is ECCompressedPostings:
+            doc_ids = self.postings_encoding.decode(data[:doc_length], int(entry["df"]))
+        else:
+            doc_ids = self.postings_encoding.decode(data[:doc_length])
+        weights = decode_weights(
+            data[doc_length:], self.weight_dtype, float(entry["max_weight"])
+        )
+        return doc_ids, weights
+
+    def __getitem__(self, term):
+        i = self.dictionary.lookup(term)
+        if i < 0:
+            raise KeyError(term)
+        return self.read(i)
+
+    def postings_map(self, file_id):
+        if file_id not in self.maps:
+            self.maps[file_id] = np.memmap(
+                os.path.join(self.dictionary.index_dir, self.dictionary.files[file_id]),
+                dtype=np.uint8,
+                mode="r",
+            )
+        return self.maps[file_id]
+
+    def lookup_docs(self, term, doc_ids):
+        """在查询词（可含通配符）的倒排记录中查找升序的 doc_ids，返回 (掩码, 找到的文档的权重)
+
+        以位图保存的词项只读取涉及的容器并按位测试；有跳表时只解码可能包含 doc_ids 的块。
+        两种情况都只读取找到的文档的权重，耗时和内存与 doc_ids 的个数成正比，
+        而不是与倒排记录的长度成正比。
+        """
+        doc_ids = np.asarray(doc_ids, dtype=np.int64)
+        i = -1 if is_wildcard(term) else self.dictionary.lookup(term)
+        is_bitmap = i >= 0 and self.dictionary.postings_format(i) == BITMAP_POSTINGS
+        skips = self.dictionary.skip_table(i) if i >= 0 else None
+        if (skips is None and not is_bitmap) or len(doc_ids) == 0:
+            term_doc_ids, weights, _ = self.postings(term)
+            return lookup_sorted(term_doc_ids, weights, doc_ids)
+
+        entry = self.dictionary.entry(i)
+        offset, doc_length = int(entry["offset"]), int(entry["doc_length"])
+        data = self.postings_map(int(entry["file_id"]))
+        if is_bitmap:
+            found, rows = lookup_bitmap(data[offset : offset + doc_length], doc_ids)
+        else:
+            found, rows = self.lookup_blocks(entry, skips, data, doc_ids)
+        # 权重紧接在文档号之后，按序号只读取找到的文档的权重
+        itemsize = np.dtype(self.weight_dtype).itemsize
+        weight_bytes = (
+            offset + doc_length + rows[:, None] * itemsize + np.arange(itemsize)
+        )
+        weights = decode_weights(
+            data[weight_bytes.ravel()].tobytes(),
+            self.weight_dtype,
+            float(entry["max_weight"]),
+        )
+        return found, weights
+
+    def lookup_blocks(self, entry, skips, data, doc_ids):
+        """按跳表在间距编码的记录中查找 doc_ids，返回 (掩码, 找到的文档的序号)"""
+        offset, df = int(entry["offset"]), int(entry["df"])
+        doc_length = int(entry["doc_length"])
+        # 每个文档可能所在的块：第一个 doc_max 不小于它的块
+        blocks = np.searchsorted(skips["doc_max"], doc_ids)
+        blocks = np.unique(blocks[blocks < len(skips)])
+        if len(blocks) == 0:
+            return np.zeros(len(doc_ids), dtype=bool), np.zeros(0, dtype=np.int64)
+
+        # 只读取并解码这些块：块内间距的前缀和加上块的基准即为文档号
+        byte_offsets = np.append(skips["byte_offset"].astype(np.int64), doc_length)
+        byte_counts = byte_offsets[blocks + 1] - byte_offsets[blocks]
+        byte_rows = np.repeat(
+            byte_offsets[blocks] - (np.cumsum(byte_counts) - byte_counts), byte_counts
+        ) + np.arange(int(byte_counts.sum()))
+        gaps = CompressedPostings.vb_decode(data[offset + byte_rows].tobytes())
+        rows = np.append(skips["row"].astype(np.int64), df)
+        counts = rows[blocks + 1] - rows[blocks]
+        block_starts = np.cumsum(counts) - counts
+        sums = np.cumsum(gaps)
+        block_doc_ids = sums - np.repeat(
+            sums[block_starts] - gaps[block_starts] - skips["base"][blocks], counts
+        )
+        block_rows = np.repeat(rows[blocks] - block_starts, counts) + np.arange(
+            len(gaps)
+        )
+
+        return lookup_sorted(block_doc_ids, block_rows, doc_ids)
+
+    def bitmap(self, term):
+        """以位图保存的词项返回其 Bitmap，不存在的词项返回空位图，其余返回 None"""
+        if is_wildcard(term):
+            return None
+        i = self.dictionary.lookup(term)
+        if i < 0:
+            return Bitmap()
+        if self.dictionary.postings_format(i) != BITMAP_POSTINGS:
+            return None
+        entry = self.dictionary.entry(i)
+        data = os.pread(
+            self.fds[int(entry["file_id"])],
+            int(entry["doc_length"]),
+            int(entry["offset"]),
+        )
+        return decode_bitmap(data)
+
+    def match(self, pattern):
+        """返回与通配符模式匹配的词典下标"""
+        if self.wildcard_index is not None:
+            return self.wildcard_index.match(pattern)
+        # 没有 k-gram 索引时退化为扫描通配符之前的前缀范围
+        literal_prefix = re.split(r"[*?]", pattern, maxsplit=1)[0]
+        lo, hi = self.dictionary.prefix_range(literal_prefix)
+        regex = re.compile(wildcard_to_regex(pattern))
+        return np.array(
+            [i for i in range(lo, hi) if regex.match(self.dictionary.term(i))],
+            dtype=np.int64,
+        )
+
+    def term_ids(self, term):
+        """查询词（可含通配符）对应的词典下标
+
+        精确查询只做一次词典二分查找；通配符查询经 k-gram 索引找到匹配词。
+        """
+        if is_wildcard(term):
+            return self.match(term)
+        term_id = self.dictionary.lookup(term)
+        return [term_id] if term_id >= 0 else []
+
+    def postings(self, term):
+        """返回查询词（可含通配符）的 (文档号数组, 权重数组, 权重上界)
+
+        通配符查询合并所有匹配词的倒排记录。
+        """
+        term_ids = self.term_ids(term)
+        doc_ids, weights = self.union(term_ids)
+        return doc_ids, weights, self.max_weight(term_ids)
+
+    def term_stats(self, term):
+        """只读词典、不解码倒排记录，返回查询词的 (df, 权重上界)
+
+        通配符查询的 df 为各匹配词的 df 之和，是合并后记录条数的上限。
+        """
+        term_ids = self.term_ids(term)
+        if len(term_ids) == 0:
+            return 0, 0.0
+        df = int(self.dictionary.entries["df"][np.asarray(term_ids)].sum())
+        return df, self.max_weight(term_ids)
+
+    def max_weight(self, term_ids):
+        """多个词项最大权重中的最大值，作为 top-k 剪枝的得分上界"""
+        if len(term_ids) == 0:
+            return 0.0
+        return float(self.dictionary.entries["max_weight"][np.asarray(term_ids)].max())
+
+    def union(self, term_ids):
+        """合并多个词项的倒排记录，同一文档保留后出现词项的权重"""
+        if len(term_ids) == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        if len(term_ids) == 1:
+            return self.read(int(term_ids[0]))
+        postings = [self.read(int(i)) for i in term_ids]
+        doc_ids = np.concatenate([p[0] for p in postings])
+        weights = np.concatenate([p[1] for p in postings])
+        # 反转后取每个文档第一次出现的位置，即原顺序中最后一次出现
+        unique_ids, first = np.unique(doc_ids[::-1], return_index=True)
+        return unique_ids, weights[::-1][first]
+
+
+# 将旧的 JSON 分块转换为二进制格式
+def convert_json_chunks(json_dir, output_dir, encoding="vb", weight_dtype="float32"):
+    """读取 [[doc_id, tf_idf], ...] 形式的 JSON 分块并写成二进制格式"""
+    os.makedirs(output_dir, exist_ok=True)
+    dictionary = TermDictionaryWriter(output_dir)
+    for file_name in shard_files(json_dir):
+        if file_name == META_FILE:
+            continue
+        with open(os.path.join(json_dir, file_name), "r", encoding="utf-8") as f:
+            tf_idf_data = json.load(f)
+        chunk_key = file_name[: -len(".json")]
+        with PostingsWriter(
+            output_dir, chunk_key, dictionary, encoding, weight_dtype
+        ) as writer:
+            for term, postings in tf_idf_data.items():
+                # 同一文档出现多次时保留最后一条，与查询端构建字典时的覆盖行为一致
+                doc_weights = {int(doc_id): weight for doc_id, weight in postings}
+                doc_ids = sorted(doc_weights)
+                writer.append(term, doc_ids, [doc_weights[d] for d in doc_ids])
+        print(f"转换完成: {chunk_key}")
+    dictionary.close()
+    build_wildcard_index(output_dir)
+    write_index_meta(output_dir, encoding, weight_dtype)
+
+
+if __name__ == "__main__":
+    # 将已有的 JSON 格式 TF-IDF 分块转换为二进制格式
+    convert_json_chunks("./tf_idf_chunks", "./tf_idf_chunks_bin")
@@ -0,0 +1,216 @@
+import numpy as np
+
+# 压缩位图（Roaring 位图的简化实现）
+#
+# 文档号按高 16 位分成若干个容器，每个容器保存低 16 位：
+#   数组容器  元素不超过 ARRAY_MAX 个时为升序的 uint16 数组，每个文档 2 字节
+#   位图容器  元素更多时为 65536 位的位图（1024 个 uint64，8 KB）
+# 覆盖大部分文档的词项（如 南开、大学 以及每个网页都有的导航栏文字）用位图保存比 VB 编码更小，
+# 求交集时两个位图容器直接按位与，数组容器与位图容器之间按位测试，不必逐个比较文档号。
+#
+# 序列化格式：容器个数（uint32） + 目录（见 CONTAINER_DTYPE） + 各容器的内容。
+# 目录中记录每个容器之前的元素个数（rank），查找少量文档时只读取涉及的容器，
+# 并可直接算出文档在倒排记录中的序号，用于读取对应的权重。
+
+ARRAY_MAX = 4096  # 数组容器的最大元素个数，超过时数组比位图更大
+CONTAINER_SIZE = 1 << 16
+BITMAP_WORDS = CONTAINER_SIZE // 64
+
+CONTAINER_DTYPE = np.dtype(
+    [
+        ("key", np.uint32),  # 文档号的高 16 位
+        ("cardinality", np.uint32),  # 元素个数，超过 ARRAY_MAX 的为位图容器
+        ("offset", np.uint32),  # 容器内容相对目录末尾的字节偏移
+        ("rank", np.uint32),  # 之前各容器的元素个数之和
+    ]
+)
+
+
+# 单个容器
+def is_bitmap_container(container):
+    return container.dtype == np.uint64
+
+
+def make_container(low):
+    """low 为升序的低 16 位，元素多时转为位图容器"""
+    if len(low) <= ARRAY_MAX:
+        return np.asarray(low, dtype=np.uint16)
+    bits = np.zeros(CONTAINER_SIZE, dtype=bool)
+    bits[low] = True
+    return np.packbits(bits, bitorder="little").view(np.uint64)
+
+
+def container_cardinality(container):
+    if is_bitmap_container(container):
+        return int(np.bitwise_count(container).sum())
+    return len(container)
+
+
+def container_values(container):
+    if is_bitmap_container(container):
+        bits = np.unpackbits(container.view(np.uint8), bitorder="little")
+        return np.flatnonzero(bits)
+    return container.astype(np.int64)
+
+
+def container_contains(container, low):
+    """low 中每个值是否在容器中"""
+    low = np.asarray(low, dtype=np.int64)
+    if is_bitmap_container(container):
+        words = container[low >> 6]
+        return ((words >> (low & 63).astype(np.uint64)) & np.uint64(1)).astype(bool)
+    if len(container) == 0:
+        return np.zeros(len(low), dtype=bool)
+    pos = np.minimum(np.searchsorted(container, low), len(container) - 1)
+    return container[pos] == low
+
+
+def container_rank(container, low):
+    """low 中每个值之前（不含）的元素个数"""
+    low = np.asarray(low, dtype=np.int64)
+    if not is_bitmap_container(container):
+        return np.searchsorted(container, low)
+    word_counts = np.bitwise_count(container).astype(np.int64)
+    before = np.concatenate([[0], np.cumsum(word_counts)])[low >> 6]
+    masks = (np.uint64(1) << (low & 63).astype(np.uint64)) - np.uint64(1)
+    return before + np.bitwise_count(container[low >> 6] & masks).astype(np.int64)
+
+
+def and_containers(a, b):
+    """按容器类型选择求交集的方法"""
+    if is_bitmap_container(a) and is_bitmap_container(b):
+        words = a & b
+        if int(np.bitwise_count(words).sum()) > ARRAY_MAX:
+            return words
+        return container_values(words).astype(np.uint16)
+    if is_bitmap_container(a):
+        a, b = b, a
+    if is_bitmap_container(b):  # 数组与位图：按位测试
+        return a[container_contains(b, a)]
+    return np.intersect1d(a, b, assume_unique=True)
+
+
+def or_containers(a, b):
+    if is_bitmap_container(a) or is_bitmap_container(b):
+        if not is_bitmap_container(a):
+            a, b = b, a
+        words = a.copy()
+        if is_bitmap_container(b):
+            words |= b
+        else:
+            low = b.astype(np.int64)
+            np.bitwise_or.at(
+                words, low >> 6, np.uint64(1) << (low & 63).astype(np.uint64)
+            )
+        return words
+    return make_container(np.union1d(a, b))
+
+
+class Bitmap:
+    """containers 为 {高 16 位: 容器}"""
+
+    def __init__(self, containers=None):
+        self.containers = dict(sorted((containers or {}).items()))
+
+    @classmethod
+    def from_doc_ids(cls, doc_ids):
+        """doc_ids 为升序且不重复的文档号"""
+        doc_ids = np.asarray(doc_ids, dtype=np.int64)
+        keys, starts = np.unique(doc_ids >> 16, return_index=True)
+        stops = np.append(starts[1:], len(doc_ids))
+        return cls(
+            {
+                int(key): make_container(doc_ids[start:stop] & 0xFFFF)
+                for key, start, stop in zip(keys, starts, stops)
+            }
+        )
+
+    def __len__(self):
+        return sum(container_cardinality(c) for c in self.containers.values())
+
+    def to_array(self):
+        """升序的文档号数组"""
+        parts = [np.zeros(0, dtype=np.int64)]
+        for key, container in self.containers.items():
+            parts.append((key << 16) + container_values(container))
+        return np.concatenate(parts)
+
+    def __and__(self, other):
+        containers = {}
+        for key in self.containers.keys() & other.containers.keys():
+            container = and_containers(self.containers[key], other.containers[key])
+            if len(container):
+                containers[key] = container
+        return Bitmap(containers)
+
+    def __or__(self, other):
+        containers = dict(self.containers)
+        for key, container in other.containers.items():
+            if key in containers:
+                containers[key] = or_containers(containers[key], container)
+            else:
+                containers[key] = container
+        return Bitmap(containers)
+
+    def encode(self):
+        directory = np.zeros(len(self.containers), dtype=CONTAINER_DTYPE)
+        payloads = []
+        offset = rank = 0
+        for i, (key, container) in enumerate(self.containers.items()):
+            cardinality = container_cardinality(container)
+            directory[i] = (key, cardinality, offset, rank)
+            payloads.append(container.tobytes())
+            offset += len(payloads[-1])
+            rank += cardinality
+        header = np.uint32(len(self.containers)).tobytes() + directory.tobytes()
+        return header + b"".join(payloads)
+
+
+# 从序列化的字节读取
+def read_directory(data):
+    """data 为 uint8 数组，返回 (目录, 容器内容的起始下标)"""
+    count = int(data[:4].view(np.uint32)[0])
+    end = 4 + count * CONTAINER_DTYPE.itemsize
+    return data[4:end].view(CONTAINER_DTYPE), end
+
+
+def read_container(data, payload_start, record):
+    start = payload_start + int(record["offset"])
+    if int(record["cardinality"]) > ARRAY_MAX:
+        return data[start : start + BITMAP_WORDS * 8].view(np.uint64)
+    return data[start : start + int(record["cardinality"]) * 2].view(np.uint16)
+
+
+def decode_bitmap(data):
+    """data 为 bytes 或 uint8 数组"""
+    data = np.frombuffer(data, dtype=np.uint8) if isinstance(data, bytes) else data
+    directory, payload_start = read_directory(data)
+    return Bitmap(
+        {
+            int(record["key"]): read_container(data, payload_start, record)
+            for record in directory
+        }
+    )
+
+
+def lookup_bitmap(data, doc_ids):
+    """在序列化的位图中查找升序的 doc_ids，返回 (掩码, 找到的文档的序号)，只读取涉及的容器"""
+    doc_ids = np.asarray(doc_ids, dtype=np.int64)
+    directory, payload_start = read_directory(data)
+    found = np.zeros(len(doc_ids), dtype=bool)
+    rows = np.zeros(len(doc_ids), dtype=np.int64)
+    if len(directory) == 0 or len(doc_ids) == 0:
+        return found, rows[:0]
+    keys = directory["key"].astype(np.int64)
+    # doc_ids 升序，同一容器的文档是连续的一段
+    doc_keys = doc_ids >> 16
+    bounds = np.searchsorted(doc_keys, keys)
+    stops = np.searchsorted(doc_keys, keys, side="right")
+    for record, start, stop in zip(directory, bounds, stops):
+        if start == stop:
+            continue
+        container = read_container(data, payload_start, record)
+        low = doc_ids[start:stop] & 0xFFFF
+        found[start:stop] = container_contains(container, low)
+        rows[start:stop] = int(record["rank"]) + container_rank(container, low)
+    return found, rows[found]
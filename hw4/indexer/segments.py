@@ -0,0 +1,414 @@
+import os
+import json
+import time
+import shutil
+import threading
+import contextlib
+from functools import reduce
+from operator import or_
+import numpy as np
+from postings import PostingsReader, PositionalPostingsReader, write_index_meta
+
+# 分段索引
+#
+# 每种索引的 TF-IDF 目录由若干不可变的段组成：
+#   segments.json          段列表（按文档号顺序）、删除位图文件名和版本号，每次提交整体原子替换
+#   tombstones_<版本>.npy  已删除文档的位图（np.packbits，下标为文档号）
+#   seg_<编号>/            一个段的 TF-IDF 倒排记录（PostingsReader 格式）和 doc_lengths.npy
+# 每个段的位置倒排索引保存在段内的 positional/ 子目录中，合并段时据此重新计算权重。
+# 全量构建只有一个段，其位置倒排索引从 build_index.py 的输出目录硬链接（跨文件系统时复制）到段内，
+# 重新构建不会改动已发布版本引用的文件；
+# 增量更新的文档写成新段，被替换或删除的旧文档记入删除位图，段数增多后由合并策略合并相邻的段。
+# 使用版本时（见 index_versions.py），每次提交前先把当前版本硬链接为新版本，在新版本中提交后再切换。
+
+SEGMENTS_FILE = "segments.json"
+LOCK_FILE = "segments.lock"
+DOC_LENGTHS_FILE = "doc_lengths.npy"
+SEGMENT_PREFIX = "seg_"
+POSITIONAL_DIR = "positional"  # 段内位置倒排索引的子目录
+LOCK_TIMEOUT = 60  # 等待提交锁的最长秒数
+
+
+def is_segmented_index(index_dir):
+    return os.path.exists(os.path.join(index_dir, SEGMENTS_FILE))
+
+
+def segment_name(segment_number):
+    return f"{SEGMENT_PREFIX}{segment_number:06d}"
+
+
+def read_manifest(index_dir):
+    with open(os.path.join(index_dir, SEGMENTS_FILE), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def write_manifest(index_dir, manifest):
+    """先写临时文件再 os.replace，读取方要么看到旧版本，要么看到新版本"""
+    tmp_path = os.path.join(index_dir, SEGMENTS_FILE + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=4)
+    os.replace(tmp_path, os.path.join(index_dir, SEGMENTS_FILE))
+
+
+@contextlib.contextmanager
+def manifest_lock(index_dir):
+    """增量更新与后台合并都要修改 segments.json，用独占创建的锁文件串行化提交"""
+    lock_path = os.path.join(index_dir, LOCK_FILE)
+    deadline = time.time() + LOCK_TIMEOUT
+    while True:
+        try:
+            fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            break
+        except FileExistsError:
+            if time.time() > deadline:
+                raise TimeoutError(f"等待分段索引锁超时: {lock_path}")
+            time.sleep(0.05)
+    try:
+        yield
+    finally:
+        os.close(fd)
+        os.remove(lock_path)
+
+
+# 段信息
+def segment_info(name, positional_dir, doc_ids):
+    """positional_dir 为相对段目录的路径"""
+    return {
+        "name": name,
+        "positional": positional_dir,
+        "num_docs": int(len(doc_ids)),
+        "doc_min": int(doc_ids.min()) if len(doc_ids) else 0,
+        "doc_max": int(doc_ids.max()) if len(doc_ids) else 0,
+    }
+
+
+def link_or_copy(source, target):
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copy2(source, target)
+
+
+def link_positional_index(source_dir, seg_dir):
+    """把位置倒排索引硬链接到段内，返回段内的相对路径
+
+    硬链接的文件与源文件共用数据，build_index.py 重新构建前会先删除输出目录再写新文件，
+    不会在原文件上覆盖。
+    """
+    shutil.copytree(
+        source_dir, os.path.join(seg_dir, POSITIONAL_DIR), copy_function=link_or_copy
+    )
+    return POSITIONAL_DIR
+
+
+def clone_index(source_dir, target_dir):
+    """把分段索引硬链接到新目录
+
+    段和删除位图写好后不再修改，segments.json 提交时整体替换，链接的文件不会被改动；
+    其他进程正在写的临时段（tmp_ 开头）和锁文件不复制。
+    """
+    shutil.copytree(
+        source_dir,
+        target_dir,
+        copy_function=link_or_copy,
+        ignore=shutil.ignore_patterns(LOCK_FILE, "tmp_*", "*.tmp"),
+    )
+
+
+def segment_dir(index_dir, segment):
+    return os.path.join(index_dir, segment["name"])
+
+
+def segment_positional_dir(index_dir, segment):
+    return os.path.normpath(
+        os.path.join(segment_dir(index_dir, segment), segment["positional"])
+    )
+
+
+def load_segment_doc_lengths(index_dir, segment):
+    """返回 (文档号数组, 文档长度数组)"""
+    data = np.load(os.path.join(segment_dir(index_dir, segment), DOC_LENGTHS_FILE))
+    return data[:, 0], data[:, 1]
+
+
+# 删除位图
+def load_tombstones(index_dir, manifest):
+    """返回以文档号为下标的 bool 数组，True 表示已删除"""
+    if not manifest.get("tombstones"):
+        return np.zeros(0, dtype=bool)
+    packed = np.load(os.path.join(index_dir, manifest["tombstones"]))
+    return np.unpackbits(packed).astype(bool)
+
+
+def save_tombstones(index_dir, manifest, tombstones):
+    """写入新版本的位图文件，返回文件名；旧文件在提交后删除"""
+    file_name = f"tombstones_{manifest['generation']:06d}.npy"
+    np.save(os.path.join(index_dir, file_name), np.packbits(tombstones))
+    return file_name
+
+
+def mark_deleted(tombstones, doc_numbers):
+    doc_numbers = np.asarray(doc_numbers, dtype=np.int64)
+    if len(doc_numbers) == 0:
+        return tombstones
+    size = max(len(tombstones), int(doc_numbers.max()) + 1)
+    if size > len(tombstones):
+        padding = np.zeros(size - len(tombstones), dtype=bool)
+        tombstones = np.concatenate([tombstones, padding])
+    tombstones[doc_numbers] = True
+    return tombstones
+
+
+def is_deleted(tombstones, doc_ids):
+    deleted = np.zeros(len(doc_ids), dtype=bool)
+    in_range = doc_ids < len(tombstones)
+    deleted[in_range] = tombstones[doc_ids[in_range]]
+    return deleted
+
+
+def live_doc_lengths(index_dir, segments, tombstones):
+    """各段中未删除文档的长度，用于计算平均文档长度"""
+    live_lengths = [np.zeros(0, dtype=np.int64)]
+    for segment in segments:
+        doc_ids, lengths = load_segment_doc_lengths(index_dir, segment)
+        live_lengths.append(lengths[~is_deleted(tombstones, doc_ids)])
+    return np.concatenate(live_lengths)
+
+
+def live_doc_count(index_dir, segment, tombstones):
+    doc_ids, _ = load_segment_doc_lengths(index_dir, segment)
+    return int(len(doc_ids) - is_deleted(tombstones, doc_ids).sum())
+
+
+# 提交一次修改
+def commit(index_dir, update):
+    """在锁内读取当前的 segments.json，交给 update(manifest, tombstones) 修改后写回
+
+    update 返回新的 (manifest, tombstones)；tombstones 为 None 表示删除位图不变。
+    返回不再被引用、可以删除的段目录和旧位图文件。
+    """
+    with manifest_lock(index_dir):
+        manifest = read_manifest(index_dir)
+        old_segments = {segment["name"] for segment in manifest["segments"]}
+        old_tombstones = manifest.get("tombstones")
+        manifest, tombstones = update(manifest, load_tombstones(index_dir, manifest))
+        manifest["generation"] += 1
+        if tombstones is not None:
+            manifest["tombstones"] = save_tombstones(index_dir, manifest, tombstones)
+        write_manifest(index_dir, manifest)
+
+    garbage = [
+        os.path.join(index_dir, name)
+        for name in old_segments - {segment["name"] for segment in manifest["segments"]}
+    ]
+    if old_tombstones and old_tombstones != manifest.get("tombstones"):
+        garbage.append(os.path.join(index_dir, old_tombstones))
+    return garbage
+
+
+def install_segment(index_dir, manifest, tmp_dir):
+    """在提交锁内把写好的临时目录改名为下一个段名，返回段名"""
+    name = segment_name(manifest["next_segment"])
+    manifest["next_segment"] += 1
+    target = os.path.join(index_dir, name)
+    # 未出现在 segments.json 中的同名目录是上次提交中断时留下的
+    shutil.rmtree(target, ignore_errors=True)
+    os.rename(tmp_dir, target)
+    return name
+
+
+def remove_garbage(paths):
+    """已打开的读取器在 Linux 上不受影响；Windows 上删除失败的文件留到下次合并"""
+    for path in paths:
+        if os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+        elif os.path.exists(path):
+            with contextlib.suppress(OSError):
+                os.remove(path)
+
+
+# 全量构建：重置为只有一个段的分段索引
+def create_segmented_index(
+    index_dir, segment, total_docs, encoding, weight_dtype, weighting
+):
+    manifest = {
+        "generation": 0,
+        "next_segment": 1,
+        "total_docs": int(total_docs),
+        "tombstones": None,
+        "segments": [segment],
+    }
+    write_manifest(index_dir, manifest)
+    write_index_meta(
+        index_dir, encoding, weight_dtype, segmented=True, weighting=weighting
+    )
+
+
+def reset_index_dir(index_dir):
+    """全量构建前清空旧的分段、位图以及旧版本的单目录索引"""
+    if os.path.isdir(index_dir):
+        shutil.rmtree(index_dir)
+    os.makedirs(index_dir)
+
+
+# 合并策略
+def find_merges(segments, live_counts, merge_factor, max_deleted_ratio):
+    """返回需要合并的相邻段下标区间 [(start, stop), ...]
+
+    与 Lucene 的 LogMergePolicy 类似：按文档数的数量级分层，
+    同一层中连续的 merge_factor 个段合并为一个；已删除比例过高的段单独重写以回收空间。
+    只合并相邻的段，保证合并后各段的文档号区间仍互不交错。
+    """
+    merges = []
+    tiers = [
+        int(np.log(max(count, 1)) / np.log(merge_factor)) for count in live_counts
+    ]
+    i = 0
+    while i < len(segments):
+        j = i
+        while j < len(segments) and tiers[j] == tiers[i]:
+            j += 1
+        for start in range(i, j - merge_factor + 1, merge_factor):
+            merges.append((start, start + merge_factor))
+        i = j
+
+    merged = {k for start, stop in merges for k in range(start, stop)}
+    for k, segment in enumerate(segments):
+        if k in merged or segment["num_docs"] == 0:
+            continue
+        deleted_ratio = 1 - live_counts[k] / segment["num_docs"]
+        if deleted_ratio > max_deleted_ratio:
+            merges.append((k, k + 1))
+    return sorted(merges)
+
+
+def manifest_stat(index_dir):
+    """os.replace 会换成新的文件，比较 inode 和修改时间即可发现新的提交"""
+    stat = os.stat(os.path.join(index_dir, SEGMENTS_FILE))
+    return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+
+class SegmentedPostingsReader:
+    """依次读取所有存活段并过滤已删除文档，接口与 PostingsReader 的查询部分一致"""
+
+    def __init__(self, index_dir):
+        self.index_dir = index_dir
+        self.manifest_stat = manifest_stat(index_dir)  # 先取状态再读取，不会漏掉新提交
+        self.manifest = read_manifest(index_dir)
+        self.tombstones = load_tombstones(index_dir, self.manifest)
+        # 段按文档号顺序排列，各段结果直接拼接即为升序
+        self.segments = [
+            PostingsReader(segment_dir(index_dir, segment))
+            for segment in self.manifest["segments"]
+        ]
+        # 位置倒排索引只在第一次短语或 NEAR 查询时打开
+        self.positional_readers = None
+        self.positional_lock = threading.Lock()
+
+    def close(self):
+        for reader in self.segments:
+            reader.close()
+        for reader in self.positional_readers or []:
+            reader.close()
+
+    def is_stale(self):
+        """segments.json 被替换后需要重新打开"""
+        try:
+            return manifest_stat(self.index_dir) != self.manifest_stat
+        except FileNotFoundError:
+            return True
+
+    def __contains__(self, term):
+        return any(term in reader for reader in self.segments)
+
+    def keys(self, prefix=""):
+        if len(self.segments) == 1:
+            return self.segments[0].keys(prefix)
+        return sorted(set().union(*(reader.keys(prefix) for reader in self.segments)))
+
+    def df(self, term):
+        return sum(reader.df(term) for reader in self.segments)
+
+    def term_stats(self, term):
+        """与 PostingsReader.term_stats 相同，df 包括已删除但尚未合并掉的文档"""
+        stats = [reader.term_stats(term) for reader in self.segments]
+        if not stats:
+            return 0, 0.0
+        return sum(df for df, _ in stats), max(bound for _, bound in stats)
+
+    def open_positional_readers(self):
+        with self.positional_lock:
+            if self.positional_readers is None:
+                positional_dirs = [
+                    segment_positional_dir(self.index_dir, segment)
+                    for segment in self.manifest["segments"]
+                ]
+                missing = [path for path in positional_dirs if not os.path.isdir(path)]
+                if missing:
+                    raise ValueError(
+                        f"位置倒排索引不存在，不支持短语和 NEAR 查询: {missing}"
+                    )
+                self.positional_readers = [
+                    PositionalPostingsReader(path) for path in positional_dirs
+                ]
+        return self.positional_readers
+
+    def positional_postings(self, term):
+        """返回每个段中该词项的 PositionalPostings（不存在时为 None）
+
+        段内的位置倒排索引可能包含之后删除的文档，调用方用 live 过滤。
+        """
+        return [reader.lazy(term) for reader in self.open_positional_readers()]
+
+    def live(self, doc_ids):
+        """未删除文档的掩码"""
+        return ~is_deleted(self.tombstones, doc_ids)
+
+    def postings(self, term):
+        """返回 (文档号数组, 权重数组, 权重上界)，已删除的文档不会出现"""
+        parts = [reader.postings(term) for reader in self.segments]
+        parts = [part for part in parts if len(part[0])]
+        if not parts:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32), 0.0
+        doc_ids = np.concatenate([part[0] for part in parts])
+        weights = np.concatenate([part[1] for part in parts])
+        upper_bound = max(part[2] for part in parts)
+        live = ~is_deleted(self.tombstones, doc_ids)
+        return doc_ids[live], weights[live], upper_bound
+
+    def lookup_docs(self, term, doc_ids):
+        """与 PostingsReader.lookup_docs 相同，doc_ids 按各段的文档号范围分给对应的段"""
+        doc_ids = np.asarray(doc_ids, dtype=np.int64)
+        found = np.zeros(len(doc_ids), dtype=bool)
+        parts = [np.zeros(0, dtype=np.float32)]
+        for segment, reader in zip(self.manifest["segments"], self.segments):
+            lo = np.searchsorted(doc_ids, segment.get("doc_min", 0))
+            hi = np.searchsorted(doc_ids, segment.get("doc_max", np.inf), side="right")
+            if lo == hi:
+                continue
+            segment_found, weights = reader.lookup_docs(term, doc_ids[lo:hi])
+            found[lo:hi] |= segment_found
+            parts.append(weights)
+        # 各段的文档号范围不重叠，按段的顺序拼接的权重与 found 中的顺序一致
+        weights = np.concatenate(parts)
+        live = ~is_deleted(self.tombstones, doc_ids[found])
+        found[np.flatnonzero(found)[~live]] = False
+        return found, weights[live]
+
+    def bitmap(self, term):
+        """各段的位图之并，有一个段不是以位图保存时返回 None
+
+        结果中可能包含已删除的文档，调用方再经 lookup_docs 取权重时会被过滤掉。
+        """
+        bitmaps = [reader.bitmap(term) for reader in self.segments]
+        if not bitmaps or any(bitmap is None for bitmap in bitmaps):
+            return None
+        return reduce(or_, bitmaps)
+
+
+def open_postings_reader(index_dir):
+    """根据目录格式返回分段索引或单目录索引的读取器"""
+    if is_segmented_index(index_dir):
+        return SegmentedPostingsReader(index_dir)
+    return PostingsReader(index_dir)
+
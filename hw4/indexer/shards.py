@@ -0,0 +1,211 @@
+import os
+import re
+import json
+import zlib
+from bisect import bisect_right
+
+# JSON 倒排索引的分片
+#
+# 按首字符分块会产生几千个很小的 chinese_X.json 和少数几个很大的文件（numeric.json、
+# others.json、常见首字），查询延迟取决于词项落在哪个分块。现在由分片函数决定词项所在文件：
+#   hash   crc32(词项) % 分片数，各分片的词项数大致相同
+#   range  按词项字典序切分，切分点取自词表统计（每个词项的倒排记录数），各分片的记录数大致相同，
+#          同一前缀的词项落在相邻的少数几个分片中，前缀扫描（通配符、联想词）只需读取这些分片
+# 分片方式和各分片的大小写入索引目录的 shards.json，tf_idf_cal.py 和查询端都按它定位词项。
+# 没有 shards.json 的目录视为旧的首字符分块。
+# 索引现在统一由 build_index.py 构建为位置倒排索引，JSON 倒排索引只在读取旧版 index.py 生成的目录时使用。
+
+SHARD_MANIFEST = "shards.json"
+SHARD_SCHEMES = ("hash", "range")
+MAX_CODE_POINT = chr(0x10FFFF)
+
+
+def legacy_chunk_key(term):
+    """旧的按首字符分块"""
+    if "\u4e00" <= term[0] <= "\u9fff":  # 中文字符范围
+        return f"chinese_{term[0]}"
+    elif term[0].isalpha():  # 英文字母
+        return f"alpha_{term[0].lower()}"
+    elif term[0].isdigit():  # 数字
+        return "numeric"
+    else:  # 其他符号统一存放
+        return "others"
+
+
+def term_hash(term):
+    """与进程无关的稳定哈希（内置 hash 对字符串加了随机盐）"""
+    return zlib.crc32(term.encode("utf-8"))
+
+
+def range_bounds(term_sizes, shard_count):
+    """term_sizes 为 {词项: 大小}，返回各分片（第一个除外）的起始词项
+
+    按字典序累加大小，每累计到总量的 1/shard_count 切一次；单个词项超过多个切分点时只切一次。
+    """
+    total = sum(term_sizes.values())
+    step = total / shard_count if shard_count else 0
+    bounds = []
+    cumulative, cut = 0, step
+    for term in sorted(term_sizes):
+        if cumulative >= cut and step > 0 and len(bounds) < shard_count - 1:
+            bounds.append(term)
+            while cut <= cumulative:
+                cut += step
+        cumulative += term_sizes[term]
+    return bounds
+
+
+class ShardMap:
+    """词项 -> 分片编号，分片 i 的文件名为 shard_<i>.json"""
+
+    def __init__(self, scheme, shard_count, bounds=None):
+        if scheme not in SHARD_SCHEMES:
+            raise ValueError(f"不支持的分片方式: {scheme}")
+        self.scheme = scheme
+        self.bounds = list(bounds or [])
+        # range 分片的个数由切分点决定，词项少于分片数时分片也相应减少
+        self.shard_count = len(self.bounds) + 1 if scheme == "range" else shard_count
+
+    @classmethod
+    def from_vocabulary(cls, term_sizes, scheme, shard_count):
+        if scheme == "range":
+            return cls(scheme, shard_count, range_bounds(term_sizes, shard_count))
+        return cls(scheme, shard_count)
+
+    def shard_of(self, term):
+        if self.scheme == "hash":
+            return term_hash(term) % self.shard_count
+        return bisect_right(self.bounds, term)
+
+    def shard_name(self, shard):
+        return f"shard_{shard:03d}"
+
+    def names(self):
+        return [self.shard_name(shard) for shard in range(self.shard_count)]
+
+    def shards_with_prefix(self, prefix):
+        """可能包含以 prefix 开头的词项的分片"""
+        if self.scheme == "hash" or not prefix:
+            return list(range(self.shard_count))
+        return list(
+            range(
+                bisect_right(self.bounds, prefix),
+                bisect_right(self.bounds, prefix + MAX_CODE_POINT) + 1,
+            )
+        )
+
+    def to_json(self):
+        return {
+            "scheme": self.scheme,
+            "shard_count": self.shard_count,
+            "bounds": self.bounds,
+        }
+
+
+def write_shard_manifest(output_dir, shard_map, shard_stats):
+    """shard_stats 为 {分片名: {"terms": 词项数, "postings": 记录数, "bytes": 字节数}}"""
+    manifest = shard_map.to_json()
+    manifest["shards"] = {name: shard_stats.get(name, {}) for name in shard_map.names()}
+    with open(os.path.join(output_dir, SHARD_MANIFEST), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1)
+
+
+def read_shard_manifest(index_dir):
+    try:
+        with open(os.path.join(index_dir, SHARD_MANIFEST), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+# 查询端每个目录只读取一次 shards.json，目录重新写入后按修改时间重新读取
+loaded_shard_maps = {}
+
+
+def get_shard_map(index_dir):
+    """返回目录的 ShardMap，旧的首字符分块目录返回 None"""
+    path = os.path.join(index_dir, SHARD_MANIFEST)
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+    cached = loaded_shard_maps.get(index_dir)
+    if cached is None or cached[0] != mtime:
+        manifest = read_shard_manifest(index_dir)
+        shard_map = ShardMap(
+            manifest["scheme"], manifest["shard_count"], manifest["bounds"]
+        )
+        cached = loaded_shard_maps[index_dir] = (mtime, shard_map)
+    return cached[1]
+
+
+def shard_files(index_dir, suffix=".json"):
+    """目录中的全部分块文件名，有 shards.json 时按其中的分片，否则列出目录"""
+    shard_map = get_shard_map(index_dir)
+    if shard_map is not None:
+        return [
+            name + suffix
+            for name in shard_map.names()
+            if os.path.exists(os.path.join(index_dir, name + suffix))
+        ]
+    return sorted(
+        file_name
+        for file_name in os.listdir(index_dir)
+        if file_name.endswith(suffix) and file_name != SHARD_MANIFEST
+    )
+
+
+def shard_file_for_term(index_dir, term, suffix=".json"):
+    """词项所在的分块文件名"""
+    shard_map = get_shard_map(index_dir)
+    if shard_map is None:
+        return legacy_chunk_key(term) + suffix
+    return shard_map.shard_name(shard_map.shard_of(term)) + suffix
+
+
+def shard_files_for_pattern(index_dir, pattern, suffix=".json"):
+    """可能包含与 pattern（可含 * ? 通配符）匹配的词项的分块文件名"""
+    prefix = re.split(r"[*?]", pattern, maxsplit=1)[0]
+    if prefix == pattern:
+        return [shard_file_for_term(index_dir, pattern, suffix)]
+    shard_map = get_shard_map(index_dir)
+    if shard_map is None:
+        # 旧的分块按首字符划分，首字符不是通配符时只需读取一个分块
+        if prefix:
+            return [legacy_chunk_key(prefix) + suffix]
+        return shard_files(index_dir, suffix)
+    return [
+        shard_map.shard_name(shard) + suffix
+        for shard in shard_map.shards_with_prefix(prefix)
+    ]
+
+
+def format_size(size):
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024 or unit == "GB":
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+
+
+def format_shard_histogram(shard_bytes, width=40):
+    """各分片大小的分布，按 2 的幂分桶，并给出最大分片与平均大小之比"""
+    sizes = list(shard_bytes.values())
+    if not sizes:
+        return "没有分片"
+    total = sum(sizes)
+    mean = total / len(sizes)
+    buckets = {}
+    for size in sizes:
+        bucket = max(size, 1).bit_length() - 1
+        buckets[bucket] = buckets.get(bucket, 0) + 1
+    most = max(buckets.values())
+    lines = [
+        f"分片大小分布：{len(sizes)} 个分片，共 {format_size(total)}，"
+        f"最小 {format_size(min(sizes))}，最大 {format_size(max(sizes))}，"
+        f"最大/平均 {max(sizes) / mean if mean else 0:.2f}"
+    ]
+    for bucket in sorted(buckets):
+        label = f"{format_size(1 << bucket)} - {format_size(1 << (bucket + 1))}"
+        bar = "#" * max(1, round(buckets[bucket] / most * width))
+        lines.append(f"  {label:>22} {bar} {buckets[bucket]}")
+    return "\n".join(lines)
@@ -0,0 +1,220 @@
+import os
+import json
+import numpy as np
+
+# 全局有序词典
+#
+#   terms.lex    所有词项的 UTF-8 字节按字典序依次拼接
+#   terms.npy    与词项一一对应的定长记录（见 ENTRY_DTYPE），可直接内存映射
+#   terms.files  倒排记录文件名列表，记录中的 file_id 即该列表的下标
+# 查找一个词项只需在 terms.npy 上二分，再对倒排记录文件做一次 pread。
+#
+# 较长的 VB 倒排记录另有跳表（见 postings.skip_table），按 CSR 方式保存：
+#   terms.skips.npy       所有词项的跳表项依次拼接（见 SKIP_DTYPE）
+#   terms.skip_index.npy  第 i 个词项的跳表项为 skips[skip_index[i]:skip_index[i + 1]]
+# 没有跳表文件的旧索引照常读取，只是求交集时需要完整解码倒排记录。
+
+LEX_FILE = "terms.lex"
+ENTRY_FILE = "terms.npy"
+FILES_FILE = "terms.files"
+SKIPS_FILE = "terms.skips.npy"
+SKIP_INDEX_FILE = "terms.skip_index.npy"
+
+ENTRY_DTYPE = np.dtype(
+    [
+        ("lex_offset", np.uint64),  # 词项在 terms.lex 中的偏移
+        ("lex_length", np.uint32),  # 词项的字节长度
+        ("file_id", np.uint32),  # 倒排记录所在文件
+        ("offset", np.uint64),  # 倒排记录在文件中的偏移
+        ("doc_length", np.uint32),  # 文档号部分的字节数
+        ("length", np.uint32),  # 倒排记录总字节数
+        ("df", np.uint32),  # 文档频率
+        ("max_weight", np.float32),  # 该词项的最大权重
+        ("format", np.uint8),  # 文档号部分的格式，见 LIST_POSTINGS / BITMAP_POSTINGS
+    ]
+)
+LIST_POSTINGS = 0  # 按索引的编码方式（VB 或 gamma）保存的文档号间距
+BITMAP_POSTINGS = 1  # 压缩位图（见 roaring.py）
+
+# 每个跳表项对应倒排记录中连续的一块文档
+SKIP_DTYPE = np.dtype(
+    [
+        ("doc_max", np.int64),  # 块内最大的文档号
+        ("base", np.int64),  # 块之前最后一个文档号，块内第一个间距以它为基准
+        ("byte_offset", np.uint32),  # 块在文档号部分中的起始字节
+        ("row", np.uint32),  # 块内第一个文档在倒排记录中的序号
+    ]
+)
+
+
+def has_term_dictionary(index_dir):
+    return os.path.exists(os.path.join(index_dir, ENTRY_FILE))
+
+
+class TermDictionaryWriter:
+    """收集各倒排记录文件中的词项信息，排序后写成全局词典"""
+
+    def __init__(self, output_dir):
+        self.output_dir = output_dir
+        self.files = []
+        self.entries = []
+
+    def add_file(self, file_name):
+        """登记一个倒排记录文件，返回其 file_id"""
+        self.files.append(file_name)
+        return len(self.files) - 1
+
+    def add(
+        self,
+        term,
+        file_id,
+        offset,
+        df,
+        doc_length,
+        length,
+        max_weight,
+        skips=None,
+        postings_format=LIST_POSTINGS,
+    ):
+        """skips 为该词项的跳表（SKIP_DTYPE 数组），没有跳表时为 None"""
+        self.entries.append(
+            (
+                term.encode("utf-8"),
+                file_id,
+                offset,
+                doc_length,
+                length,
+                df,
+                max_weight,
+                postings_format,
+                skips,
+            )
+        )
+
+    def close(self):
+        # UTF-8 字节序与码点序一致，按字节排序即可
+        self.entries.sort(key=lambda entry: entry[0])
+        records = np.zeros(len(self.entries), dtype=ENTRY_DTYPE)
+        lex_offset = 0
+        with open(os.path.join(self.output_dir, LEX_FILE), "wb") as lex_file:
+            for i, (term_bytes, *fields, _) in enumerate(self.entries):
+                lex_file.write(term_bytes)
+                records[i] = (lex_offset, len(term_bytes), *fields)
+                lex_offset += len(term_bytes)
+        np.save(os.path.join(self.output_dir, ENTRY_FILE), records)
+        self.write_skips()
+        with open(
+            os.path.join(self.output_dir, FILES_FILE), "w", encoding="utf-8"
+        ) as f:
+            json.dump(self.files, f, ensure_ascii=False)
+        self.entries = []
+
+    def write_skips(self):
+        """按排序后的词项顺序写出跳表，没有任何词项带跳表时不写文件"""
+        skips = [entry[-1] for entry in self.entries]
+        if all(table is None for table in skips):
+            return
+        skip_index = np.zeros(len(skips) + 1, dtype=np.int64)
+        skip_index[1:] = np.cumsum([0 if t is None else len(t) for t in skips])
+        np.save(os.path.join(self.output_dir, SKIP_INDEX_FILE), skip_index)
+        np.save(
+            os.path.join(self.output_dir, SKIPS_FILE),
+            np.concatenate(
+                [np.zeros(0, dtype=SKIP_DTYPE)] + [t for t in skips if t is not None]
+            ),
+        )
+
+
+class TermDictionary:
+    """内存映射的有序词典，支持精确查找与前缀范围查找"""
+
+    def __init__(self, index_dir):
+        self.index_dir = index_dir
+        self.entries = np.load(os.path.join(index_dir, ENTRY_FILE), mmap_mode="r")
+        lex_path = os.path.join(index_dir, LEX_FILE)
+        if os.path.getsize(lex_path) > 0:
+            self.lex = np.memmap(lex_path, dtype=np.uint8, mode="r")
+        else:
+            self.lex = np.zeros(0, dtype=np.uint8)
+        with open(os.path.join(index_dir, FILES_FILE), "r", encoding="utf-8") as f:
+            self.files = json.load(f)
+        if os.path.exists(os.path.join(index_dir, SKIP_INDEX_FILE)):
+            self.skip_index = np.load(
+                os.path.join(index_dir, SKIP_INDEX_FILE), mmap_mode="r"
+            )
+            self.skips = np.load(os.path.join(index_dir, SKIPS_FILE), mmap_mode="r")
+        else:
+            self.skip_index = None
+
+    def __len__(self):
+        return len(self.entries)
+
+    def term_bytes(self, i):
+        entry = self.entries[i]
+        start = int(entry["lex_offset"])
+        return self.lex[start : start + int(entry["lex_length"])].tobytes()
+
+    def term(self, i):
+        return self.term_bytes(i).decode("utf-8")
+
+    def _lower_bound(self, key):
+        """返回第一个不小于 key 的位置"""
+        lo, hi = 0, len(self.entries)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.term_bytes(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def lookup(self, term):
+        """返回词项的下标，不存在时返回 -1"""
+        key = term.encode("utf-8")
+        i = self._lower_bound(key)
+        if i < len(self.entries) and self.term_bytes(i) == key:
+            return i
+        return -1
+
+    def prefix_range(self, prefix):
+        """返回以 prefix 开头的词项下标范围 [lo, hi)"""
+        key = prefix.encode("utf-8")
+        lo = self._lower_bound(key)
+        # 先指数探测再二分，前缀范围很小时不必扫描到词典末尾
+        probe, step = lo, 1
+        while probe < len(self.entries) and self.term_bytes(probe).startswith(key):
+            probe += step
+            step *= 2
+        left = max(lo, probe - step // 2)  # 最后一个确认匹配的位置
+        right = min(probe, len(self.entries))
+        while left < right:
+            mid = (left + right) // 2
+            if self.term_bytes(mid).startswith(key):
+                left = mid + 1
+            else:
+                right = mid
+        return lo, left
+
+    def terms_with_prefix(self, prefix):
+        lo, hi = self.prefix_range(prefix)
+        return [self.term(i) for i in range(lo, hi)]
+
+    def __iter__(self):
+        for i in range(len(self.entries)):
+            yield self.term(i)
+
+    def entry(self, i):
+        return self.entries[i]
+
+    def postings_format(self, i):
+        """旧的词典没有 format 字段，全部为 LIST_POSTINGS"""
+        if "format" not in self.entries.dtype.names:
+            return LIST_POSTINGS
+        return int(self.entries[i]["format"])
+
+    def skip_table(self, i):
+        """第 i 个词项的跳表，没有跳表时返回 None"""
+        if self.skip_index is None:
+            return None
+        start, end = int(self.skip_index[i]), int(self.skip_index[i + 1])
+        return self.skips[start:end] if end > start else None
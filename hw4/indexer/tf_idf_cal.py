@@ -1,67 +1,270 @@
 import os
 import json
-import math
+import numpy as np
 import pandas as pd
-from collections import defaultdict
+from postings import (
+    PostingsWriter,
+    PositionalPostingsReader,
+    write_index_meta,
+    is_positional_index,
+)
+from term_dictionary import TermDictionaryWriter
+from wildcard_index import build_wildcard_index
+from segments import (
+    DOC_LENGTHS_FILE,
+    segment_name,
+    segment_info,
+    link_positional_index,
+    create_segmented_index,
+    reset_index_dir,
+)
+from index_versions import new_version_path, publish_version, remove_version
+from shards import (
+    get_shard_map,
+    shard_files,
+    write_shard_manifest,
+    format_shard_histogram,
+)
+from index_config import INDEX_FIELDS, ENABLED_FIELDS, WEIGHTING, BM25_K1, BM25_B
 
 
-def compute_tf_idf(json_dir, word_count_file, total_docs, output_dir):
-    """计算 TF-IDF 并按分块保存"""
-    os.makedirs(output_dir, exist_ok=True)
+# 权重计算
+#
+# 一个倒排记录块内所有词项的记录拼接成一个数组后整体计算，不逐条循环。
+# weighting 为 {"scheme": "tf_idf" 或 "bm25", "k1": ..., "b": ...}，写入 index_meta.json，
+# 增量更新时按索引中记录的方式计算新段的权重。
+WEIGHT_BLOCK_POSTINGS = 1 << 20  # 每块累积的倒排记录条数
+
+
+def default_weighting():
+    return {"scheme": WEIGHTING, "k1": BM25_K1, "b": BM25_B}
+
+
+def idf_weights(dfs, total_docs, weighting):
+    dfs = np.asarray(dfs, dtype=np.float64)
+    if weighting["scheme"] == "tf_idf":
+        return np.log(total_docs / (dfs + 1))
+    if weighting["scheme"] == "bm25":
+        # 加 1 保证 IDF 为正，MaxScore 剪枝要求权重非负
+        return np.log(1 + (total_docs - dfs + 0.5) / (dfs + 0.5))
+    raise ValueError(f"不支持的权重计算方式: {weighting['scheme']}")
+
+
+def term_weights(tfs, lengths, idfs, avg_length, weighting):
+    """tfs、lengths、idfs 为逐条倒排记录对齐的数组，lengths 均大于 0"""
+    if weighting["scheme"] == "tf_idf":
+        return tfs / lengths * idfs
+    k1, b = weighting["k1"], weighting["b"]
+    norms = k1 * (1 - b + b * lengths / avg_length)
+    return idfs * tfs * (k1 + 1) / (tfs + norms)
+
+
+def write_weight_block(
+    writer, block, lengths_by_doc, total_docs, avg_length, weighting
+):
+    """block 为 [(词项, 文档号数组, 词频数组, df), ...]，计算权重后写入 writer
+
+    每个词项的最大权重由 PostingsWriter 记入词典，作为 top-k 剪枝的得分上界。
+    """
+    if not block:
+        return
+    counts = np.array([len(term_doc_ids) for _, term_doc_ids, _, _ in block])
+    doc_ids = np.concatenate([term_doc_ids for _, term_doc_ids, _, _ in block])
+    tfs = np.concatenate([term_tfs for _, _, term_tfs, _ in block]).astype(np.float64)
+    idfs = np.repeat(
+        idf_weights([df for _, _, _, df in block], total_docs, weighting), counts
+    )
 
+    lengths = np.zeros(len(doc_ids))
+    in_range = doc_ids < len(lengths_by_doc)
+    lengths[in_range] = lengths_by_doc[doc_ids[in_range]]
+    valid = lengths > 0  # 跳过无效文档
+    weights = np.zeros(len(doc_ids))
+    weights[valid] = term_weights(
+        tfs[valid], lengths[valid], idfs[valid], avg_length, weighting
+    )
+
+    splits = np.cumsum(counts)[:-1]
+    for (word, _, _, _), term_doc_ids, term_weight_values, keep in zip(
+        block,
+        np.split(doc_ids, splits),
+        np.split(weights, splits),
+        np.split(valid, splits),
+    ):
+        if keep.any():
+            writer.append(word, term_doc_ids[keep], term_weight_values[keep])
+
+
+def collection_stats(doc_lengths):
+    """返回 (文档数, 平均文档长度)，只统计长度大于 0 的文档"""
+    doc_lengths = np.asarray(doc_lengths)
+    doc_lengths = doc_lengths[doc_lengths > 0]
+    if len(doc_lengths) == 0:
+        return 0, 0.0
+    return len(doc_lengths), float(doc_lengths.mean())
+
+
+def compute_tf_idf(
+    json_dir,
+    word_count_file,
+    output_dir,
+    encoding="vb",
+    weight_dtype="float32",
+    weighting=None,
+):
+    """计算 TF-IDF 或 BM25 权重并保存为二进制倒排记录表（见 postings.py）
+
+    文档数和平均文档长度取自 word_count_file 中的实际文档。
+    """
+    weighting = weighting or default_weighting()
     # 读取每个文档的总词数
     word_count_df = pd.read_csv(word_count_file)
-    doc_word_count = dict(zip(word_count_df["linenumber"], word_count_df["word_count"]))
+    doc_ids = word_count_df["linenumber"].to_numpy(dtype=np.int64)
+    doc_lengths = word_count_df["word_count"].to_numpy(dtype=np.int64)
+    total_docs, avg_length = collection_stats(doc_lengths)
+    print(f"文档数 {total_docs}，平均文档长度 {avg_length:.2f}")
 
-    # 遍历倒排索引的所有文件
-    for file_name in os.listdir(json_dir):
-        if not file_name.endswith(".json"):
-            continue
+    # build_index.py 生成的位置倒排索引：写成只有一个段的分段索引（见 segments.py）
+    if is_positional_index(json_dir):
+        reset_index_dir(output_dir)
+        name = segment_name(0)
+        seg_dir = os.path.join(output_dir, name)
+        write_segment(
+            seg_dir,
+            json_dir,
+            doc_ids,
+            doc_lengths,
+            total_docs,
+            avg_length,
+            encoding=encoding,
+            weight_dtype=weight_dtype,
+            weighting=weighting,
+        )
+        # 位置倒排索引链接到段内，版本目录不引用 build_index.py 的输出目录
+        positional_dir = link_positional_index(json_dir, seg_dir)
+        create_segmented_index(
+            output_dir,
+            segment_info(name, positional_dir, doc_ids),
+            total_docs,
+            encoding,
+            weight_dtype,
+            weighting,
+        )
+        print(f"保存完成: {output_dir}")
+        return
 
+    os.makedirs(output_dir, exist_ok=True)
+    dictionary = TermDictionaryWriter(output_dir)
+    lengths_by_doc = doc_length_array(doc_ids, doc_lengths)
+
+    # 遍历倒排索引的所有分块（见 shards.py），每个分块作为一个块计算权重
+    shard_bytes = {}
+    for file_name in shard_files(json_dir):
         file_path = os.path.join(json_dir, file_name)
         with open(file_path, "r", encoding="utf-8") as f:
             inverted_index = json.load(f)
 
-        # 结果存储字典
-        tf_idf_result = defaultdict(list)
-
+        block = []
         for word, postings in inverted_index.items():
-            # 文档频率 DF
-            df = len(postings)
+            # 旧版 index.py 生成的倒排记录为 (文档号, 位置)，每次出现一条：按文档计数即为词频
+            pairs = np.asarray(postings, dtype=np.int64).reshape(-1, 2)
+            term_doc_ids, tfs = np.unique(pairs[:, 0], return_counts=True)
+            block.append((word, term_doc_ids, tfs, len(term_doc_ids)))
 
-            # 计算 IDF
-            idf = math.log(total_docs / (df + 1))
+        chunk_key = file_name[: -len(".json")]
+        with PostingsWriter(
+            output_dir, chunk_key, dictionary, encoding, weight_dtype
+        ) as writer:
+            write_weight_block(
+                writer, block, lengths_by_doc, total_docs, avg_length, weighting
+            )
+        shard_bytes[chunk_key] = os.path.getsize(writer.postings_path)
+        print(f"保存完成: {os.path.join(output_dir, chunk_key)}")
 
-            for doc_id, term_freq in postings:
-                # 获取该文档的总词数
-                doc_word_count_val = doc_word_count.get(int(doc_id), 0)
-                if doc_word_count_val == 0:
-                    continue  # 跳过无效文档
+    # 输出沿用输入的分片，各分片大小记录在 shards.json 中
+    shard_map = get_shard_map(json_dir)
+    if shard_map is not None:
+        write_shard_manifest(
+            output_dir,
+            shard_map,
+            {name: {"bytes": size} for name, size in shard_bytes.items()},
+        )
+    print(format_shard_histogram(shard_bytes))
 
-                # 计算 TF
-                tf = term_freq / doc_word_count_val
+    dictionary.close()
+    build_wildcard_index(output_dir)
+    write_index_meta(output_dir, encoding, weight_dtype, weighting=weighting)
 
-                # 计算 TF-IDF
-                tf_idf = tf * idf
 
-                # 添加到结果
-                tf_idf_result[word].append([doc_id, tf_idf])
+# 按文档号建立文档长度数组
+def doc_length_array(doc_ids, doc_lengths):
+    lengths = np.zeros(int(doc_ids.max()) + 1 if len(doc_ids) else 1)
+    lengths[doc_ids] = doc_lengths
+    return lengths
 
-        # 保存当前块的 TF-IDF 结果
-        output_file = os.path.join(output_dir, file_name)
-        with open(output_file, "a", encoding="utf-8") as f:
-            json.dump(tf_idf_result, f, ensure_ascii=False, indent=4)
-        print(f"保存完成: {output_file}")
 
+# 从位置倒排索引计算一个段的权重
+def write_segment(
+    seg_dir,
+    positional_dir,
+    doc_ids,
+    doc_lengths,
+    total_docs,
+    avg_length,
+    df_of=None,
+    encoding="vb",
+    weight_dtype="float32",
+    weighting=None,
+):
+    """位置倒排索引中 df 为文档数、tf 为词频，结果写入 seg_dir
 
-# 配置路径和参数
-inverted_index_dir = "./inverted_index_chunks"  # 倒排索引存储目录
+    total_docs、avg_length 为整个索引的文档数和平均文档长度。
+    df_of(词项, 段内 df) 返回计算 IDF 用的 df，增量更新时传入整个索引的 df；
+    不传则使用段内 df。
+    """
+    weighting = weighting or default_weighting()
+    os.makedirs(seg_dir, exist_ok=True)
+    np.save(
+        os.path.join(seg_dir, DOC_LENGTHS_FILE), np.column_stack([doc_ids, doc_lengths])
+    )
+    lengths_by_doc = doc_length_array(doc_ids, doc_lengths)
+    dictionary = TermDictionaryWriter(seg_dir)
 
-word_count_csv = "word_count.csv"  # 文档词数文件
-total_document_count = 150000  # 总文档数
-output_tf_idf_dir = "./tf_idf_chunks"  # TF-IDF 结果存储目录
+    with PositionalPostingsReader(positional_dir) as reader, PostingsWriter(
+        seg_dir, "tf_idf", dictionary, encoding, weight_dtype
+    ) as writer:
+        block, block_postings = [], 0
+        for word, term_doc_ids, tfs, _ in reader:
+            df = len(term_doc_ids) if df_of is None else df_of(word, len(term_doc_ids))
+            block.append((word, term_doc_ids, tfs, df))
+            block_postings += len(term_doc_ids)
+            if block_postings >= WEIGHT_BLOCK_POSTINGS:
+                write_weight_block(
+                    writer, block, lengths_by_doc, total_docs, avg_length, weighting
+                )
+                block, block_postings = [], 0
+        write_weight_block(
+            writer, block, lengths_by_doc, total_docs, avg_length, weighting
+        )
 
-# 计算 TF-IDF
-compute_tf_idf(
-    inverted_index_dir, word_count_csv, total_document_count, output_tf_idf_dir
-)
+    dictionary.close()
+    build_wildcard_index(seg_dir)
+    write_index_meta(seg_dir, encoding, weight_dtype, weighting=weighting)
+
+
+if __name__ == "__main__":
+    # 计算权重，每种索引写入一个新版本，全部写完后再切换，查询端不会读到写了一半的索引
+    # 文档数取自各索引的单词总数文件，权重计算方式见 index_config.py
+    for field in ENABLED_FIELDS:
+        config = INDEX_FIELDS[field]
+        version_path = new_version_path(config["tf_idf_dir"])
+        try:
+            compute_tf_idf(
+                config["index_dir"],
+                config["word_count_file"],
+                version_path,
+            )
+        except BaseException:
+            remove_version(version_path)  # 构建失败时删除写了一半的版本，当前版本不变
+            raise
+        publish_version(config["tf_idf_dir"], version_path)
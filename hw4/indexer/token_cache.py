@@ -0,0 +1,228 @@
+import os
+import hashlib
+import sqlite3
+import unicodedata
+from collections import Counter
+import jieba
+from postings import CompressedPostings
+
+# 分词缓存
+#
+# jieba.lcut 是构建索引的主要开销，而同一段文本会在多次全量构建、增量更新以及
+# 未变化的重新爬取中反复分词。缓存保存在一个 SQLite 文件中：
+#   tokens   词 -> 词编号
+#   entries  sha1(分词器版本 + 规范化文本) -> 词编号序列（VB 编码，见 postings.py）
+#   meta     分词器版本，jieba、词典或用户词典变化后清空旧的缓存
+# 多个构建进程可以同时读写同一个缓存文件（WAL 模式），每个进程只在一批文本处理完后提交一次。
+
+SQLITE_BATCH = 500  # 每条 SQL 的参数个数，低于 SQLite 的默认上限 999
+
+loaded_user_dicts = []  # load_user_dict 加载过的用户词典（绝对路径）
+
+
+def normalize_text(text):
+    """键和分词都使用 NFC 规范化后的文本，同一内容不同编码方式的文本共用一条缓存
+
+    规范化会合并组合字符等，分词结果可能与直接对原文调用 jieba.lcut 不同；
+    不经缓存分词和查询端（phrase_query.py）的短语分词也先做同样的规范化。
+    """
+    return unicodedata.normalize("NFC", f"{text}")
+
+
+def file_signature(path):
+    stat = os.stat(path)
+    return f"{os.path.abspath(path)}:{stat.st_size}:{stat.st_mtime_ns}"
+
+
+def load_user_dict(path):
+    """加载 jieba 用户词典，并计入分词器版本"""
+    jieba.load_userdict(path)
+    loaded_user_dicts.append(os.path.abspath(path))
+
+
+def tokenizer_version():
+    """jieba 版本 + 词典和各用户词典的路径、大小、修改时间 + 词频总和
+
+    词频总和包含用户词典和 jieba.add_word 加入的词，未经 load_user_dict 加载的修改也能发现。
+    """
+    dict_path = jieba.dt.dictionary or os.path.join(
+        os.path.dirname(jieba.__file__), jieba.DEFAULT_DICT_NAME
+    )
+    jieba.dt.check_initialized()
+    parts = [f"jieba-{jieba.__version__}", file_signature(dict_path)]
+    parts += [file_signature(path) for path in loaded_user_dicts]
+    parts.append(f"total={jieba.dt.total}")
+    return ":".join(parts)
+
+
+def batched(items, size=SQLITE_BATCH):
+    for i in range(0, len(items), size):
+        yield items[i : i + size]
+
+
+class TokenCache:
+    """以文本内容哈希为键的持久化分词缓存
+
+    lcut_many 的结果与对 normalize_text 后的文本逐个调用 jieba.lcut 相同。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.version = tokenizer_version()
+        self.conn = sqlite3.connect(path, timeout=60)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")  # WAL 模式下只在检查点时同步
+        with self.conn:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)"
+            )
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS tokens "
+                "(id INTEGER PRIMARY KEY, token TEXT UNIQUE NOT NULL)"
+            )
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries "
+                "(key BLOB PRIMARY KEY, ids BLOB NOT NULL) WITHOUT ROWID"
+            )
+            row = self.conn.execute(
+                "SELECT value FROM meta WHERE key = 'tokenizer'"
+            ).fetchone()
+            if row is None or row[0] != self.version:
+                # 分词器变化后旧的结果全部失效
+                self.conn.execute("DELETE FROM entries")
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO meta VALUES ('tokenizer', ?)",
+                    (self.version,),
+                )
+        self.token_ids = {}
+        self.id_tokens = {}
+
+    def close(self):
+        self.conn.close()
+
+    def key(self, text):
+        return hashlib.sha1(f"{self.version}\0{text}".encode("utf-8")).digest()
+
+    def load_tokens(self, ids):
+        """把本进程尚未见过的词编号从 tokens 表读入内存"""
+        missing = list(ids - self.id_tokens.keys())
+        for batch in batched(missing):
+            placeholders = ",".join("?" * len(batch))
+            for token_id, token in self.conn.execute(
+                f"SELECT id, token FROM tokens WHERE id IN ({placeholders})", batch
+            ):
+                self.id_tokens[token_id] = token
+                self.token_ids[token] = token_id
+
+    def lookup(self, keys):
+        """返回 {键: 词编号数组}，只包含命中的键"""
+        found = {}
+        for batch in batched(list(set(keys))):
+            placeholders = ",".join("?" * len(batch))
+            for key, data in self.conn.execute(
+                f"SELECT key, ids FROM entries WHERE key IN ({placeholders})", batch
+            ):
+                found[key] = CompressedPostings.vb_decode(data)
+        return found
+
+    def store(self, entries):
+        """entries 为 {键: 词序列}，在一个事务中登记新词并写入分词结果"""
+        if not entries:
+            return
+        with self.conn:
+            self.conn.execute("BEGIN IMMEDIATE")  # 其他进程可能同时登记相同的词
+            new_tokens = list(
+                {token for tokens in entries.values() for token in tokens}
+                - self.token_ids.keys()
+            )
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO tokens (token) VALUES (?)",
+                ((token,) for token in new_tokens),
+            )
+            for batch in batched(new_tokens):
+                placeholders = ",".join("?" * len(batch))
+                for token_id, token in self.conn.execute(
+                    f"SELECT id, token FROM tokens WHERE token IN ({placeholders})",
+                    batch,
+                ):
+                    self.id_tokens[token_id] = token
+                    self.token_ids[token] = token_id
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?)",
+                (
+                    (
+                        key,
+                        CompressedPostings.vb_encode(
+                            [self.token_ids[token] for token in tokens]
+                        ),
+                    )
+                    for key, tokens in entries.items()
+                ),
+            )
+
+    def lcut_many(self, texts, stats=None):
+        """对一批文本分词，命中缓存的直接解码，其余调用 jieba.lcut 后写回缓存
+
+        stats 为 Counter 时累加命中数 hits 和未命中数 misses。
+        """
+        stats = Counter() if stats is None else stats
+        texts = [normalize_text(text) for text in texts]
+        keys = [self.key(text) for text in texts]
+        found = self.lookup(keys)
+        self.load_tokens({int(i) for token_ids in found.values() for i in token_ids})
+
+        results = []
+        new_entries = {}
+        for text, key in zip(texts, keys):
+            if key in found:
+                results.append([self.id_tokens[int(i)] for i in found[key]])
+                stats["hits"] += 1
+            elif key in new_entries:  # 同一批中重复的文本
+                results.append(list(new_entries[key]))
+                stats["hits"] += 1
+            else:
+                tokens = jieba.lcut(text)  # 使用 jieba 分词
+                new_entries[key] = tokens
+                results.append(tokens)
+                stats["misses"] += 1
+        self.store(new_entries)
+        return results
+
+    def lcut(self, text):
+        return self.lcut_many([text])[0]
+
+
+def hit_rate(stats):
+    total = stats["hits"] + stats["misses"]
+    return stats["hits"] / total if total else 0.0
+
+
+def format_stats(stats):
+    return (
+        f"分词缓存命中 {stats['hits']}/{stats['hits'] + stats['misses']}"
+        f"（{hit_rate(stats):.1%}）"
+    )
+
+
+# 每个进程只打开一次缓存，进程池中的子进程各自建立 SQLite 连接
+opened_caches = {}
+
+
+def get_token_cache(path):
+    """path 为 None 时不使用缓存，返回 None"""
+    if path is None:
+        return None
+    key = (os.getpid(), os.path.abspath(path))
+    if key not in opened_caches:
+        opened_caches[key] = TokenCache(path)
+    return opened_caches[key]
+
+
+def lcut_many(texts, cache_path, stats=None):
+    """有缓存时经缓存分词，否则直接调用 jieba.lcut（全部计为未命中）"""
+    cache = get_token_cache(cache_path)
+    if cache is None:
+        if stats is not None:
+            stats["misses"] += len(texts)
+        return [jieba.lcut(normalize_text(text)) for text in texts]
+    return cache.lcut_many(texts, stats)
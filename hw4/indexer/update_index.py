@@ -0,0 +1,431 @@
+import os
+import sys
+import time
+import shutil
+import argparse
+import subprocess
+import contextlib
+import numpy as np
+import pandas as pd
+from postings import PostingsReader, read_index_meta
+from bsbi_index import merge_runs, remove_runs
+from build_index import build_field_runs
+from index import extract_files
+from token_cache import format_stats
+from tf_idf_cal import write_segment, collection_stats
+from index_versions import (
+    resolve_version,
+    leased_version,
+    new_version_path,
+    remove_version,
+    switch_version,
+    version_lock,
+    prune_versions,
+)
+from segments import (
+    segment_info,
+    segment_dir,
+    segment_positional_dir,
+    read_manifest,
+    load_tombstones,
+    load_segment_doc_lengths,
+    live_doc_lengths,
+    mark_deleted,
+    is_deleted,
+    live_doc_count,
+    find_merges,
+    commit,
+    clone_index,
+    install_segment,
+    remove_garbage,
+    is_segmented_index,
+    POSITIONAL_DIR,
+)
+from index_config import (
+    DATA_FILE,
+    CHUNK_SIZE,
+    MEMORY_BUDGET_MB,
+    RUN_DIR,
+    INDEX_FIELDS,
+    ENABLED_FIELDS,
+    SEGMENT_MERGE_FACTOR,
+    MAX_DELETED_RATIO,
+)
+
+# 增量更新分段索引
+#
+#   python update_index.py new_pages.csv [--delete removed_urls.txt]
+# new_pages.csv 与爬虫输出格式相同（title,url,anchor_texts,body,links），其中的网页
+# 追加到数据文件并分配新的文档号，已有同一 url 的旧文档记入删除位图；每种索引新增一个段。
+# 提交后在后台执行合并策略：
+#   python update_index.py --merge
+# 已发布的索引版本不会被修改：新段基于当前版本写好后，在版本锁内把当前版本硬链接为新版本，
+# 在新版本中提交并切换（见 index_versions.py）。构建期间持有所基于版本的租约，不会被清理。
+
+MERGE_LOCK_FILE = "merge.lock"
+
+
+# 读取已有文档的 url -> 文档号
+def load_url_doc_numbers(data_file, chunk_size=CHUNK_SIZE):
+    """同一 url 重复爬取后会有多个文档号，旧的已在删除位图中"""
+    url_to_docs = {}
+    max_doc_number = 0
+    for chunk in pd.read_csv(
+        data_file, usecols=["line_number", "url"], chunksize=chunk_size
+    ):
+        for doc_number, url in zip(chunk["line_number"], chunk["url"]):
+            url_to_docs.setdefault(url, []).append(int(doc_number))
+            max_doc_number = max(max_doc_number, int(doc_number))
+    return url_to_docs, max_doc_number
+
+
+def max_indexed_doc_number(index_dirs):
+    """各索引中出现过的最大文档号，提交后、写入数据文件前中断时文档号也不会重复分配"""
+    return max(
+        (
+            segment["doc_max"]
+            for index_dir in index_dirs
+            for segment in read_manifest(index_dir)["segments"]
+        ),
+        default=0,
+    )
+
+
+# 为新网页分配文档号，所有索引提交后再追加到数据文件
+def number_documents(data_file, new_pages, first_doc_number):
+    new_pages = new_pages.copy()
+    new_pages.insert(
+        0, "line_number", range(first_doc_number, first_doc_number + len(new_pages))
+    )
+    columns = pd.read_csv(data_file, nrows=0).columns
+    return new_pages.reindex(columns=columns, fill_value="")
+
+
+def append_documents(data_file, rows):
+    rows.to_csv(data_file, mode="a", header=False, index=False)
+
+
+# 整个索引（除 exclude 中的段外）的 df，用于计算新段的 IDF
+def make_df_of(index_dir, manifest, exclude=()):
+    readers = [
+        PostingsReader(segment_dir(index_dir, segment))
+        for segment in manifest["segments"]
+        if segment["name"] not in exclude
+    ]
+
+    def df_of(term, segment_df):
+        return segment_df + sum(reader.df(term) for reader in readers)
+
+    return df_of, readers
+
+
+def index_weighting(meta):
+    """新段沿用索引构建时的权重计算方式，旧索引没有记录时为 TF-IDF"""
+    return meta.get("weighting") or {"scheme": "tf_idf"}
+
+
+def new_segment_dir(index_dir):
+    """段先在临时目录中写好，提交时再改名为正式的段名"""
+    return os.path.join(index_dir, f"tmp_{os.getpid()}_{time.time_ns()}")
+
+
+# 为一种索引写好新段，所有索引都写好后再依次提交
+def prepare_segment(index_dir, run_dirs, word_count_file, deleted_docs):
+    """返回 (临时段目录, 文档号数组)，没有新文档时临时段目录为 None"""
+    meta = read_index_meta(index_dir)
+    word_counts = pd.read_csv(word_count_file)
+    doc_ids = word_counts["linenumber"].to_numpy(dtype=np.int64)
+    doc_lengths = word_counts["word_count"].to_numpy(dtype=np.int64)
+
+    if len(doc_ids) == 0:
+        os.remove(word_count_file)
+        return None, doc_ids
+
+    tmp_dir = new_segment_dir(index_dir)
+    try:
+        merge_runs(run_dirs, os.path.join(tmp_dir, POSITIONAL_DIR))
+        manifest = read_manifest(index_dir)
+        tombstones = load_tombstones(index_dir, manifest)
+        newly_deleted = int(np.count_nonzero(~is_deleted(tombstones, deleted_docs)))
+        total_docs = manifest["total_docs"] + len(doc_ids) - newly_deleted
+        # 平均文档长度按更新后的文档集合计算
+        remaining = mark_deleted(tombstones.copy(), deleted_docs)
+        existing_lengths = live_doc_lengths(index_dir, manifest["segments"], remaining)
+        _, avg_length = collection_stats(
+            np.concatenate([existing_lengths, doc_lengths])
+        )
+        df_of, readers = make_df_of(index_dir, manifest)
+        write_segment(
+            tmp_dir,
+            os.path.join(tmp_dir, POSITIONAL_DIR),
+            doc_ids,
+            doc_lengths,
+            total_docs,
+            avg_length,
+            df_of,
+            meta["encoding"],
+            meta["weight_dtype"],
+            index_weighting(meta),
+        )
+        for reader in readers:
+            reader.close()
+    except BaseException:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+    os.remove(word_count_file)
+    return tmp_dir, doc_ids
+
+
+# 在新版本中提交修改
+@contextlib.contextmanager
+def next_index_version(tf_idf_dir):
+    """在版本锁内把当前版本硬链接为新版本，with 块内在新版本中提交，正常结束后切换
+
+    with 块内出错时删除新版本，当前版本不变。
+    """
+    with version_lock(tf_idf_dir):
+        index_dir = new_version_path(tf_idf_dir)
+        try:
+            clone_index(resolve_version(tf_idf_dir), index_dir)
+            yield index_dir
+        except BaseException:
+            remove_version(index_dir)
+            raise
+        switch_version(tf_idf_dir, index_dir)
+    prune_versions(tf_idf_dir)
+
+
+# 提交新段并记录删除的文档
+def commit_segment(tf_idf_dir, tmp_dir, doc_ids, deleted_docs):
+    if tmp_dir is None and len(deleted_docs) == 0:
+        return
+
+    def update(manifest, tombstones):
+        newly_deleted = int(np.count_nonzero(~is_deleted(tombstones, deleted_docs)))
+        manifest["total_docs"] += len(doc_ids) - newly_deleted
+        if tmp_dir is not None:
+            name = install_segment(index_dir, manifest, tmp_dir)
+            manifest["segments"].append(segment_info(name, POSITIONAL_DIR, doc_ids))
+        if len(deleted_docs) == 0:
+            return manifest, None
+        return manifest, mark_deleted(tombstones, deleted_docs)
+
+    with next_index_version(tf_idf_dir) as index_dir:
+        remove_garbage(commit(index_dir, update))
+
+
+# 增量更新所有启用的索引
+def update_indexes(new_pages, deleted_urls=(), data_file=DATA_FILE):
+    """new_pages 为新爬取网页的 DataFrame，deleted_urls 为已删除网页的 url
+
+    先为所有索引写好新段，任何一个失败都不提交；全部提交后才把新网页追加到数据文件，
+    失败后重试不会在数据文件中留下没有倒排记录的行。
+    """
+    with contextlib.ExitStack() as leases:
+        # 新段写在所基于版本的目录中，提交前该版本不能被清理
+        index_dirs = {
+            field: leases.enter_context(
+                leased_version(INDEX_FIELDS[field]["tf_idf_dir"])
+            )[1]
+            for field in ENABLED_FIELDS
+        }
+        update_leased_indexes(index_dirs, new_pages, deleted_urls, data_file)
+
+
+def update_leased_indexes(index_dirs, new_pages, deleted_urls, data_file):
+    start = time.perf_counter()
+    for index_dir in index_dirs.values():
+        if not is_segmented_index(index_dir):
+            raise RuntimeError(
+                f"{index_dir} 不是分段索引，请先执行 build_index.py 和 tf_idf_cal.py"
+            )
+    url_to_docs, max_doc_number = load_url_doc_numbers(data_file)
+    max_doc_number = max(max_doc_number, max_indexed_doc_number(index_dirs.values()))
+
+    # 重新爬取的网页和被删除的网页，旧文档号都记入删除位图
+    replaced_urls = set(new_pages["url"]) | set(deleted_urls)
+    deleted_docs = np.array(
+        [doc for url in replaced_urls for doc in url_to_docs.get(url, [])],
+        dtype=np.int64,
+    )
+    rows = number_documents(data_file, new_pages, max_doc_number + 1)
+    extract_files(rows.to_dict("records"))
+
+    shutil.rmtree(RUN_DIR, ignore_errors=True)
+    os.makedirs(RUN_DIR)
+    prepared = {}
+    try:
+        results, cache_stats = build_field_runs(
+            rows.to_dict("records"), ENABLED_FIELDS, RUN_DIR, 0, MEMORY_BUDGET_MB << 20
+        )
+        for field, (run_dirs, word_count_file) in results.items():
+            prepared[field] = prepare_segment(
+                index_dirs[field], run_dirs, word_count_file, deleted_docs
+            )
+            remove_runs(run_dirs)
+    except BaseException:
+        for tmp_dir, _ in prepared.values():
+            if tmp_dir is not None:
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+    finally:
+        shutil.rmtree(RUN_DIR, ignore_errors=True)
+
+    for field, (tmp_dir, doc_ids) in prepared.items():
+        commit_segment(
+            INDEX_FIELDS[field]["tf_idf_dir"], tmp_dir, doc_ids, deleted_docs
+        )
+    append_documents(data_file, rows)
+
+    print(
+        f"增量更新完成：新增 {len(rows)} 个文档，删除 {len(deleted_docs)} 个旧文档，"
+        f"{format_stats(cache_stats)}，用时 {time.perf_counter() - start:.2f}s"
+    )
+
+
+# 合并若干相邻的段
+def merge_segments(tf_idf_dir, index_dir, names):
+    """index_dir 为持有租约的当前版本，合并后的段在新版本中提交"""
+    meta = read_index_meta(index_dir)
+    manifest = read_manifest(index_dir)
+    tombstones = load_tombstones(index_dir, manifest)
+    segments = [segment for segment in manifest["segments"] if segment["name"] in names]
+
+    doc_lengths = [load_segment_doc_lengths(index_dir, segment) for segment in segments]
+    doc_ids = np.concatenate([ids for ids, _ in doc_lengths])
+    lengths = np.concatenate([lengths for _, lengths in doc_lengths])
+    live = ~is_deleted(tombstones, doc_ids)
+
+    tmp_dir = new_segment_dir(index_dir)
+    if live.any():  # 全部文档都已删除时直接去掉这些段
+        positional_dir = os.path.join(tmp_dir, POSITIONAL_DIR)
+        merge_runs(
+            [segment_positional_dir(index_dir, segment) for segment in segments],
+            positional_dir,
+            deleted=tombstones,
+        )
+        # IDF 使用合并后段内的 df 加上其余段的 df
+        df_of, readers = make_df_of(index_dir, manifest, exclude=names)
+        _, avg_length = collection_stats(
+            live_doc_lengths(index_dir, manifest["segments"], tombstones)
+        )
+        write_segment(
+            tmp_dir,
+            positional_dir,
+            doc_ids[live],
+            lengths[live],
+            manifest["total_docs"],
+            avg_length,
+            df_of,
+            meta["encoding"],
+            meta["weight_dtype"],
+            index_weighting(meta),
+        )
+        for reader in readers:
+            reader.close()
+
+    def update(manifest, tombstones):
+        current = [segment["name"] for segment in manifest["segments"]]
+        start = current.index(names[0]) if names[0] in current else -1
+        if start < 0 or current[start : start + len(names)] != list(names):
+            raise RuntimeError("合并期间段列表已变化")
+        merged = []
+        if live.any():
+            name = install_segment(index_dir, manifest, tmp_dir)
+            merged = [segment_info(name, POSITIONAL_DIR, doc_ids[live])]
+        manifest["segments"][start : start + len(names)] = merged
+        return manifest, None
+
+    try:
+        with next_index_version(tf_idf_dir) as new_index_dir:
+            remove_garbage(commit(new_index_dir, update))
+    except RuntimeError as e:
+        print(f"放弃合并 {', '.join(names)}: {e}")
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        return
+    print(f"已合并 {', '.join(names)}（{int(live.sum())} 个文档）")
+
+
+# 执行合并策略，直到没有需要合并的段
+@contextlib.contextmanager
+def merge_lock(tf_idf_dir):
+    """同一时间只允许一个合并进程，已有合并在进行时直接跳过
+
+    每次合并都会生成新版本，锁文件放在逻辑路径旁而不是版本目录中。
+    """
+    lock_path = f"{tf_idf_dir}.{MERGE_LOCK_FILE}"
+    try:
+        fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except FileExistsError:
+        yield False
+        return
+    try:
+        yield True
+    finally:
+        os.close(fd)
+        os.remove(lock_path)
+
+
+def run_merge_policy(tf_idf_dir):
+    with merge_lock(tf_idf_dir) as acquired:
+        if not acquired:
+            print(f"{tf_idf_dir} 正在合并，跳过")
+            return
+        while True:
+            with leased_version(tf_idf_dir) as (_, index_dir):
+                manifest = read_manifest(index_dir)
+                tombstones = load_tombstones(index_dir, manifest)
+                segments = manifest["segments"]
+                live_counts = [
+                    live_doc_count(index_dir, segment, tombstones)
+                    for segment in segments
+                ]
+                merges = find_merges(
+                    segments, live_counts, SEGMENT_MERGE_FACTOR, MAX_DELETED_RATIO
+                )
+                if not merges:
+                    break
+                start, stop = merges[0]
+                names = [segment["name"] for segment in segments[start:stop]]
+                merge_segments(tf_idf_dir, index_dir, names)
+
+
+def start_background_merge():
+    """在独立进程中执行合并策略，增量更新在提交后即可返回"""
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    subprocess.Popen(
+        [sys.executable, os.path.join(script_dir, "update_index.py"), "--merge"],
+        cwd=script_dir,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="增量更新分段索引")
+    parser.add_argument("new_pages", nargs="?", help="新爬取或重新爬取的网页 CSV")
+    parser.add_argument("--delete", help="已删除网页的 url 列表文件，每行一个")
+    parser.add_argument("--merge", action="store_true", help="只执行段合并策略")
+    parser.add_argument("--no-merge", action="store_true", help="更新后不启动后台合并")
+    args = parser.parse_args()
+
+    if args.merge:
+        for field in ENABLED_FIELDS:
+            run_merge_policy(INDEX_FIELDS[field]["tf_idf_dir"])
+        return
+
+    if args.new_pages is None and args.delete is None:
+        parser.error("需要指定新网页文件或 --delete")
+    deleted_urls = []
+    if args.delete:
+        with open(args.delete, "r", encoding="utf-8") as f:
+            deleted_urls = [line.strip() for line in f if line.strip()]
+    if args.new_pages is not None:
+        new_pages = pd.read_csv(args.new_pages)
+    else:  # 只删除文档
+        new_pages = pd.DataFrame(columns=["title", "url", "anchor_texts", "body"])
+    update_indexes(new_pages, deleted_urls)
+    if not args.no_merge:
+        start_background_merge()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+import os
+import re
+import numpy as np
+from collections import defaultdict
+from term_dictionary import TermDictionary
+
+# 通配符查询用的字符 k-gram 索引
+#
+# 对每个词项 "$词项$"（$ 表示词首/词尾）取长度为 1~K 的所有字符片段，
+# 记录 片段 -> 包含该片段的词项下标（即全局词典中的下标，升序）。
+# 查询时用模式中的字面片段求交得到候选词，再用正则做后过滤。
+# 通配符可以出现在词项的任意位置，前导通配符（如 *大学）也不会漏掉中文词项。
+
+KGRAM_FILE = "kgram_index.npz"
+K = 2
+BOUNDARY = "$"
+
+
+def has_wildcard_index(index_dir):
+    return os.path.exists(os.path.join(index_dir, KGRAM_FILE))
+
+
+def is_wildcard(term):
+    return "*" in term or "?" in term
+
+
+def wildcard_to_regex(term):
+    """将通配符查询转换为正则表达式"""
+    regex = re.escape(term).replace(r"\*", ".*").replace(r"\?", ".")
+    return f"^{regex}$"  # 完整匹配
+
+
+def term_kgrams(term, k=K):
+    """词项（已加边界符）的全部长度为 1~k 的片段，单独的边界符不计入"""
+    padded = BOUNDARY + term + BOUNDARY
+    grams = set()
+    for size in range(1, k + 1):
+        for i in range(len(padded) - size + 1):
+            gram = padded[i : i + size]
+            if gram != BOUNDARY:
+                grams.add(gram)
+    return grams
+
+
+def pattern_kgrams(pattern, k=K):
+    """从通配符模式的字面片段中取查询用的 k-gram"""
+    padded = BOUNDARY + pattern + BOUNDARY
+    grams = set()
+    for piece in re.split(r"[*?]", padded):
+        if not piece or piece == BOUNDARY:
+            continue
+        size = min(len(piece), k)
+        for i in range(len(piece) - size + 1):
+            grams.add(piece[i : i + size])
+    return grams
+
+
+def build_wildcard_index(index_dir, k=K):
+    """基于全局词典的词表构建 k-gram 索引"""
+    dictionary = TermDictionary(index_dir)
+    gram_to_ids = defaultdict(list)
+    for term_id, term in enumerate(dictionary):
+        for gram in term_kgrams(term, k):
+            gram_to_ids[gram].append(term_id)  # 按词典顺序遍历，列表天然升序
+
+    grams = sorted(gram_to_ids)
+    lengths = np.array([len(gram_to_ids[gram]) for gram in grams], dtype=np.int64)
+    indptr = np.zeros(len(grams) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=indptr[1:])
+    term_ids = np.fromiter(
+        (term_id for gram in grams for term_id in gram_to_ids[gram]),
+        dtype=np.int32,
+        count=int(indptr[-1]),
+    )
+    np.savez(
+        os.path.join(index_dir, KGRAM_FILE),
+        grams=np.array(grams, dtype=f"<U{k}"),
+        indptr=indptr,
+        term_ids=term_ids,
+        k=np.array(k),
+    )
+    print(f"k-gram 索引构建完成: {len(grams)} 个片段, {len(dictionary)} 个词项")
+
+
+class WildcardIndex:
+    """查询端的 k-gram 索引"""
+
+    def __init__(self, index_dir, dictionary=None):
+        self.dictionary = dictionary or TermDictionary(index_dir)
+        data = np.load(os.path.join(index_dir, KGRAM_FILE))
+        self.grams = data["grams"]
+        self.indptr = data["indptr"]
+        self.term_ids = data["term_ids"]
+        self.k = int(data["k"])
+
+    def gram_postings(self, gram):
+        i = int(np.searchsorted(self.grams, gram))
+        if i < len(self.grams) and self.grams[i] == gram:
+            return self.term_ids[self.indptr[i] : self.indptr[i + 1]]
+        return np.zeros(0, dtype=np.int32)
+
+    def match(self, pattern):
+        """返回与通配符模式匹配的词项下标（升序）"""
+        grams = pattern_kgrams(pattern, self.k)
+        if grams:
+            # 从最短的片段列表开始求交，候选集合只会越来越小
+            candidate_lists = sorted(
+                (self.gram_postings(gram) for gram in grams), key=len
+            )
+            candidates = candidate_lists[0]
+            for ids in candidate_lists[1:]:
+                if len(candidates) == 0:
+                    break
+                candidates = np.intersect1d(candidates, ids, assume_unique=True)
+        else:
+            # 模式中没有任何字面字符（如 "*"），只能遍历整个词表
+            candidates = np.arange(len(self.dictionary), dtype=np.int32)
+
+        # k-gram 只保证包含这些片段，顺序和长度需要用正则后过滤
+        regex = re.compile(wildcard_to_regex(pattern))
+        return np.array(
+            [i for i in candidates.tolist() if regex.match(self.dictionary.term(i))],
+            dtype=np.int64,
+        )
+
+
+if __name__ == "__main__":
+    # 为已生成的 TF-IDF 索引构建 k-gram 索引
+    build_wildcard_index("./tf_idf_chunks")
@@ -0,0 +1,90 @@
+import os
+import numpy as np
+import pandas as pd
+from urllib.parse import urldefrag
+
+# 紧凑的整数编号链接图
+#
+# 只流式读取爬取结果中的 url 和 links 两列，每个 url 映射为与索引一致的文档号
+# （即 pretreat.py 生成的 line_number，从 1 开始），出链保存为 CSR：
+#   indptr.npy   长度为 文档数 + 1，第 i 行对应文档号 i + DOC_ID_BASE
+#   indices.npy  int32，所有出链目标的行号依次拼接
+# PageRank 等链接分析任务可直接以内存映射方式重新加载。
+
+LINK_GRAPH_DIR = "link_graph"
+DOC_ID_BASE = 1  # 行号 0 对应文档号 1
+
+
+def normalize_url(url):
+    """去掉首尾空白和锚点，与爬虫写入 links 时的 "; " 分隔方式无关"""
+    if not isinstance(url, str):
+        return ""
+    return urldefrag(url.strip())[0]
+
+
+def split_links(links):
+    """crawler.py 用 "; " 连接出链，这里按 ";" 拆分后逐个规范化"""
+    if not isinstance(links, str) or not links.strip():
+        return []
+    return [link for link in map(normalize_url, links.split(";")) if link]
+
+
+# 第一遍：url -> 行号
+def build_url_index(file_path, chunk_size=10000):
+    url_to_row = {}
+    num_rows = 0
+    for chunk in pd.read_csv(file_path, usecols=["url"], chunksize=chunk_size):
+        for url in chunk["url"]:
+            url_to_row.setdefault(normalize_url(url), num_rows)
+            num_rows += 1
+    return url_to_row, num_rows
+
+
+# 第二遍：逐块生成 CSR 的出链
+def build_link_graph(file_path, output_dir=LINK_GRAPH_DIR, chunk_size=10000):
+    """构建链接图并保存到 output_dir，返回 (indptr, indices)"""
+    url_to_row, num_rows = build_url_index(file_path, chunk_size)
+
+    out_degree = np.zeros(num_rows, dtype=np.int64)
+    index_chunks = []
+    row = 0
+    for chunk in pd.read_csv(file_path, usecols=["links"], chunksize=chunk_size):
+        for links in chunk["links"]:
+            targets = [
+                url_to_row[link] for link in split_links(links) if link in url_to_row
+            ]
+            out_degree[row] = len(targets)
+            if targets:
+                index_chunks.append(np.array(targets, dtype=np.int32))
+            row += 1
+
+    indptr = np.zeros(num_rows + 1, dtype=np.int64)
+    np.cumsum(out_degree, out=indptr[1:])
+    indices = (
+        np.concatenate(index_chunks) if index_chunks else np.zeros(0, dtype=np.int32)
+    )
+
+    os.makedirs(output_dir, exist_ok=True)
+    np.save(os.path.join(output_dir, "indptr.npy"), indptr)
+    np.save(os.path.join(output_dir, "indices.npy"), indices)
+    print(f"链接图已保存到 {output_dir}: {num_rows} 个节点, {len(indices)} 条边")
+    return indptr, indices
+
+
+def load_link_graph(graph_dir=LINK_GRAPH_DIR):
+    """以内存映射方式加载链接图，返回 (indptr, indices)"""
+    indptr = np.load(os.path.join(graph_dir, "indptr.npy"), mmap_mode="r")
+    indices = np.load(os.path.join(graph_dir, "indices.npy"), mmap_mode="r")
+    return indptr, indices
+
+
+def link_graph_up_to_date(file_path, graph_dir=LINK_GRAPH_DIR):
+    """链接图存在且不早于爬取结果时可直接复用"""
+    indptr_path = os.path.join(graph_dir, "indptr.npy")
+    return os.path.exists(indptr_path) and os.path.getmtime(
+        indptr_path
+    ) >= os.path.getmtime(file_path)
+
+
+if __name__ == "__main__":
+    build_link_graph("../crawler/title_url_anchor_body.csv")
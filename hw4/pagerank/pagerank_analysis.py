@@ -1,106 +1,65 @@
+import os
+import sys
+import numpy as np
 import pandas as pd
-from collections import defaultdict
-import multiprocessing as mp
-
-
-# 数据读取与预处理
-def read_and_preprocess(file_path):
-    data = pd.read_csv(file_path)
-    url_set = set(data["url"])  # 存在的 URL 集合
-    graph = defaultdict(list)
-
-    for _, row in data.iterrows():
-        url = row["url"]
-        links = row["links"]
-
-        if pd.isna(links) or links.strip() == "":
-            graph[url] = []  # 作为叶子节点
-        else:
-            valid_links = [link for link in links.split(";") if link in url_set]
-            graph[url] = valid_links
-
-    return graph, data
-
-
-# 全局默认值初始化函数（避免 lambda）
-def default_pr_value(num_nodes, damping_factor):
-    return damping_factor / num_nodes
-
-
-# 并行 PageRank 子任务
-def pagerank_worker(task_data):
-    graph, damping, global_pr, damping_factor, num_nodes, nodes = task_data
-    local_pr = {node: global_pr[node] for node in nodes}
-
-    # 初始化 PR 值的字典
-    new_pr = {node: damping_factor / num_nodes for node in graph}
-
-    for node in nodes:
-        if not graph[node]:  # 处理叶子节点
-            for other_node in graph:
-                new_pr[other_node] += damping * (local_pr[node] / num_nodes)
-        else:
-            for out_node in graph[node]:
-                new_pr[out_node] += damping * (local_pr[node] / len(graph[node]))
-
-    return new_pr
-
-
-# 并行计算 PageRank
-def parallel_pagerank(graph, damping=0.85, max_iter=100, tol=1e-6):
-    num_nodes = len(graph)
-    damping_factor = 1 - damping
-
-    # 初始化 PR 值
-    global_pr = {node: 1 / num_nodes for node in graph}
-
-    nodes = list(graph.keys())
-    num_workers = min(mp.cpu_count(), len(nodes))
-    chunks = [nodes[i::num_workers] for i in range(num_workers)]
-
+from scipy import sparse
+from link_graph import (
+    LINK_GRAPH_DIR,
+    DOC_ID_BASE,
+    build_link_graph,
+    link_graph_up_to_date,
+    load_link_graph,
+)
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "../indexer"))
+from index_versions import new_version_path, publish_version, remove_version
+
+
+# 基于 CSR 邻接矩阵的幂迭代 PageRank
+def csr_pagerank(indptr, indices, num_nodes, damping=0.85, max_iter=100, tol=1e-6):
+    """PR = (1 - d) / N + d * (M @ PR + 悬挂节点的 PR 之和 / N)
+
+    M 为按出度归一化的转移矩阵（列 u 的非零元为 1 / outdeg(u)），
+    悬挂节点（没有出链）的 PR 每轮作为一个整体均匀分给所有节点，不再逐节点遍历。
+    """
+    out_degree = np.diff(indptr)
+    sources = np.repeat(np.arange(num_nodes, dtype=np.int32), out_degree)
+    # 重复的出链会被累加，与原先按出链列表逐条分配的做法一致
+    transition = sparse.csr_matrix(
+        (1.0 / out_degree[sources], (indices, sources)), shape=(num_nodes, num_nodes)
+    )
+    dangling = out_degree == 0
+
+    pr = np.full(num_nodes, 1.0 / num_nodes)
     for iteration in range(max_iter):
-        with mp.Pool(num_workers) as pool:
-            results = pool.map(
-                pagerank_worker,
-                [
-                    (
-                        graph,
-                        damping,
-                        global_pr.copy(),
-                        damping_factor,
-                        num_nodes,
-                        chunk,
-                    )
-                    for chunk in chunks
-                ],
-            )
-
-        # 合并子任务结果
-        new_global_pr = {node: damping_factor / num_nodes for node in graph}
-        for partial_pr in results:
-            for node, value in partial_pr.items():
-                new_global_pr[node] += value
+        dangling_mass = pr[dangling].sum()
+        new_pr = damping * (transition @ pr + dangling_mass / num_nodes)
+        new_pr += (1 - damping) / num_nodes
 
         # 收敛判断
-        diff = sum(
-            abs(new_global_pr[node] - global_pr.get(node, 0)) for node in new_global_pr
-        )
+        diff = np.abs(new_pr - pr).sum()
         print(f"Iteration {iteration + 1}/{max_iter}, Difference: {diff:.6f}")
+        pr = new_pr
         if diff < tol:
             print("Convergence achieved!")
-            return dict(new_global_pr)
-
-        # 更新全局 PR
-        global_pr = dict(new_global_pr)
+            return pr
 
     print("Max iterations reached without convergence.")
-    return dict(global_pr)
+    return pr
 
 
 # 结果保存
-def save_results(data, pr, output_file):
-    data["pagerank"] = data["url"].map(pr).fillna(0)
-    result = data[["url", "pagerank"]]
+def save_results(file_path, pr, output_file, chunk_size=10000):
+    """按爬取结果的行顺序输出 url、pagerank 以及对应的文档号 line_number"""
+    chunks = pd.read_csv(file_path, usecols=["url"], chunksize=chunk_size)
+    urls = pd.concat(chunk["url"] for chunk in chunks)
+    result = pd.DataFrame(
+        {
+            "url": urls.to_numpy(),
+            "pagerank": pr,
+            "line_number": np.arange(len(pr)) + DOC_ID_BASE,
+        }
+    )
     result.to_csv(output_file, index=False)
     print(f"Results saved to {output_file}")
 
@@ -112,12 +71,14 @@ if __name__ == "__main__":
     output_file = "pagerank_results.csv"
 
     try:
-        # 数据读取与预处理
-        graph, data = read_and_preprocess(file_path)
-        print("Data preprocessing completed.")
-
-        # 并行计算 PageRank
-        final_pr = parallel_pagerank(graph)
+        # 构建（或直接加载已有的）整数编号链接图
+        if not link_graph_up_to_date(file_path, LINK_GRAPH_DIR):
+            build_link_graph(file_path, LINK_GRAPH_DIR)
+        indptr, indices = load_link_graph(LINK_GRAPH_DIR)
+        print("Link graph loaded.")
+
+        # 计算 PageRank
+        final_pr = csr_pagerank(indptr, indices, len(indptr) - 1)
         print("PageRank computation completed.")
 
     except Exception as e:
@@ -125,7 +86,14 @@ if __name__ == "__main__":
         final_pr = None
 
     finally:
-        if final_pr:
-            save_results(data, final_pr, output_file)
+        if final_pr is not None:
+            # 写入新版本后再切换，常驻的搜索引擎会在后台加载新的 PageRank
+            version_path = new_version_path(output_file)
+            try:
+                save_results(file_path, final_pr, version_path)
+            except BaseException:
+                remove_version(version_path)
+                raise
+            publish_version(output_file, version_path)
         else:
             print("PageRank computation failed; no results to save.")
@@ -0,0 +1,92 @@
+import time
+import random
+import numpy as np
+from collections import defaultdict
+from search import compute_document_scores_history
+
+
+# 原先逐个 (词, 文档) 重建稠密向量的实现，仅用于对比
+def compute_document_scores_history_legacy(
+    term_to_doc_tf_idf, pagerank_scores, history_doc_tf_idf
+):
+    doc_scores = defaultdict(float)
+
+    vocab = set()
+    for tf_idf in term_to_doc_tf_idf.values():
+        vocab.update(tf_idf.keys())
+    for tf_idf in history_doc_tf_idf.values():
+        vocab.update(tf_idf.keys())
+    vocab = sorted(vocab)
+
+    def vectorize(tf_idf, vocab):
+        return np.array([tf_idf.get(term, 0) for term in vocab])
+
+    if history_doc_tf_idf:
+        history_vector = np.sum(
+            [vectorize(tf_idf, vocab) for tf_idf in history_doc_tf_idf.values()], axis=0
+        )
+        history_norm = np.linalg.norm(history_vector)
+        if history_norm > 0:
+            history_vector /= history_norm
+        else:
+            history_vector = None
+    else:
+        history_vector = None
+
+    for term, doc_tf_idf in term_to_doc_tf_idf.items():
+        for doc_id, tf_idf in doc_tf_idf.items():
+            pagerank = pagerank_scores.get(doc_id, 0)
+            doc_vector = vectorize(doc_tf_idf, vocab)
+            doc_norm = np.linalg.norm(doc_vector)
+            if doc_norm > 0:
+                doc_vector /= doc_norm
+            if history_vector is not None:
+                cosine_similarity = np.dot(history_vector, doc_vector)
+            else:
+                cosine_similarity = 0
+            doc_scores[doc_id] += tf_idf * pagerank * (1 + cosine_similarity)
+
+    return doc_scores
+
+
+# 生成随机的查询/历史 TF-IDF 数据
+def make_term_dicts(num_terms, docs_per_term, num_docs):
+    return {
+        f"term{t}": {
+            str(doc_id): random.random()
+            for doc_id in random.sample(range(1, num_docs + 1), docs_per_term)
+        }
+        for t in range(num_terms)
+    }
+
+
+def run_benchmark(num_docs, docs_per_term, query_terms=2, history_terms=3):
+    term_to_doc_tf_idf = make_term_dicts(query_terms, docs_per_term, num_docs)
+    history_doc_tf_idf = make_term_dicts(history_terms, docs_per_term, num_docs)
+    pagerank_scores = {str(d): random.random() / num_docs for d in range(num_docs + 1)}
+
+    start = time.perf_counter()
+    legacy = compute_document_scores_history_legacy(
+        term_to_doc_tf_idf, pagerank_scores, history_doc_tf_idf
+    )
+    legacy_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    scores = compute_document_scores_history(
+        term_to_doc_tf_idf, pagerank_scores, history_doc_tf_idf
+    )
+    sparse_time = time.perf_counter() - start
+
+    assert legacy.keys() == scores.keys()
+    max_diff = max(abs(legacy[d] - scores[d]) for d in legacy)
+    print(
+        f"文档数 {num_docs:>6}, 每词文档数 {docs_per_term:>5}: "
+        f"原实现 {legacy_time:8.3f}s, 稀疏矩阵 {sparse_time:8.4f}s, "
+        f"加速 {legacy_time / sparse_time:8.1f}x, 最大误差 {max_diff:.2e}"
+    )
+
+
+if __name__ == "__main__":
+    random.seed(0)
+    for num_docs, docs_per_term in [(2000, 100), (10000, 500), (50000, 2000)]:
+        run_benchmark(num_docs, docs_per_term)
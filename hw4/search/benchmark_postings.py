@@ -0,0 +1,132 @@
+import os
+import sys
+import time
+import argparse
+from search import TF_IDF_DIR, QUERY_LOG_FILE, get_recent_queries
+from phrase_query import split_query, is_positional_query
+from boolean_query import is_boolean_query, parse_boolean_query, load_boolean_tf_idf
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "../indexer"))
+from postings import CompressedPostings
+from segments import open_postings_reader
+from index_versions import resolve_version
+from roaring import Bitmap
+
+# 倒排记录格式与求交集方式的对比
+#
+# 查询取自查询日志（query_log.txt）中不同的查询（原实现只支持 AND，跳过含短语、OR、NOT 的查询），
+# 日志为空时取 df 最高的词项两两组合。
+# 对每个查询分别计时：
+#   原实现  每个词项完整解码后转成字符串集合求交集
+#   现实现  按 df 从小到大求交集，位图与位图按容器位与，其余按位测试或按跳表查找
+# 另外统计以位图保存的词项及其相对 VB 编码节省的空间。
+
+
+def load_log_queries(log_file, num_queries):
+    queries = []
+    for query in get_recent_queries(log_file, num_queries):
+        query_terms = split_query(query)
+        if (
+            query_terms
+            and not is_positional_query(query_terms)
+            and not is_boolean_query(query_terms)
+        ):
+            queries.append(query_terms)
+    return queries
+
+
+def frequent_term_queries(reader, num_terms=8):
+    terms = sorted(reader.keys(), key=reader.df, reverse=True)[:num_terms]
+    return [[a, b] for i, a in enumerate(terms) for b in terms[i + 1 :]]
+
+
+# 原先逐个词项完整解码后按集合求交集的实现，仅用于对比
+def load_tf_idf_legacy(reader, terms):
+    term_to_doc_tf_idf = {}
+    all_doc_ids = None
+    for term in terms:
+        doc_ids, weights, _ = reader.postings(term)
+        doc_keys = list(map(str, doc_ids.tolist()))
+        term_to_doc_tf_idf[term] = dict(zip(doc_keys, weights.tolist()))
+        all_doc_ids = (
+            set(doc_keys) if all_doc_ids is None else all_doc_ids & set(doc_keys)
+        )
+    return {
+        term: {d: w for d, w in doc_tf_idf.items() if d in all_doc_ids}
+        for term, doc_tf_idf in term_to_doc_tf_idf.items()
+    }
+
+
+def timed(function, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = function()
+    return (time.perf_counter() - start) / repeat, result
+
+
+def bitmap_stats(reader, terms):
+    """查询中各词项的 (df, 是否为位图, 位图字节数, VB 字节数)"""
+    stats = {}
+    for term in dict.fromkeys(terms):
+        doc_ids, _, _ = reader.postings(term)
+        stats[term] = (
+            len(doc_ids),
+            reader.bitmap(term) is not None and len(doc_ids) > 0,
+            len(Bitmap.from_doc_ids(doc_ids).encode()),
+            len(CompressedPostings.encode(doc_ids)),
+        )
+    return stats
+
+
+def run_benchmark(index_dir, queries, repeat):
+    reader = open_postings_reader(index_dir)
+    total_legacy = total_new = 0.0
+    for query_terms in queries:
+        legacy_time, legacy = timed(
+            lambda: load_tf_idf_legacy(reader, query_terms), repeat
+        )
+        query = parse_boolean_query(query_terms)
+        new_time, result = timed(lambda: load_boolean_tf_idf(reader, query), repeat)
+        assert {t: d for t, d in legacy.items() if d} == {
+            t: d for t, d in result.items() if d
+        }
+        total_legacy += legacy_time
+        total_new += new_time
+        matched = len(set().union(*(d.keys() for d in result.values())))
+        print(
+            f"{' '.join(query_terms):<24} 命中 {matched:>7}: "
+            f"原实现 {legacy_time * 1000:8.2f}ms, 现实现 {new_time * 1000:8.2f}ms, "
+            f"加速 {legacy_time / max(new_time, 1e-9):6.1f}x"
+        )
+        for term, (df, is_bitmap, bitmap_bytes, vb_bytes) in bitmap_stats(
+            reader, query_terms
+        ).items():
+            print(
+                f"    {term:<20} df {df:>7} {'位图' if is_bitmap else '间距'}, "
+                f"位图 {bitmap_bytes:>8} B, VB {vb_bytes:>8} B"
+            )
+    if queries:
+        print(
+            f"共 {len(queries)} 个查询：原实现 {total_legacy * 1000:.2f}ms, "
+            f"现实现 {total_new * 1000:.2f}ms, "
+            f"加速 {total_legacy / max(total_new, 1e-9):.1f}x"
+        )
+    reader.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="倒排记录求交集的速度对比")
+    parser.add_argument("--index", default=TF_IDF_DIR, help="TF-IDF 索引目录")
+    parser.add_argument("--log", default=QUERY_LOG_FILE, help="查询日志文件")
+    parser.add_argument("--queries", type=int, default=50, help="最多取日志中的查询数")
+    parser.add_argument("--repeat", type=int, default=5, help="每个查询重复次数")
+    args = parser.parse_args()
+
+    index_dir = resolve_version(args.index)
+    queries = load_log_queries(args.log, args.queries)
+    if not queries:
+        print("查询日志为空，使用 df 最高的词项两两组合")
+        reader = open_postings_reader(index_dir)
+        queries = frequent_term_queries(reader)
+        reader.close()
+    run_benchmark(index_dir, queries, args.repeat)
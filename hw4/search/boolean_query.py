@@ -0,0 +1,154 @@
+import os
+import sys
+from functools import reduce
+from operator import or_
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "../indexer"))
+from wildcard_index import is_wildcard
+
+# 布尔查询（AND / OR / NOT）
+#
+# 查询词之间默认为 AND；a OR b 表示两者出现其一即可（可连写 a OR b OR c），NOT a 排除含 a 的文档。
+# 每个 AND 子句是一组用 OR 连接的词，求值时子句按 df 之和从小到大排列（通配符子句排在最后）：
+#   1. df 最小的子句完整解码，其中各词文档号的并集作为候选文档；
+#   2. 之后的子句只在各自的倒排记录中查找候选文档（PostingsReader.lookup_docs 按跳表只解码
+#      涉及的块），不含该子句任何一个词的候选被去掉；
+#   3. 最后去掉出现 NOT 词项的候选。
+# 候选文档只减不增，除第一个子句外内存与候选文档数成正比，而不是与最长的倒排记录成正比。
+#
+# 高频词项的文档号以压缩位图保存（见 indexer/roaring.py），每一对操作数按格式选择求交集的方法：
+#   位图 AND 位图  排在前面的子句都以位图保存时，先按容器直接位与（子句内的 OR 为位或），
+#                 得到的文档作为候选，省去逐个文档的查找；
+#   数组 AND 位图  候选文档在位图中按位测试；
+#   数组 AND 数组  按跳表只解码涉及的块（见 PostingsReader.lookup_docs）。
+
+OR_OPERATOR = "OR"
+NOT_OPERATOR = "NOT"
+
+
+class BooleanQuery:
+    """clauses 为 [[词, ...], ...]，子句之间为 AND、子句内为 OR；excluded 为 NOT 的词"""
+
+    def __init__(self, clauses, excluded):
+        self.clauses = clauses
+        self.excluded = excluded
+
+    def terms(self):
+        """需要计算权重的查询词（不含 NOT 的词）"""
+        return list(dict.fromkeys(t for clause in self.clauses for t in clause))
+
+
+def is_boolean_query(query_terms):
+    return any(t in (OR_OPERATOR, NOT_OPERATOR) for t in query_terms)
+
+
+def parse_boolean_query(query_terms):
+    """将查询词列表解析为 BooleanQuery，语法错误时抛出 ValueError"""
+    clauses, excluded = [], []
+    pending = None  # 等待下一个词的运算符
+    for token in query_terms:
+        if token == OR_OPERATOR:
+            if not clauses or pending is not None:
+                raise ValueError("OR 必须位于两个查询词之间")
+            pending = OR_OPERATOR
+        elif token == NOT_OPERATOR:
+            if pending is not None:
+                raise ValueError(f"{pending} 之后不能紧跟 NOT")
+            pending = NOT_OPERATOR
+        elif pending == OR_OPERATOR:
+            clauses[-1].append(token)
+            pending = None
+        elif pending == NOT_OPERATOR:
+            excluded.append(token)
+            pending = None
+        else:
+            clauses.append([token])
+    if pending is not None:
+        raise ValueError(f"{pending} 之后缺少查询词")
+    if not clauses:
+        raise ValueError("查询中至少需要一个不带 NOT 的查询词")
+    return BooleanQuery(clauses, excluded)
+
+
+def clause_cost(reader, clause):
+    """子句的文档数上界，通配符的匹配词数事先未知，排在精确子句之后"""
+    if any(is_wildcard(term) for term in clause):
+        return np.inf
+    return sum(reader.df(term) for term in clause)
+
+
+def intersect_bitmaps(reader, clauses):
+    """排在前面、所有词项都以位图保存的子句按容器求交集，第一个子句不是位图时返回 None"""
+    bitmap = None
+    for clause in clauses:
+        bitmaps = [reader.bitmap(term) for term in dict.fromkeys(clause)]
+        if any(b is None for b in bitmaps):
+            break
+        clause_bitmap = reduce(or_, bitmaps)
+        bitmap = clause_bitmap if bitmap is None else bitmap & clause_bitmap
+    return bitmap
+
+
+def evaluate_boolean_query(reader, query):
+    """返回 (文档号数组, {词项: 权重数组})，文档号升序，权重数组与文档号对齐，不含该词的文档为 nan
+
+    reader 为 PostingsReader 或 SegmentedPostingsReader。
+    """
+    clauses = sorted(query.clauses, key=lambda clause: clause_cost(reader, clause))
+    term_weights = {}
+    bitmap = intersect_bitmaps(reader, clauses)
+    if bitmap is not None:
+        # 位图求交的结果作为候选，所有子句（包括已求交的）再查找一遍以取得权重
+        doc_ids = bitmap.to_array()
+        probed = clauses
+    else:
+        # 完整解码 df 最小的子句
+        lead = {term: reader.postings(term)[:2] for term in dict.fromkeys(clauses[0])}
+        doc_ids = np.unique(
+            np.concatenate(
+                [np.zeros(0, dtype=np.int64)] + [p[0] for p in lead.values()]
+            )
+        )
+        for term, (term_doc_ids, weights) in lead.items():
+            aligned = np.full(len(doc_ids), np.nan, dtype=np.float32)
+            aligned[np.searchsorted(doc_ids, term_doc_ids)] = weights
+            term_weights[term] = aligned
+        probed = clauses[1:]
+
+    # 其余子句只查找候选文档
+    for clause in probed:
+        if len(doc_ids) == 0:
+            break
+        matched = np.zeros(len(doc_ids), dtype=bool)
+        for term in dict.fromkeys(clause):
+            if term not in term_weights:
+                found, weights = reader.lookup_docs(term, doc_ids)
+                aligned = np.full(len(doc_ids), np.nan, dtype=np.float32)
+                aligned[found] = weights
+                term_weights[term] = aligned
+            matched |= ~np.isnan(term_weights[term])
+        doc_ids = doc_ids[matched]
+        term_weights = {term: w[matched] for term, w in term_weights.items()}
+
+    for term in query.excluded:
+        if len(doc_ids) == 0:
+            break
+        found, _ = reader.lookup_docs(term, doc_ids)
+        doc_ids = doc_ids[~found]
+        term_weights = {t: w[~found] for t, w in term_weights.items()}
+    return doc_ids, term_weights
+
+
+def load_boolean_tf_idf(reader, query):
+    """与 load_tf_idf_for_terms 的返回格式相同：{查询词: {文档号: 权重}}，只包含满足查询的文档"""
+    doc_ids, term_weights = evaluate_boolean_query(reader, query)
+    doc_keys = np.array(list(map(str, doc_ids.tolist())), dtype=object)
+    term_to_doc_tf_idf = {}
+    for term in query.terms():
+        weights = term_weights.get(term, np.zeros(0, dtype=np.float32))
+        present = ~np.isnan(weights)
+        term_to_doc_tf_idf[term] = dict(
+            zip(doc_keys[present].tolist(), weights[present].tolist())
+        )
+    return term_to_doc_tf_idf
@@ -0,0 +1,284 @@
+import os
+import re
+import sys
+import unicodedata
+import jieba
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "../indexer"))
+from wildcard_index import is_wildcard
+
+# 短语与邻近查询
+#
+# 查询中用双引号括起的部分为短语，如 "南开 大学"；两个查询项之间的 NEAR/k 表示二者之间最多相隔
+# k 个位置（相邻为 0），如 南开 NEAR/5 校庆。
+# 位置倒排索引（build_index.py 的输出）中的位置是词在文档分词结果中的序号，停用词和空白也占位置，
+# 因此短语按与建索引相同的方式分词，被过滤掉的词保留其位置，短语内各词的相对位置与文档中一致。
+#
+# 求值分两步：先对文档号求交集（从 df 最小的词项开始，在其余列表中二分查找跳过不相关的文档），
+# 再只对候选文档解码位置（见 postings.PositionalPostings），用 (候选文档, 位置 - 偏移) 的键求交集
+# 得到短语的出现位置。相邻两个查询项的最小间隔作为排序特征：
+#     得分 *= 1 + PROXIMITY_WEIGHT * 平均(1 / (1 + 间隔))
+
+PROXIMITY_WEIGHT = 0.5
+NEAR_PATTERN = re.compile(r"NEAR/(\d+)")
+QUERY_TOKEN_PATTERN = re.compile(r'"([^"]*)(?:"|$)|(\S+)')  # 未闭合的引号到结尾为止
+
+# 与 build_index.index_tokens 一致的停用词表和词的标准化
+INDEXER_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../indexer")
+STOPWORDS_FILES = ["cn_stopwords.txt", "baidu_stopwords.txt"]
+
+
+def load_stopwords(stopword_files):
+    stopwords = set()
+    for file in stopword_files:
+        with open(os.path.join(INDEXER_DIR, file), "r", encoding="utf-8") as f:
+            stopwords.update(line.strip() for line in f)
+    return stopwords
+
+
+STOPWORDS = load_stopwords(STOPWORDS_FILES)
+
+
+def normalize_word(word):
+    return word.lower().strip(",.!?;:\"'()[]{}")
+
+
+# 查询解析
+def split_query(text):
+    """按空白切分查询，双引号内的短语保留为一项（带引号）"""
+    tokens = []
+    for match in QUERY_TOKEN_PATTERN.finditer(text):
+        if match.group(2) is not None:
+            tokens.append(match.group(2))
+        elif match.group(1).strip():
+            tokens.append(f'"{match.group(1).strip()}"')
+    return tokens
+
+
+def is_phrase(token):
+    return len(token) >= 2 and token.startswith('"') and token.endswith('"')
+
+
+def is_positional_query(query_terms):
+    """查询中含有短语或 NEAR/k 时需要位置倒排索引"""
+    return any(is_phrase(t) or NEAR_PATTERN.fullmatch(t) for t in query_terms)
+
+
+def analyze_phrase(text):
+    """返回 [(位置, 词), ...]，位置为分词结果中的序号"""
+    words = jieba.lcut(unicodedata.normalize("NFC", text))
+    analyzed = []
+    for position, word in enumerate(words):
+        word = normalize_word(word)
+        # 空白只占位置，不作为查询词（文档中空白处的分隔符可能不同）
+        if word.strip() and word not in STOPWORDS:
+            analyzed.append((position, word))
+    return analyzed
+
+
+class Operand:
+    """一个查询项：单个词或短语，offsets 为各词相对第一个词的位置"""
+
+    def __init__(self, terms, offsets):
+        self.terms = terms
+        self.offsets = offsets
+        self.length = offsets[-1] + 1  # 占据的位置数
+
+
+class PositionalQuery:
+    """operands 为按查询顺序排列的查询项，near 为 {i: k}，表示第 i 项与第 i + 1 项最多相隔 k"""
+
+    def __init__(self, operands, near):
+        self.operands = operands
+        self.near = near
+
+    def terms(self):
+        return list(
+            dict.fromkeys(t for operand in self.operands for t in operand.terms)
+        )
+
+
+def parse_query(query_terms):
+    """将 split_query 的结果解析为 PositionalQuery，语法错误时抛出 ValueError"""
+    operands, near = [], {}
+    pending_near = None
+    for token in query_terms:
+        match = NEAR_PATTERN.fullmatch(token)
+        if match:
+            if not operands or pending_near is not None:
+                raise ValueError("NEAR/k 必须位于两个查询项之间")
+            pending_near = int(match.group(1))
+            continue
+        if is_phrase(token):
+            analyzed = analyze_phrase(token[1:-1])
+            if not analyzed:
+                raise ValueError(f"短语中没有可查询的词: {token}")
+            first = analyzed[0][0]
+            operand = Operand(
+                [word for _, word in analyzed],
+                [position - first for position, _ in analyzed],
+            )
+        elif is_wildcard(token):
+            raise ValueError(f"通配符不能与短语或 NEAR 一起使用: {token}")
+        elif token in ("OR", "NOT"):
+            raise ValueError(f"{token} 不能与短语或 NEAR 一起使用")
+        else:
+            operand = Operand([token], [0])
+        if pending_near is not None:
+            near[len(operands) - 1] = pending_near
+            pending_near = None
+        operands.append(operand)
+    if pending_near is not None:
+        raise ValueError("NEAR/k 必须位于两个查询项之间")
+    if not operands:
+        raise ValueError("请输入有效的查询词")
+    return PositionalQuery(operands, near)
+
+
+# 求值
+def contains(sorted_values, values):
+    """values 中每个数是否出现在升序数组 sorted_values 中"""
+    if len(sorted_values) == 0:
+        return np.zeros(len(values), dtype=bool)
+    pos = np.searchsorted(sorted_values, values)
+    return sorted_values[np.minimum(pos, len(sorted_values) - 1)] == values
+
+
+def operand_occurrences(operand, term_keys):
+    """短语每次出现的起点键（候选文档 * stride + 位置），升序
+
+    从出现次数最少的词开始，依次在其余词的位置中二分查找，只保留各词都在对应偏移处出现的起点。
+    """
+    order = sorted(
+        zip(operand.terms, operand.offsets), key=lambda item: len(term_keys[item[0]])
+    )
+    term, offset = order[0]
+    keys = term_keys[term] - offset
+    for term, offset in order[1:]:
+        if len(keys) == 0:
+            break
+        keys = keys[contains(term_keys[term] - offset, keys)]
+    return keys
+
+
+def min_gaps(keys_a, length_a, keys_b, length_b, stride, num_docs):
+    """每个候选文档中 a、b 两项出现位置之间的最小间隔，没有同时出现时为 inf"""
+    gaps_by_doc = np.full(num_docs, np.inf)
+    if len(keys_a) == 0 or len(keys_b) == 0:
+        return gaps_by_doc
+    owners_b = keys_b // stride
+    right = np.searchsorted(keys_a, keys_b, side="right")
+    # 起点不晚于 b 的最后一个 a：间隔为 b 的起点 - a 的终点 - 1
+    previous = np.maximum(right - 1, 0)
+    has_previous = (right > 0) & (keys_a[previous] // stride == owners_b)
+    gap_previous = np.where(has_previous, keys_b - keys_a[previous] - length_a, np.inf)
+    # 起点晚于 b 的第一个 a
+    following = np.minimum(right, len(keys_a) - 1)
+    has_following = (right < len(keys_a)) & (keys_a[following] // stride == owners_b)
+    gap_following = np.where(
+        has_following, keys_a[following] - keys_b - length_b, np.inf
+    )
+    # 两项重叠（短语包含另一项）时间隔记为 0
+    gaps = np.maximum(np.minimum(gap_previous, gap_following), 0)
+    np.minimum.at(gaps_by_doc, owners_b, gaps)
+    return gaps_by_doc
+
+
+def match_segment(segment_postings, query, live):
+    """segment_postings 为 {词项: PositionalPostings}，返回 (文档号数组, 邻近度数组)"""
+    empty = np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float64)
+    # 文档号求交集，从最短的列表开始
+    order = sorted(segment_postings, key=lambda t: len(segment_postings[t]))
+    candidates = segment_postings[order[0]].doc_ids
+    candidates = candidates[live(candidates)]
+    for term in order[1:]:
+        if len(candidates) == 0:
+            break
+        candidates = candidates[contains(segment_postings[term].doc_ids, candidates)]
+    if len(candidates) == 0:
+        return empty
+
+    # 只解码候选文档的位置
+    term_positions = {}
+    for term, postings in segment_postings.items():
+        rows = np.searchsorted(postings.doc_ids, candidates)
+        term_positions[term] = postings.positions(rows)
+    max_position = max(int(p.max()) for _, p in term_positions.values())
+    stride = max_position + max(op.length for op in query.operands) + 1
+    term_keys = {
+        term: owners * stride + positions
+        for term, (owners, positions) in term_positions.items()
+    }
+
+    occurrences = [operand_occurrences(op, term_keys) for op in query.operands]
+    keep = np.ones(len(candidates), dtype=bool)
+    for keys in occurrences:
+        present = np.zeros(len(candidates), dtype=bool)
+        present[keys // stride] = True
+        keep &= present
+
+    # 相邻两项的最小间隔：既用于 NEAR 条件，也作为邻近度特征
+    closeness = np.zeros(len(candidates), dtype=np.float64)
+    for i in range(len(query.operands) - 1):
+        gaps = min_gaps(
+            occurrences[i],
+            query.operands[i].length,
+            occurrences[i + 1],
+            query.operands[i + 1].length,
+            stride,
+            len(candidates),
+        )
+        if i in query.near:
+            keep &= gaps <= query.near[i]
+        closeness += 1 / (1 + gaps)
+    if len(query.operands) > 1:
+        proximity = closeness / (len(query.operands) - 1)
+    else:
+        proximity = np.ones(len(candidates), dtype=np.float64)
+    return candidates[keep], proximity[keep]
+
+
+def match_documents(reader, query):
+    """返回满足短语和 NEAR 条件的 (文档号数组, 邻近度数组)，文档号升序
+
+    reader 为分段索引的读取器（SegmentedPostingsReader），各段分别求值后拼接。
+    """
+    terms = query.terms()
+    term_segments = {term: reader.positional_postings(term) for term in terms}
+    doc_parts = [np.zeros(0, dtype=np.int64)]
+    proximity_parts = [np.zeros(0, dtype=np.float64)]
+    for s in range(len(term_segments[terms[0]])):
+        segment_postings = {term: term_segments[term][s] for term in terms}
+        if any(postings is None for postings in segment_postings.values()):
+            continue
+        doc_ids, proximity = match_segment(segment_postings, query, reader.live)
+        doc_parts.append(doc_ids)
+        proximity_parts.append(proximity)
+    return np.concatenate(doc_parts), np.concatenate(proximity_parts)
+
+
+def load_positional_tf_idf(reader, query):
+    """返回 (term_to_doc_tf_idf, 文档号 -> 邻近度)，只包含满足短语和 NEAR 条件的文档
+
+    term_to_doc_tf_idf 与 load_tf_idf_for_terms 的返回格式相同，可直接交给已有的打分函数。
+    """
+    doc_ids, proximity = match_documents(reader, query)
+    doc_keys = np.array(list(map(str, doc_ids.tolist())), dtype=object)
+    term_to_doc_tf_idf = {}
+    for term in query.terms():
+        term_doc_ids, weights, _ = reader.postings(term)
+        found = contains(term_doc_ids, doc_ids)
+        rows = np.searchsorted(term_doc_ids, doc_ids[found])
+        term_to_doc_tf_idf[term] = dict(
+            zip(doc_keys[found].tolist(), weights[rows].tolist())
+        )
+    return term_to_doc_tf_idf, dict(zip(doc_keys.tolist(), proximity.tolist()))
+
+
+def apply_proximity(doc_scores, proximity, weight=PROXIMITY_WEIGHT):
+    """得分乘以 1 + weight * 邻近度"""
+    return {
+        doc_id: score * (1 + weight * proximity.get(doc_id, 0.0))
+        for doc_id, score in doc_scores.items()
+    }
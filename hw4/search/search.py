@@ -1,8 +1,9 @@
 import os
+import sys
 import json
 import pandas as pd
 from collections import defaultdict
-import csv
+from itertools import chain
 import re
 import requests
 from bs4 import BeautifulSoup
@@ -14,15 +15,26 @@ from urllib.request import urlretrieve
 import wget
 from sklearn.metrics.pairwise import cosine_similarity
 import numpy as np
+from scipy import sparse
 from term_association_search import search_associated_terms
+from phrase_query import split_query
+from boolean_query import parse_boolean_query, load_boolean_tf_idf
 
-# 文件路径配置
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "../indexer"))
+from postings import is_binary_index
+from segments import open_postings_reader
+from file_text import body_file_path, get_file_text_store
+from shards import shard_files_for_pattern
+
+# 文件路径配置（索引目录和 PageRank 结果为逻辑路径，实际读取当前版本，见 index_versions.py）
 TF_IDF_DIR = "../indexer/tf_idf_chunks"
 Title_TF_IDF_DIR = "../indexer/title_tf_idf_chunks"
 File_TF_IDF_DIR = "../indexer/file_tf_idf_chunks"
 
 PAGERANK_FILE = "../pagerank/pagerank_results.csv"
 DOC_MAPPING_FILE = "../crawler/linenumber_title_url_anchor_body.csv"
+FILE_TEXT_STORE = "../indexer/file_text.sqlite"  # 构建索引时提取的文件正文
+FILE_BASE_DIR = "../crawler"  # 文件路径的起始目录
 QUERY_LOG_FILE = "query_log.txt"
 RESULT_FILE = "result.txt"
 PAGE_PHOTOS_DIR = "page_photos"  # 网页快照保存的文件夹
@@ -120,31 +132,6 @@ def load_text_preview(content):
     return "\n".join(content.splitlines()[:30])
 
 
-# 加载 PageRank 数据
-def load_pagerank_data(pagerank_file):
-    """加载 PageRank 数据"""
-    pagerank_data = {}
-    with open(pagerank_file, "r", encoding="utf-8") as f:
-        reader = csv.reader(f)
-        next(reader)  # 跳过表头
-        for row in reader:
-            pagerank_data[row[0]] = float(row[1])
-    return pagerank_data
-
-
-# 获取查询词对应的TF-IDF索引文件
-def get_tf_idf_file_for_term(term):
-    """根据查询词确定对应的TF-IDF文件"""
-    if "\u4e00" <= term[0] <= "\u9fff":  # 中文字符
-        return f"chinese_{term[0]}.json"
-    elif term[0].isalpha():  # 英文字母
-        return f"alpha_{term[0].lower()}.json"
-    elif term[0].isdigit():  # 数字
-        return "numeric.json"
-    else:  # 其他符号
-        return "others.json"
-
-
 # 通配符转换为正则表达式
 def wildcard_to_regex(term):
     """将通配符查询转换为正则表达式"""
@@ -153,17 +140,13 @@ def wildcard_to_regex(term):
 
 
 # 动态加载查询词对应的TF-IDF文件并支持通配符查询
-def load_tf_idf_for_terms(terms, tf_idf_dir):
-    """加载查询词对应的TF-IDF文件，并支持通配符查询"""
-    loaded_files = {}
-    term_to_doc_tf_idf = defaultdict(dict)
-    all_doc_ids = None  # 用于存储所有查询词的交集文档ID
-
-    for term in terms:
-        regex = re.compile(wildcard_to_regex(term))  # 转换为正则表达式
-        file_name = get_tf_idf_file_for_term(term)
+def load_json_term(term, tf_idf_dir, loaded_files):
+    """从 JSON 分块中读取查询词（可含通配符）的 {文档号: 权重}"""
+    regex = re.compile(wildcard_to_regex(term))  # 转换为正则表达式
+    doc_tf_idf = {}
+    # 按分片清单（shards.json）找到可能包含该词的分块，通配符查询可能涉及多个分块
+    for file_name in shard_files_for_pattern(tf_idf_dir, term):
         file_path = os.path.join(tf_idf_dir, file_name)
-
         if file_path not in loaded_files:
             try:
                 with open(file_path, "r", encoding="utf-8") as f:
@@ -171,27 +154,60 @@ def load_tf_idf_for_terms(terms, tf_idf_dir):
             except FileNotFoundError:
                 loaded_files[file_path] = {}
 
-        current_doc_ids = set()
         for candidate_term, tf_idf_data in loaded_files[file_path].items():
             if regex.match(candidate_term):  # 匹配符合正则的词
                 for doc_id, tf_idf in tf_idf_data:
-                    term_to_doc_tf_idf[term][doc_id] = tf_idf
-                    current_doc_ids.add(doc_id)
+                    doc_tf_idf[doc_id] = tf_idf
+    return doc_tf_idf
+
+
+def load_tf_idf_for_terms(terms, tf_idf_dir, loaded_files=None):
+    """加载查询词对应的TF-IDF文件，支持通配符以及 OR、NOT 运算符（见 boolean_query.py）
+
+    loaded_files 可传入一个常驻的缓存（如 SearchEngine 的分块缓存），
+    不传则每次调用重新读取分块文件。
+    """
+    if loaded_files is None:
+        loaded_files = {}
+    term_to_doc_tf_idf = defaultdict(dict)
+    if not terms:
+        return term_to_doc_tf_idf
+    query = parse_boolean_query(terms)
+
+    if is_binary_index(tf_idf_dir):  # 二进制索引只加载一次词典，倒排记录按需读取
+        if (
+            tf_idf_dir not in loaded_files
+            or loaded_files[tf_idf_dir].is_stale()  # 分段索引有新的提交
+        ):
+            loaded_files[tf_idf_dir] = open_postings_reader(tf_idf_dir)
+        # 按 df 从小到大求交集，其余词项只查找候选文档
+        term_to_doc_tf_idf.update(load_boolean_tf_idf(loaded_files[tf_idf_dir], query))
+        return term_to_doc_tf_idf
+
+    all_doc_ids = None  # 用于存储满足所有子句的文档ID
+    for clause in query.clauses:
+        current_doc_ids = set()  # 子句内各词为 OR
+        for term in clause:
+            doc_tf_idf = load_json_term(term, tf_idf_dir, loaded_files)
+            if doc_tf_idf:
+                term_to_doc_tf_idf[term].update(doc_tf_idf)
+            current_doc_ids.update(doc_tf_idf)
 
         # 求交集
         if all_doc_ids is None:
             all_doc_ids = current_doc_ids
         else:
             all_doc_ids &= current_doc_ids
+    for term in query.excluded:
+        all_doc_ids -= load_json_term(term, tf_idf_dir, loaded_files).keys()
 
-    # 过滤掉不在交集中的文档
-    if all_doc_ids is not None:
-        for term in term_to_doc_tf_idf:
-            term_to_doc_tf_idf[term] = {
-                doc_id: tf_idf
-                for doc_id, tf_idf in term_to_doc_tf_idf[term].items()
-                if doc_id in all_doc_ids
-            }
+    # 过滤掉不满足查询的文档
+    for term in term_to_doc_tf_idf:
+        term_to_doc_tf_idf[term] = {
+            doc_id: tf_idf
+            for doc_id, tf_idf in term_to_doc_tf_idf[term].items()
+            if doc_id in all_doc_ids
+        }
 
     return term_to_doc_tf_idf
 
@@ -212,86 +228,79 @@ def compute_document_scores(term_to_doc_tf_idf, pagerank_scores):
 def compute_document_scores_history(
     term_to_doc_tf_idf, pagerank_scores, history_doc_tf_idf
 ):
-    """根据TF-IDF值、PageRank分数以及历史记录计算文档总得分"""
+    """根据TF-IDF值、PageRank分数以及历史记录计算文档总得分
+
+    每个查询词表示为文档空间上的 TF-IDF 向量，历史记录向量为各历史词向量之和。
+    得分 = Σ tf_idf * pagerank * (1 + cos(查询词向量, 历史记录向量))，
+    用稀疏矩阵一次矩阵-向量乘法算出所有查询词的余弦相似度。
+    """
     doc_scores = defaultdict(float)
 
-    # 获取全局词汇表
-    vocab = set()
-    for tf_idf in term_to_doc_tf_idf.values():
-        vocab.update(tf_idf.keys())
-    for tf_idf in history_doc_tf_idf.values():
-        vocab.update(tf_idf.keys())
-    vocab = sorted(vocab)
-
-    # 向量化方法
-    def vectorize(tf_idf, vocab):
-        return np.array([tf_idf.get(term, 0) for term in vocab])
-
-    # 构建历史记录向量
-    if history_doc_tf_idf:
-        history_vector = np.sum(
-            [vectorize(tf_idf, vocab) for tf_idf in history_doc_tf_idf.values()], axis=0
+    # 为所有出现过的文档分配列号
+    doc_index = {}
+    for tf_idf in chain(term_to_doc_tf_idf.values(), history_doc_tf_idf.values()):
+        for doc_id in tf_idf:
+            doc_index.setdefault(doc_id, len(doc_index))
+    if not doc_index:
+        return doc_scores
+
+    query_matrix = build_term_doc_matrix(term_to_doc_tf_idf.values(), doc_index)
+    history_matrix = build_term_doc_matrix(history_doc_tf_idf.values(), doc_index)
+
+    # 构建历史记录向量（只构建一次）
+    history_vector = np.asarray(history_matrix.sum(axis=0)).ravel()
+    history_norm = np.linalg.norm(history_vector)
+
+    # 每个查询词向量与历史记录向量的余弦相似度，无历史记录则相似度为0
+    if history_norm > 0:
+        row_norms = np.sqrt(np.asarray(query_matrix.multiply(query_matrix).sum(axis=1)))
+        row_norms = row_norms.ravel()
+        dots = query_matrix @ (history_vector / history_norm)
+        cosine = np.divide(
+            dots, row_norms, out=np.zeros_like(dots), where=row_norms > 0
         )
-        history_norm = np.linalg.norm(history_vector)
-        if history_norm > 0:
-            history_vector /= history_norm
-        else:
-            history_vector = None
     else:
-        history_vector = None
-
-    # 遍历文档TF-IDF数据
-    for term, doc_tf_idf in term_to_doc_tf_idf.items():
-        for doc_id, tf_idf in doc_tf_idf.items():
-            # 获取文档PageRank分数
-            pagerank = pagerank_scores.get(doc_id, 0)
-
-            # 构建文档向量
-            doc_vector = vectorize(doc_tf_idf, vocab)
-            doc_norm = np.linalg.norm(doc_vector)
-            if doc_norm > 0:
-                doc_vector /= doc_norm
-
-            # 计算文档与历史记录的余弦相似度
-            if history_vector is not None:
-                cosine_similarity = np.dot(history_vector, doc_vector)
-            else:
-                cosine_similarity = 0  # 无历史记录则相似度为0
-
-            # 综合得分计算
-            doc_scores[doc_id] += tf_idf * pagerank * (1 + cosine_similarity)
+        cosine = np.zeros(query_matrix.shape[0])
+
+    # 综合得分：tf_idf * pagerank * (1 + cos)，按文档列累加
+    doc_ids = list(doc_index)
+    pagerank = np.array([pagerank_scores.get(doc_id, 0) for doc_id in doc_ids])
+    rows = np.repeat(np.arange(query_matrix.shape[0]), np.diff(query_matrix.indptr))
+    contributions = (
+        query_matrix.data * pagerank[query_matrix.indices] * (1 + cosine[rows])
+    )
+    scores = np.bincount(
+        query_matrix.indices, weights=contributions, minlength=len(doc_ids)
+    )
+    for column in np.unique(query_matrix.indices).tolist():
+        doc_scores[doc_ids[column]] = float(scores[column])
 
     return doc_scores
 
 
-# 提取文档内容
-def extract_document_content(doc_id, doc_mapping):
-    """提取文档内容的前三行"""
-    row = doc_mapping[doc_mapping["line_number"] == int(doc_id)]
-    if row.empty:
-        return None, None
-
-    url = row.iloc[0]["url"]
-    body = row.iloc[0]["body"]
+def build_term_doc_matrix(term_dicts, doc_index):
+    """将若干 {文档号: TF-IDF} 字典构建为 词项 x 文档 的 CSR 稀疏矩阵"""
+    term_dicts = list(term_dicts)
+    rows, cols, data = [], [], []
+    for row, tf_idf in enumerate(term_dicts):
+        rows.extend([row] * len(tf_idf))
+        cols.extend(doc_index[doc_id] for doc_id in tf_idf)
+        data.extend(tf_idf.values())
+    return sparse.csr_matrix(
+        (np.array(data, dtype=np.float64), (rows, cols)),
+        shape=(len(term_dicts), len(doc_index)),
+    )
 
-    # 如果是文件路径，尝试读取文件内容
-    if os.path.exists(body) and any(
-        body.endswith(ext) for ext in SUPPORTED_FILE_FORMATS
-    ):
-        content = extract_file_content(body)
-    else:
-        content = body
-
-    return url, "\n".join(content.splitlines()[:3]) if content else "[No Content]"
 
+def load_stored_file_text(body):
+    """从文件正文存储读取文字（见 indexer/file_text.py），查询时不再下载或解析文件
 
-def extract_file_content(file_path):
-    """提取文件内容（简化示例，仅支持TXT文件）"""
-    try:
-        with open(file_path, "r", encoding="utf-8") as f:
-            return f.read()
-    except Exception as e:
-        return f"[Error reading file: {e}]"
+    文件尚未提取时返回 None。
+    """
+    if not isinstance(body, str) or not os.path.exists(FILE_TEXT_STORE):
+        return None
+    store = get_file_text_store(FILE_TEXT_STORE)
+    return store.lookup(body_file_path(body, FILE_BASE_DIR))
 
 
 # 保存网页快照
@@ -398,47 +407,38 @@ def get_recent_queries(log_file=QUERY_LOG_FILE, num_queries=5):
     return queries[-num_queries:]  # 返回最近不相同的查询词
 
 
+# 交互式查询共用的常驻搜索引擎，第一次查询时创建
+cli_engine = None
+
+
+def get_search_engine():
+    """PageRank、文档映射只在第一次查询时加载一次，之后的查询都复用"""
+    global cli_engine
+    if cli_engine is None:
+        from search_engine import SearchEngine  # search_engine 依赖本模块，用到时再导入
+
+        cli_engine = SearchEngine()
+    return cli_engine
+
+
 # 主查询函数
-def query_documents(
-    query_terms,
-    tf_dif_dir,
-    recent_queries,
-):
-    """执行查询"""
-    pagerank_data = load_pagerank_data(PAGERANK_FILE)
-    doc_mapping = pd.read_csv(DOC_MAPPING_FILE)
-
-    # 加载 TF-IDF 数据
-    term_to_doc_tf_idf = load_tf_idf_for_terms(query_terms, tf_dif_dir)
-    history_doc_tf_idf = load_tf_idf_for_terms(recent_queries, tf_dif_dir)
-    # print(term_to_doc_tf_idf)
-    # print(history_doc_tf_idf)
-    # 计算文档得分
-    if history_doc_tf_idf:
-        doc_scores = compute_document_scores_history(
-            term_to_doc_tf_idf, pagerank_data, history_doc_tf_idf
-        )
-    else:
-        doc_scores = compute_document_scores(term_to_doc_tf_idf, pagerank_data)
-
-    # 排序文档得分
-    sorted_doc_scores = sorted(doc_scores.items(), key=lambda x: x[1], reverse=True)
-
-    # 提取查询结果
-    results = []
-    for rank, (doc_id, score) in enumerate(sorted_doc_scores):
-        if rank < 5:  # 前5个结果计算 preview
-            url, content_preview = extract_document_content(doc_id, doc_mapping)
-            if is_file_type(url):
-                content_preview = load_file_preview(url)
-        else:  # 第5个之后 preview 设置为 None
-            row = doc_mapping[doc_mapping["line_number"] == int(doc_id)]
-            if row.empty:
-                url = None
-            url = row.iloc[0]["url"]
-            content_preview = None
-        if url:
-            results.append({"url": url, "preview": content_preview})
+def query_documents(query_terms, tf_dif_dir, recent_queries, engine=None):
+    """执行查询，tf_dif_dir 为 select_query_type 返回的索引目录
+
+    打分与排序由常驻的 SearchEngine 完成（PageRank 按 url 换算为文档号），
+    不再为每次查询重新读取 PageRank 和文档映射。
+    """
+    engine = engine or get_search_engine()
+    index_type = next(
+        index_type
+        for index_type, index_dir in engine.index_dirs.items()
+        if index_dir == tf_dif_dir
+    )
+    # 含短语或 NEAR 时只保留满足位置条件的文档，得分计入邻近度
+    results = [
+        {"url": result["url"], "preview": result["preview"]}
+        for result in engine.search(query_terms, index_type, recent_queries)
+    ]
 
     # 提取 URL 列表并保存到查询日志
     urls = [result["url"] for result in results]
@@ -624,7 +624,7 @@ if __name__ == "__main__":
                 print("程序已退出。")
                 bo = True
                 break
-            query_terms = user_input.split()
+            query_terms = split_query(user_input)  # 双引号内为短语，支持 NEAR/k
             if not query_terms:
                 print("请输入有效的查询词。")
                 continue
@@ -632,7 +632,11 @@ if __name__ == "__main__":
                 break
         if bo:
             break
-        results = query_documents(query_terms, if_dif_dir, recent_queries)
+        try:
+            results = query_documents(query_terms, if_dif_dir, recent_queries)
+        except ValueError as e:  # 短语或 NEAR 查询的语法错误
+            print(e)
+            continue
 
         if not results:
             print("未找到匹配的结果。")
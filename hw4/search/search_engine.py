@@ -0,0 +1,489 @@
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from search import (
+    TF_IDF_DIR,
+    Title_TF_IDF_DIR,
+    File_TF_IDF_DIR,
+    PAGERANK_FILE,
+    DOC_MAPPING_FILE,
+    load_tf_idf_for_terms,
+    open_postings_reader,
+    is_binary_index,
+    compute_document_scores,
+    compute_document_scores_history,
+    is_file_type,
+    load_stored_file_text,
+)
+from index_versions import current_version, acquire_lease, release_lease
+from topk import top_k_conjunctive
+from phrase_query import (
+    is_positional_query,
+    parse_query,
+    load_positional_tf_idf,
+    apply_proximity,
+)
+from boolean_query import is_boolean_query
+
+# 三种索引类型，与 select_query_type 中的 1/2/3 一一对应
+INDEX_TYPES = {
+    "full": TF_IDF_DIR,
+    "title": Title_TF_IDF_DIR,
+    "file": File_TF_IDF_DIR,
+}
+
+PREVIEW_LINES = 3  # 预览只保留正文前三行
+PREVIEW_MAX_CHARS = 500  # 正文在爬取时已合并为一行，截断以控制常驻内存
+CHUNK_CACHE_SIZE = 64  # 常驻内存的 TF-IDF 分块文件个数
+RELOAD_INTERVAL = 5  # 检查索引、PageRank 是否有新版本的间隔（秒），0 表示不检查
+
+
+class ChunkCache(OrderedDict):
+    """按最近使用淘汰的分块缓存，可直接作为 load_tf_idf_for_terms 的 loaded_files
+
+    被替换或淘汰的读取器交给 on_discard，由调用方决定何时关闭。
+    """
+
+    def __init__(self, max_size=CHUNK_CACHE_SIZE, on_discard=None):
+        super().__init__()
+        self.max_size = max_size
+        self.on_discard = on_discard
+        self.lock = threading.Lock()
+
+    def __getitem__(self, key):
+        with self.lock:
+            value = super().__getitem__(key)
+            self.move_to_end(key)
+            return value
+
+    def __setitem__(self, key, value):
+        discarded = []
+        with self.lock:
+            old_value = super().get(key)
+            if old_value is not None and old_value is not value:
+                discarded.append(old_value)
+            super().__setitem__(key, value)
+            self.move_to_end(key)
+            while len(self) > self.max_size:
+                discarded.append(self.popitem(last=False)[1])
+        if self.on_discard is not None:
+            for old_value in discarded:
+                if hasattr(old_value, "close"):
+                    self.on_discard(old_value)
+
+
+# 以文档号为键加载 PageRank 数据
+def load_pagerank_by_doc(pagerank_file, url_to_doc):
+    """pagerank_results.csv 以 url 为键，这里换算成与索引一致的文档号（字符串）
+
+    结果中的 line_number 是计算 PageRank 时的文档号，增量更新重新爬取的网页会分配新的文档号，
+    因此总是按 url 换算：url_to_doc 中重复的 url 取最新的文档号。
+    """
+    pagerank_df = pd.read_csv(pagerank_file, usecols=["url", "pagerank"])
+    pagerank_by_doc = {}
+    for url, pagerank in zip(pagerank_df["url"], pagerank_df["pagerank"]):
+        doc_id = url_to_doc.get(url)
+        if doc_id is not None:
+            pagerank_by_doc[doc_id] = float(pagerank)
+    return pagerank_by_doc
+
+
+# PageRank 字典转换为以文档号为下标的数组，供 top-k 求值使用
+def pagerank_to_array(pagerank_by_doc):
+    if not pagerank_by_doc:
+        return np.zeros(0, dtype=np.float64)
+    doc_numbers = np.array([int(doc_id) for doc_id in pagerank_by_doc], dtype=np.int64)
+    pagerank = np.zeros(doc_numbers.max() + 1, dtype=np.float64)
+    pagerank[doc_numbers] = list(pagerank_by_doc.values())
+    return pagerank
+
+
+def make_preview(text):
+    return "\n".join(text.splitlines()[:PREVIEW_LINES])[:PREVIEW_MAX_CHARS]
+
+
+# 加载文档映射（只保留查询需要的列）
+def load_doc_mapping(doc_mapping_file):
+    """返回 文档号 -> url、文档号 -> 正文预览、文档号 -> 文件路径（body 列）三个字典
+
+    文件的预览在查询时从文件正文存储读取。
+    """
+    doc_urls = {}
+    doc_previews = {}
+    doc_files = {}
+    chunks = pd.read_csv(
+        doc_mapping_file, usecols=["line_number", "url", "body"], chunksize=10000
+    )
+    for chunk in chunks:
+        for doc_number, url, body in zip(
+            chunk["line_number"], chunk["url"], chunk["body"]
+        ):
+            doc_id = str(doc_number)
+            doc_urls[doc_id] = url
+            if not isinstance(body, str) or not body:
+                continue
+            if is_file_type(url):
+                doc_files[doc_id] = body
+            else:
+                doc_previews[doc_id] = make_preview(body)
+    return doc_urls, doc_previews, doc_files
+
+
+def file_signature(path):
+    """未使用版本的文件（如文档映射）用修改时间和大小判断是否变化"""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+class IndexSnapshot:
+    """某一时刻各索引版本、PageRank 和文档映射的快照
+
+    查询开始时取得当前快照的引用，整个查询都使用同一个快照；
+    切换到新快照后，旧快照等正在进行的查询结束再关闭其读取器。
+    快照使用的每个版本都持有租约（见 index_versions.py），关闭前不会被清理。
+    """
+
+    def __init__(self, index_dirs, pagerank_file, doc_mapping_file, chunk_cache_size):
+        self.lock = threading.Lock()
+        self.next_query = 0  # 下一个查询的编号
+        self.active_queries = set()  # 进行中查询的编号
+        self.stale_readers = []  # (被替换时的查询编号, 读取器)
+        self.retired = False
+        self.leases = []
+        try:
+            self.versions = {}
+            self.index_dirs = {}
+            for index_type, tf_idf_dir in index_dirs.items():
+                self.versions[index_type], self.index_dirs[index_type] = self.lease(
+                    tf_idf_dir
+                )
+            self.versions["pagerank"], pagerank_path = self.lease(pagerank_file)
+            self.versions["doc_mapping"] = file_signature(doc_mapping_file)
+            self.load(pagerank_path, doc_mapping_file, chunk_cache_size)
+        except BaseException:
+            self.release_leases()
+            raise
+
+    def lease(self, path):
+        """返回 (版本号, 实际路径)"""
+        version, path_in_version, lease = acquire_lease(path)
+        if lease is not None:
+            self.leases.append(lease)
+        return version, path_in_version
+
+    def release_leases(self):
+        for lease in self.leases:
+            release_lease(lease)
+        self.leases = []
+
+    def load(self, pagerank_path, doc_mapping_file, chunk_cache_size):
+        self.doc_urls, self.doc_previews, self.doc_files = load_doc_mapping(
+            doc_mapping_file
+        )
+        url_to_doc = {url: doc_id for doc_id, url in self.doc_urls.items()}
+        self.pagerank = load_pagerank_by_doc(pagerank_path, url_to_doc)
+        self.pagerank_array = pagerank_to_array(self.pagerank)
+        self.chunk_caches = {
+            index_type: ChunkCache(chunk_cache_size, on_discard=self.retire_reader)
+            for index_type in self.index_dirs
+        }
+        # 二进制索引在构建快照时就打开，切换后的第一个查询不需要等待
+        for index_type in self.index_dirs:
+            if is_binary_index(self.index_dirs[index_type]):
+                self.get_reader(index_type)
+
+    def get_reader(self, index_type):
+        """二进制索引的读取器常驻在该索引的缓存中，分段索引有新的提交时重新打开
+
+        已发布的版本不会被修改；未使用版本的分段索引仍可能在原目录中提交。
+        """
+        tf_idf_dir = self.index_dirs[index_type]
+        cache = self.chunk_caches[index_type]
+        reader = cache[tf_idf_dir] if tf_idf_dir in cache else None
+        if reader is None or reader.is_stale():
+            reader = cache[tf_idf_dir] = open_postings_reader(tf_idf_dir)
+        return reader
+
+    def acquire(self):
+        """返回查询编号，查询结束时交给 release"""
+        with self.lock:
+            query = self.next_query
+            self.next_query += 1
+            self.active_queries.add(query)
+        return query
+
+    def release(self, query):
+        with self.lock:
+            self.active_queries.discard(query)
+            should_close = self.retired and not self.active_queries
+            released = self.released_readers()
+        for reader in released:
+            reader.close()
+        if should_close:
+            self.close()
+
+    def retire_reader(self, reader):
+        """被替换或淘汰的读取器可能还在使用，等此前开始的查询都结束后再关闭"""
+        with self.lock:
+            self.stale_readers.append((self.next_query, reader))
+            released = self.released_readers()
+        for reader in released:
+            reader.close()
+
+    def released_readers(self):
+        """取出已没有查询使用的旧读取器，调用方持有 self.lock
+
+        之后开始的查询只会从缓存中取得新的读取器，编号更早的查询都结束后即可关闭。
+        """
+        oldest = min(self.active_queries, default=self.next_query)
+        released = [reader for query, reader in self.stale_readers if query <= oldest]
+        self.stale_readers = [
+            (query, reader) for query, reader in self.stale_readers if query > oldest
+        ]
+        return released
+
+    def retire(self):
+        """不再接受新查询，没有进行中的查询时立即关闭"""
+        with self.lock:
+            self.retired = True
+            should_close = not self.active_queries
+        if should_close:
+            self.close()
+
+    def close(self):
+        for cache in self.chunk_caches.values():
+            for value in cache.values():
+                if hasattr(value, "close"):
+                    value.close()
+            cache.clear()
+        with self.lock:
+            stale_readers, self.stale_readers = self.stale_readers, []
+        for _, reader in stale_readers:
+            reader.close()
+        self.release_leases()
+
+
+def snapshot_versions(index_dirs, pagerank_file, doc_mapping_file):
+    """快照依赖的所有数据的版本，任何一项变化都需要切换快照"""
+    versions = {
+        index_type: current_version(tf_idf_dir)
+        for index_type, tf_idf_dir in index_dirs.items()
+    }
+    versions["pagerank"] = current_version(pagerank_file)
+    versions["doc_mapping"] = file_signature(doc_mapping_file)
+    return versions
+
+
+class SearchEngine:
+    """常驻内存的搜索引擎
+
+    启动时一次性加载 PageRank、文档映射和各索引的读取器，之后的查询都在内存中完成。
+    后台线程每隔 reload_interval 秒检查索引目录和 PageRank 的当前版本，
+    有新版本时在后台加载新快照再原子切换，查询不会被阻塞。
+    """
+
+    def __init__(
+        self,
+        index_dirs=None,
+        pagerank_file=PAGERANK_FILE,
+        doc_mapping_file=DOC_MAPPING_FILE,
+        chunk_cache_size=CHUNK_CACHE_SIZE,
+        reload_interval=RELOAD_INTERVAL,
+    ):
+        self.index_dirs = dict(index_dirs or INDEX_TYPES)
+        self.pagerank_file = pagerank_file
+        self.doc_mapping_file = doc_mapping_file
+        self.chunk_cache_size = chunk_cache_size
+        self.lock = threading.Lock()  # 保护快照的读取与切换
+        self.reload_lock = threading.Lock()  # 同一时间只构建一个新快照
+        self.snapshot = self.load_snapshot()
+        print(
+            f"搜索引擎已加载：{len(self.snapshot.doc_urls)} 个文档，"
+            f"{len(self.snapshot.pagerank)} 条 PageRank 记录"
+        )
+
+        self.stop_event = threading.Event()
+        if reload_interval:
+            self.watcher = threading.Thread(
+                target=self.watch_versions, args=(reload_interval,), daemon=True
+            )
+            self.watcher.start()
+
+    def load_snapshot(self):
+        return IndexSnapshot(
+            self.index_dirs,
+            self.pagerank_file,
+            self.doc_mapping_file,
+            self.chunk_cache_size,
+        )
+
+    def acquire_snapshot(self):
+        """返回 (快照, 查询编号)"""
+        with self.lock:
+            snapshot = self.snapshot
+            query = snapshot.acquire()
+        return snapshot, query
+
+    def reload_if_changed(self):
+        """有新版本时加载新快照并切换，返回是否发生了切换"""
+        with self.reload_lock:
+            versions = snapshot_versions(
+                self.index_dirs, self.pagerank_file, self.doc_mapping_file
+            )
+            if versions == self.snapshot.versions:
+                return False
+            new_snapshot = self.load_snapshot()  # 耗时的加载在锁外完成
+            with self.lock:
+                old_snapshot, self.snapshot = self.snapshot, new_snapshot
+            old_snapshot.retire()
+            print(f"搜索引擎已切换到新版本: {new_snapshot.versions}")
+            return True
+
+    def watch_versions(self, reload_interval):
+        while not self.stop_event.wait(reload_interval):
+            try:
+                self.reload_if_changed()
+            except Exception as e:  # 新版本加载失败时继续使用当前快照
+                print(f"[ERROR RELOADING INDEX] {e}")
+
+    def close(self):
+        self.stop_event.set()
+        with self.lock:
+            self.snapshot.retire()
+
+    def versions(self):
+        """当前使用的各数据版本"""
+        return dict(self.snapshot.versions)
+
+    def index_types(self):
+        """返回可查询的索引类型"""
+        return list(self.index_dirs)
+
+    def search(self, query_terms, index_type="full", history_terms=None, top_n=None):
+        """执行一次查询，返回按得分排序的结果列表
+
+        参数:
+            query_terms (list): 查询词，支持 * 和 ? 通配符以及 OR、NOT 运算符；
+                split_query 切分出的 "短语" 和 NEAR/k 按位置倒排索引求值，邻近度计入得分。
+            index_type (str): full / title / file 之一。
+            history_terms (list): 历史查询词，非空时启用个性化打分。
+            top_n (int): 只返回前 top_n 个结果，None 表示全部返回。
+                二进制索引、没有历史查询且不含 OR/NOT 时，使用 MaxScore 剪枝的 top-k 求值。
+
+        返回:
+            list: 每个结果包含 doc_id、url、score 和 preview（仅前 5 个有预览）。
+        """
+        if index_type not in self.index_dirs:
+            raise ValueError(f"未知的索引类型: {index_type}")
+        snapshot, query = self.acquire_snapshot()
+        try:
+            return self.search_snapshot(
+                snapshot, query_terms, index_type, history_terms, top_n
+            )
+        finally:
+            snapshot.release(query)
+
+    def search_snapshot(self, snapshot, query_terms, index_type, history_terms, top_n):
+        tf_idf_dir = snapshot.index_dirs[index_type]
+        cache = snapshot.chunk_caches[index_type]
+
+        if is_positional_query(query_terms):
+            sorted_doc_scores = self.score_positional(
+                snapshot, parse_query(query_terms), index_type, history_terms
+            )
+            if top_n is not None:
+                sorted_doc_scores = sorted_doc_scores[:top_n]
+        elif (
+            top_n is not None
+            and not history_terms
+            and not is_boolean_query(query_terms)
+            and is_binary_index(tf_idf_dir)
+        ):
+            sorted_doc_scores = self.top_k_snapshot(
+                snapshot, query_terms, index_type, top_n
+            )
+        else:
+            sorted_doc_scores = self.score_all(
+                query_terms, tf_idf_dir, cache, history_terms, snapshot.pagerank
+            )
+            if top_n is not None:
+                sorted_doc_scores = sorted_doc_scores[:top_n]
+
+        results = []
+        for rank, (doc_id, score) in enumerate(sorted_doc_scores):
+            url = snapshot.doc_urls.get(doc_id)
+            if not url:
+                continue
+            preview = None
+            if rank < 5:  # 前 5 个结果计算 preview
+                if is_file_type(url):
+                    text = load_stored_file_text(snapshot.doc_files.get(doc_id))
+                    preview = make_preview(text) if text else "[No Content]"
+                else:
+                    preview = snapshot.doc_previews.get(doc_id, "[No Content]")
+            results.append(
+                {"doc_id": doc_id, "url": url, "score": score, "preview": preview}
+            )
+        return results
+
+    def top_k(self, query_terms, index_type, k):
+        """MaxScore 剪枝的合取 top-k 查询，排序结果与 score_all 的前 k 个一致"""
+        snapshot, query = self.acquire_snapshot()
+        try:
+            return self.top_k_snapshot(snapshot, query_terms, index_type, k)
+        finally:
+            snapshot.release(query)
+
+    def top_k_snapshot(self, snapshot, query_terms, index_type, k):
+        reader = snapshot.get_reader(index_type)
+        top_docs = top_k_conjunctive(
+            reader, list(dict.fromkeys(query_terms)), snapshot.pagerank_array, k
+        )
+        return [(str(doc_id), score) for doc_id, score in top_docs]
+
+    def score_positional(self, snapshot, query, index_type, history_terms):
+        """短语和 NEAR 查询：只对满足位置条件的文档打分，得分乘以邻近度因子"""
+        tf_idf_dir = snapshot.index_dirs[index_type]
+        if not is_binary_index(tf_idf_dir):
+            raise ValueError("该索引没有位置信息，不支持短语和 NEAR 查询")
+        reader = snapshot.get_reader(index_type)
+        term_to_doc_tf_idf, proximity = load_positional_tf_idf(reader, query)
+        history_doc_tf_idf = (
+            load_tf_idf_for_terms(
+                history_terms, tf_idf_dir, snapshot.chunk_caches[index_type]
+            )
+            if history_terms
+            else {}
+        )
+        if history_doc_tf_idf:
+            doc_scores = compute_document_scores_history(
+                term_to_doc_tf_idf, snapshot.pagerank, history_doc_tf_idf
+            )
+        else:
+            doc_scores = compute_document_scores(term_to_doc_tf_idf, snapshot.pagerank)
+        doc_scores = apply_proximity(doc_scores, proximity)
+        # 得分相同时文档号小的在前，与 top-k 求值一致
+        return sorted(doc_scores.items(), key=lambda x: (-x[1], int(x[0])))
+
+    def score_all(self, query_terms, tf_idf_dir, cache, history_terms, pagerank):
+        """对所有匹配文档打分并完整排序"""
+        term_to_doc_tf_idf = load_tf_idf_for_terms(query_terms, tf_idf_dir, cache)
+        history_doc_tf_idf = (
+            load_tf_idf_for_terms(history_terms, tf_idf_dir, cache)
+            if history_terms
+            else {}
+        )
+        if history_doc_tf_idf:
+            doc_scores = compute_document_scores_history(
+                term_to_doc_tf_idf, pagerank, history_doc_tf_idf
+            )
+        else:
+            doc_scores = compute_document_scores(term_to_doc_tf_idf, pagerank)
+        return sorted(doc_scores.items(), key=lambda x: x[1], reverse=True)
@@ -0,0 +1,102 @@
+import asyncio
+import functools
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+from aiohttp import web
+
+from search_engine import SearchEngine
+from phrase_query import split_query
+
+HOST = "127.0.0.1"
+PORT = 8080
+MAX_WORKERS = 8  # 同时执行查询的线程数
+DEFAULT_TOP_N = 10
+
+json_dumps = functools.partial(json.dumps, ensure_ascii=False)
+
+
+# 查询接口：GET /search?q=南开 大学&type=full&top_n=10&history=南开;计算机
+# 短语用双引号括起，如 q="南开 大学" 校庆；两项之间的 NEAR/k 要求二者最多相隔 k 个位置
+async def handle_search(request):
+    engine = request.app["engine"]
+    query = request.query.get("q", "").strip()
+    query_terms = split_query(query)
+    if not query_terms:
+        return web.json_response(
+            {"error": "请输入有效的查询词"}, status=400, dumps=json_dumps
+        )
+
+    index_type = request.query.get("type", "full")
+    if index_type not in engine.index_types():
+        return web.json_response(
+            {"error": f"未知的索引类型: {index_type}"}, status=400, dumps=json_dumps
+        )
+
+    try:
+        top_n = int(request.query.get("top_n", DEFAULT_TOP_N))
+    except ValueError:
+        return web.json_response(
+            {"error": "top_n 必须是整数"}, status=400, dumps=json_dumps
+        )
+    # 历史查询用 ; 分隔，每条历史查询与 get_recent_queries 的返回格式一致
+    history = [h for h in request.query.get("history", "").split(";") if h.strip()]
+
+    # 查询是 CPU/磁盘密集的同步代码，放到线程池中执行，避免阻塞事件循环
+    loop = asyncio.get_running_loop()
+    try:
+        results = await loop.run_in_executor(
+            request.app["executor"],
+            functools.partial(
+                engine.search,
+                query_terms,
+                index_type=index_type,
+                history_terms=history,
+                top_n=top_n,
+            ),
+        )
+    except ValueError as e:  # 短语或 NEAR 查询的语法错误、索引没有位置信息
+        return web.json_response({"error": str(e)}, status=400, dumps=json_dumps)
+    return web.json_response(
+        {"query": query_terms, "type": index_type, "results": results},
+        dumps=json_dumps,
+    )
+
+
+# 返回可用的索引类型
+async def handle_index_types(request):
+    return web.json_response(
+        {"types": request.app["engine"].index_types()}, dumps=json_dumps
+    )
+
+
+# 健康检查，同时返回当前使用的索引、PageRank 版本
+async def handle_health(request):
+    return web.json_response(
+        {"status": "ok", "versions": request.app["engine"].versions()},
+        dumps=json_dumps,
+    )
+
+
+def create_app(engine, max_workers=MAX_WORKERS):
+    """创建 aiohttp 应用，engine 在进程内常驻"""
+    app = web.Application()
+    app["engine"] = engine
+    app["executor"] = ThreadPoolExecutor(max_workers=max_workers)
+
+    async def shutdown_executor(app):
+        app["executor"].shutdown(wait=True)
+        app["engine"].close()
+
+    app.on_cleanup.append(shutdown_executor)
+    app.router.add_get("/search", handle_search)
+    app.router.add_get("/index_types", handle_index_types)
+    app.router.add_get("/health", handle_health)
+    return app
+
+
+if __name__ == "__main__":
+    print("正在加载搜索引擎...")
+    search_engine = SearchEngine()
+    print(f"查询服务已启动：http://{HOST}:{PORT}/search?q=查询词&type=full")
+    web.run_app(create_app(search_engine), host=HOST, port=PORT)
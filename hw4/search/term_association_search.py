@@ -1,7 +1,17 @@
 import os
+import sys
 import json
 import pypinyin  # 用于生成拼音
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "../indexer"))
+from postings import is_binary_index
+from segments import open_postings_reader
+from index_versions import resolve_version
+from shards import shard_files_for_pattern
+
+# 已打开的索引读取器，每个索引目录只打开一次
+loaded_readers = {}
+
 
 # 获取词对应的拼音形式
 def generate_pinyin(term):
@@ -16,22 +26,18 @@ def generate_english_associations(term):
     return [term.lower()]
 
 
-# 获取词对应的TF-IDF文件名称
-def get_tf_idf_file_for_term(term):
-    """根据词汇获取对应TF-IDF文件名"""
-    if "\u4e00" <= term[0] <= "\u9fff":
-        return f"chinese_{term[0]}.json"
-    elif term[0].isalpha():
-        return f"alpha_{term[0].lower()}.json"
-    elif term[0].isdigit():
-        return "numeric.json"
-    else:
-        return "others.json"
+# 获取索引目录对应的读取器（单目录索引或分段索引）
+def get_postings_reader(tf_idf_dir):
+    reader = loaded_readers.get(tf_idf_dir)
+    if reader is None or reader.is_stale():
+        reader = loaded_readers[tf_idf_dir] = open_postings_reader(tf_idf_dir)
+    return reader
 
 
 # 查询联想词是否存在于TF-IDF文件中
 def search_associated_terms(term, tf_idf_dir):
     """查询拼音和英文形式的词是否存在（支持包含关系，中文优先返回）"""
+    tf_idf_dir = resolve_version(tf_idf_dir)  # 读取索引的当前版本
     associated_terms = set()
     pinyin_form = generate_pinyin(term)
     english_forms = generate_english_associations(term)
@@ -40,16 +46,27 @@ def search_associated_terms(term, tf_idf_dir):
     all_associations = [pinyin_form] + english_forms
 
     for associated_term in all_associations:
-        file_name = get_tf_idf_file_for_term(associated_term)
-        file_path = os.path.join(tf_idf_dir, file_name)
+        if not associated_term:
+            continue
+        if is_binary_index(tf_idf_dir):
+            # 在词典中只扫描与联想词首字符相同的前缀范围，不加载倒排记录
+            reader = get_postings_reader(tf_idf_dir)
+            for word in reader.keys(associated_term[0]):
+                if associated_term in word:
+                    associated_terms.add(word)
+            continue
 
-        if os.path.exists(file_path):
+        # 与二进制索引一致，只查找与联想词首字符相同的词，按分片清单读取对应的分块
+        for file_name in shard_files_for_pattern(tf_idf_dir, associated_term[0] + "*"):
+            file_path = os.path.join(tf_idf_dir, file_name)
+            if not os.path.exists(file_path):
+                continue
             try:
                 with open(file_path, "r", encoding="utf-8") as f:
                     data = json.load(f)
                 # 查找文件中所有包含查询词的词语
                 for word in data.keys():
-                    if associated_term in word:  # 判断是否包含查询词
+                    if word.startswith(associated_term[0]) and associated_term in word:
                         associated_terms.add(word)
             except Exception as e:
                 print(f"Error loading file {file_path}: {e}")
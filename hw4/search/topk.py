@@ -0,0 +1,119 @@
+import heapq
+import numpy as np
+
+# 合取查询的 top-k 求值（MaxScore 剪枝）
+#
+# 文档得分与 compute_document_scores 相同：score(d) = Σ_t tf_idf_t(d) * pagerank(d)。
+# 每个词项带一个上界 ub_t（索引中保存的最大权重），于是
+#     score(d) <= pagerank(d) * (w_lead(d) + Σ_{t != lead} ub_t)
+# 以 df 最小的词项为主导列表，按块计算上界：整块上界不超过当前第 k 名得分时直接跳过，
+# 块内上界不足的文档也不再到其它倒排记录中查找。
+# 只有主导列表完整解码；其它词项的 df 和上界直接取自词典，块内剩下的候选文档
+# 经 reader.lookup_docs 按跳表或位图查找，不解码整个倒排记录。
+
+BLOCK_SIZE = 1024
+# 浮点误差余量，保证上界不会因为求和顺序不同而略小于真实得分
+BOUND_SLACK = 1 + 1e-9
+
+
+class TopKHeap:
+    """保存得分最高的 k 个 (得分, 文档号)，得分相同时文档号小的优先"""
+
+    def __init__(self, k):
+        self.k = k
+        self.heap = []  # 小顶堆，堆顶是当前第 k 名
+
+    def threshold(self):
+        """堆满后返回第 k 名得分，否则返回 -inf"""
+        return self.heap[0][0] if len(self.heap) >= self.k else -np.inf
+
+    def push(self, doc_id, score):
+        item = (score, -doc_id)
+        if len(self.heap) < self.k:
+            heapq.heappush(self.heap, item)
+        elif item > self.heap[0]:
+            heapq.heapreplace(self.heap, item)
+
+    def results(self):
+        """按得分降序、文档号升序返回 [(文档号, 得分), ...]"""
+        return [(-neg_doc, score) for score, neg_doc in sorted(self.heap, reverse=True)]
+
+
+def top_k_conjunctive(reader, terms, pagerank, k, block_size=BLOCK_SIZE):
+    """对多个词项的倒排记录做合取查询，返回得分最高的 k 个文档
+
+    参数:
+        reader: 单目录索引或分段索引的读取器（PostingsReader / SegmentedPostingsReader）。
+        terms (list): 按查询顺序排列的查询词（可含通配符），不重复。
+        pagerank (np.ndarray): 以文档号为下标的 PageRank 数组。
+        k (int): 返回的结果个数。
+
+    返回:
+        list: [(文档号, 得分), ...]，按得分降序，得分相同时文档号升序。
+    """
+    if not terms or k <= 0:
+        return []
+    stats = [reader.term_stats(term) for term in terms]
+    if any(df == 0 for df, _ in stats):
+        return []
+
+    # df 最小的词项作为主导列表，其余词项按 df 从小到大查找，候选文档尽快减少
+    lead = min(range(len(terms)), key=lambda t: stats[t][0])
+    lead_docs, lead_weights, _ = reader.postings(terms[lead])
+    if len(lead_docs) == 0:
+        return []
+    others = sorted(
+        (t for t in range(len(terms)) if t != lead), key=lambda t: stats[t][0]
+    )
+    rest_bound = sum(float(stats[t][1]) for t in others)
+
+    lead_pagerank = pagerank_of(pagerank, lead_docs)
+    bounds = (
+        lead_pagerank * (lead_weights.astype(np.float64) + rest_bound) * BOUND_SLACK
+    )
+
+    block_starts = np.arange(0, len(lead_docs), block_size)
+    block_max = np.maximum.reduceat(bounds, block_starts)
+    top_k = TopKHeap(k)
+
+    # 按块上界从大到小处理，阈值尽快升高
+    for block in np.argsort(-block_max, kind="stable"):
+        threshold = top_k.threshold()
+        if block_max[block] < threshold:
+            break  # 剩余的块上界更小，提前结束
+        start = block_starts[block]
+        stop = start + block_size
+        keep = np.flatnonzero(bounds[start:stop] >= threshold) + start
+        if len(keep) == 0:
+            continue
+
+        docs = lead_docs[keep]
+        # 每个词项的权重，按查询顺序累加以与 compute_document_scores 的求和顺序一致
+        weights = {lead: lead_weights[keep]}
+        for t in others:
+            found, t_weights = reader.lookup_docs(terms[t], docs)
+            docs = docs[found]
+            keep = keep[found]
+            weights = {term: w[found] for term, w in weights.items()}
+            weights[t] = t_weights
+            if len(docs) == 0:
+                break
+        if len(docs) == 0:
+            continue
+
+        doc_pagerank = lead_pagerank[keep]
+        scores = np.zeros(len(docs), dtype=np.float64)
+        for t in range(len(terms)):
+            scores += weights[t].astype(np.float64) * doc_pagerank
+        for doc_id, score in zip(docs.tolist(), scores.tolist()):
+            top_k.push(doc_id, score)
+
+    return top_k.results()
+
+
+def pagerank_of(pagerank, doc_ids):
+    """取文档的 PageRank，超出数组范围的文档视为 0"""
+    values = np.zeros(len(doc_ids), dtype=np.float64)
+    in_range = doc_ids < len(pagerank)
+    values[in_range] = pagerank[doc_ids[in_range]]
+    return values